@@ -0,0 +1,211 @@
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+from torch.nn import functional as F
+
+from AR.models.t2s_model import t2s_linear
+
+
+def _decode_step(
+    x: torch.Tensor,
+    position: torch.Tensor,
+    key_mask: torch.Tensor,
+    k_caches: List[torch.Tensor],
+    v_caches: List[torch.Tensor],
+    blocks: list,
+    predict_layer: torch.nn.Module,
+) -> torch.Tensor:
+    """
+    decode_next_token_static of all T2S blocks plus ar_predict_layer, with static shapes:
+    the new k/v are written at `position` (a tensor) and every step attends over the first
+    `span` columns of the caches, columns not written yet being masked by `key_mask`.
+
+    Args:
+        x: (bsz, 1, hidden_dim) input of the step.
+        position: LongTensor (1,), the cache column of the token being decoded, < span.
+        key_mask: (bsz, span) bool, True for padding and not yet written columns.
+        k_caches, v_caches: (bsz, span, hidden_dim) views of the first span columns of the caches.
+    Returns:
+        logits: (bsz, vocab_size)
+    """
+    key_mask.index_fill_(1, position, False)
+    attn_mask = (~key_mask)[:, None, None, :]
+    bsz = x.shape[0]
+    for block, k_cache, v_cache in zip(blocks, k_caches, v_caches):
+        q, k, v = t2s_linear(x, block.qkv_w, block.qkv_b).chunk(3, dim=-1)
+        k_cache.index_copy_(1, position, k)
+        v_cache.index_copy_(1, position, v)
+
+        q = q.view(bsz, 1, block.num_heads, -1).transpose(1, 2)
+        k = k_cache.view(bsz, k_cache.shape[1], block.num_heads, -1).transpose(1, 2)
+        v = v_cache.view(bsz, v_cache.shape[1], block.num_heads, -1).transpose(1, 2)
+        attn = F.scaled_dot_product_attention(q, k, v, attn_mask)
+        attn = attn.transpose(1, 2).reshape(bsz, 1, -1)
+
+        x = x + t2s_linear(attn, block.out_w, block.out_b)
+        x = F.layer_norm(x, [block.hidden_dim], block.norm_w1, block.norm_b1, block.norm_eps1)
+        x = x + t2s_linear(F.relu(t2s_linear(x, block.mlp.w1, block.mlp.b1)), block.mlp.w2, block.mlp.b2)
+        x = F.layer_norm(x, [block.hidden_dim], block.norm_w2, block.norm_b2, block.norm_eps2)
+    return predict_layer(x[:, -1])
+
+
+class T2SDecodeGraph:
+    """
+    The single-token decode step of a Text2SemanticDecoder captured once per batch bucket
+    and replayed for every token, a drop-in replacement of T2SKVCache for
+    infer_panel_batch_infer_static.
+
+    The K/V buffers hold `capacity` columns for `max(batch_sizes)` rows. A batch of n rows
+    runs in the smallest bucket b >= n, on the first b rows of the buffers, so buckets share
+    memory and compact() can move a batch to a smaller bucket without copying the caches
+    to new buffers. Likewise a step only attends over a span of the columns, the smallest
+    power of two (at least MIN_SPAN, at most capacity) holding the sequence, so short
+    sentences do not pay for the whole capacity. Nothing in a step changes shape between
+    tokens of one span (see _decode_step).
+
+    On CUDA the step of every (bucket, span) is captured as a torch.cuda.CUDAGraph. On
+    other devices it runs eagerly unless compile_cpu is set, it is then compiled by
+    torch.compile with static shapes. On CPU neither beats infer_panel_batch_infer_static on
+    a T2SKVCache (tools/benchmark/t2s_decode_graph.py), TTS only uses the graph on CUDA.
+    Capture happens at the first step of a (bucket, span), with the inputs of that step,
+    so it never writes anything a replay would not. If capture fails the step runs eagerly
+    from then on.
+
+    The buffers serve one batch at a time: allocate() returns None when the graph is busy,
+    the batch is too large or the sequence does not fit into `capacity`, and the caller
+    falls back to a T2SKVCache.
+
+    Args:
+        model: Text2SemanticDecoder, its dtype and device must not change afterwards.
+        batch_sizes: list of int, the buckets.
+        capacity: int, maximum number of cache columns (prompt + generated tokens).
+        compile_cpu: bool, compile the step with torch.compile on devices other than CUDA.
+    """
+
+    MIN_SPAN = 256
+
+    def __init__(self, model, batch_sizes: Sequence[int] = (1, 4, 8), capacity: int = 2048, compile_cpu: bool = False):
+        self.model = model
+        self.batch_sizes = sorted(set(max(int(b), 1) for b in batch_sizes))
+        self.capacity = int(capacity)
+        self.compile_cpu = compile_cpu
+        self.blocks = list(model.t2s_transformer.blocks)
+        self.k_buffers: List[torch.Tensor] = []
+        self.v_buffers: List[torch.Tensor] = []
+        self.mask_buffer: Optional[torch.Tensor] = None
+        self.x_buffer: Optional[torch.Tensor] = None
+        self.position: Optional[torch.Tensor] = None
+        self.steps: Dict[Tuple[int, int], Callable[[], torch.Tensor]] = {}
+        self.eager = False
+        self._lock = threading.Lock()
+        # state of the batch being decoded, T2SKVCache interface
+        self.bsz = 0
+        self.bucket = 0
+        self.length = 0
+        self.k_cache: List[torch.Tensor] = []
+        self.v_cache: List[torch.Tensor] = []
+
+    def allocate(self, bsz: int, length: int, dtype: torch.dtype, device: torch.device) -> Optional["T2SDecodeGraph"]:
+        """Reserve the buffers for a batch of `bsz` rows and at most `length` columns, None if it does not fit."""
+        if bsz > self.batch_sizes[-1] or length > self.capacity:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None
+        if self.x_buffer is None or self.x_buffer.dtype != dtype or self.x_buffer.device != torch.device(device):
+            self._init_buffers(dtype, device)
+        self.mask_buffer.fill_(True)
+        self.length = 0
+        self._resize(bsz)
+        return self
+
+    def release(self) -> None:
+        self.k_cache = []
+        self.v_cache = []
+        self._lock.release()
+
+    def _init_buffers(self, dtype: torch.dtype, device: torch.device) -> None:
+        rows = self.batch_sizes[-1]
+        hidden_dim = self.model.model_dim
+        self.k_buffers = [torch.zeros(rows, self.capacity, hidden_dim, dtype=dtype, device=device) for _ in self.blocks]
+        self.v_buffers = [torch.zeros(rows, self.capacity, hidden_dim, dtype=dtype, device=device) for _ in self.blocks]
+        self.mask_buffer = torch.ones(rows, self.capacity, dtype=torch.bool, device=device)
+        self.x_buffer = torch.zeros(rows, 1, hidden_dim, dtype=dtype, device=device)
+        self.position = torch.zeros(1, dtype=torch.long, device=device)
+        self.steps = {}
+
+    def _resize(self, bsz: int) -> None:
+        self.bsz = bsz
+        self.bucket = next(b for b in self.batch_sizes if b >= bsz)
+        self.k_cache = [k[:bsz] for k in self.k_buffers]
+        self.v_cache = [v[:bsz] for v in self.v_buffers]
+
+    def set_prompt_mask(self, key_mask: torch.Tensor):
+        self.length = key_mask.shape[1]
+        self.mask_buffer[: self.bsz, : self.length] = key_mask
+
+    def compact(self, index: torch.Tensor):
+        n = index.shape[0]
+        for k in self.k_buffers + self.v_buffers:
+            k[:n] = torch.index_select(k[: self.bsz], dim=0, index=index)
+        self.mask_buffer[:n] = torch.index_select(self.mask_buffer[: self.bsz], dim=0, index=index)
+        self._resize(n)
+
+    def decode(self, xy_pos: torch.Tensor) -> torch.Tensor:
+        """One decode step of the batch, xy_pos (bsz, 1, hidden_dim) -> logits (bsz, vocab_size)."""
+        self.x_buffer[: self.bsz].copy_(xy_pos)
+        self.position.fill_(self.length)
+        key = (self.bucket, self._span(self.length + 1))
+        step = self.steps.get(key)
+        if step is None:
+            step, logits = self._capture(*key)
+            self.steps[key] = step
+        else:
+            logits = step()
+        self.length += 1
+        return logits[: self.bsz]
+
+    def _span(self, length: int) -> int:
+        """Number of cache columns a step attends over for a sequence of `length` columns."""
+        span = min(self.MIN_SPAN, self.capacity)
+        while span < length:
+            span *= 2
+        return min(span, self.capacity)
+
+    def _eager_step(self, bucket: int, span: int) -> Callable[[], torch.Tensor]:
+        k_caches = [k[:bucket, :span] for k in self.k_buffers]
+        v_caches = [v[:bucket, :span] for v in self.v_buffers]
+        x, key_mask = self.x_buffer[:bucket], self.mask_buffer[:bucket, :span]
+        blocks, predict_layer, position = self.blocks, self.model.ar_predict_layer, self.position
+        return lambda: _decode_step(x, position, key_mask, k_caches, v_caches, blocks, predict_layer)
+
+    def _capture(self, bucket: int, span: int):
+        """Build the step of a (bucket, span) and run it once, returns (step, logits of this step)."""
+        eager_step = self._eager_step(bucket, span)
+        if self.eager or not (self.x_buffer.is_cuda or self.compile_cpu):
+            return eager_step, eager_step()
+        try:
+            if self.x_buffer.is_cuda:
+                # writes of the warmup runs are the ones of this step, running them again changes nothing
+                stream = torch.cuda.Stream()
+                stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(stream):
+                    for _ in range(2):
+                        eager_step()
+                torch.cuda.current_stream().wait_stream(stream)
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    logits = eager_step()
+
+                def step():
+                    graph.replay()
+                    return logits
+
+                graph.replay()
+                return step, logits
+            step = torch.compile(eager_step, dynamic=False)
+            return step, step()
+        except Exception as e:
+            print(f"Warning: T2S decode graph capture failed, decoding eagerly: {e}")
+            self.eager = True
+            return eager_step, eager_step()
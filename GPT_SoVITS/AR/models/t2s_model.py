@@ -1,6 +1,8 @@
 # modified from https://github.com/yangdongchao/SoundStorm/blob/master/soundstorm/s1/AR/models/t2s_model.py
 # reference: https://github.com/lifeiteng/vall-e
 import math
+import threading
+from collections import OrderedDict
 from typing import List, Optional
 
 import torch
@@ -10,12 +12,14 @@ from torchmetrics.classification import MulticlassAccuracy
 from tqdm import tqdm
 
 from AR.models.utils import (
+    detect_loops,
     dpo_loss,
     get_batch_logps,
     make_pad_mask,
     make_pad_mask_left,
     make_reject_y,
     sample,
+    T2SSampler,
     topk_sampling,
 )
 from AR.modules.embedding import SinePositionalEmbedding, TokenEmbedding
@@ -70,6 +74,14 @@ def scaled_dot_product_attention(
     return attn_weight @ value
 
 
+@torch.jit.ignore
+def t2s_linear(x: torch.Tensor, w: torch.Tensor, b: Optional[torch.Tensor]) -> torch.Tensor:
+    """F.linear, or w(x) when w is an int8 dynamic quantized linear (see TTS_infer_pack.cpu_precision)"""
+    if isinstance(w, torch.Tensor):
+        return F.linear(x, w, b)
+    return w(x)
+
+
 @torch.jit.script
 class T2SMLP:
     def __init__(self, w1, b1, w2, b2):
@@ -79,8 +91,8 @@ class T2SMLP:
         self.b2 = b2
 
     def forward(self, x):
-        x = F.relu(F.linear(x, self.w1, self.b1))
-        x = F.linear(x, self.w2, self.b2)
+        x = F.relu(t2s_linear(x, self.w1, self.b1))
+        x = t2s_linear(x, self.w2, self.b2)
         return x
 
 
@@ -138,8 +150,12 @@ class T2SBlock:
         attn_mask: torch.Tensor,
         padding_mask: Optional[torch.Tensor] = None,
         torch_sdpa: bool = True,
+        qkv: Optional[torch.Tensor] = None,
     ):
-        q, k, v = F.linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        # qkv: precomputed input projection of x (see T2SPromptPrefix)
+        if qkv is None:
+            qkv = t2s_linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b)
+        q, k, v = qkv.chunk(3, dim=-1)
 
         batch_size = q.shape[0]
         q_len = q.shape[1]
@@ -159,7 +175,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b)
+        attn = t2s_linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b)
 
         x = x + attn
         x = F.layer_norm(x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1)
@@ -181,11 +197,42 @@ class T2SBlock:
         attn_mask: torch.Tensor = None,
         torch_sdpa: bool = True,
     ):
-        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = t2s_linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
 
         k_cache = torch.cat([k_cache, k], dim=1)
         v_cache = torch.cat([v_cache, v], dim=1)
 
+        x = self.decode_attention(x, q, k_cache, v_cache, attn_mask, torch_sdpa)
+        return x, k_cache, v_cache
+
+    def decode_next_token_static(
+        self,
+        x: torch.Tensor,
+        k_cache: torch.Tensor,
+        v_cache: torch.Tensor,
+        cache_len: int,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
+        """decode_next_token on preallocated caches: k/v of the new token are written at cache_len in place."""
+        q, k, v = t2s_linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+
+        k_cache.narrow(1, cache_len, 1).copy_(k)
+        v_cache.narrow(1, cache_len, 1).copy_(v)
+
+        return self.decode_attention(
+            x, q, k_cache.narrow(1, 0, cache_len + 1), v_cache.narrow(1, 0, cache_len + 1), attn_mask, torch_sdpa
+        )
+
+    def decode_attention(
+        self,
+        x: torch.Tensor,
+        q: torch.Tensor,
+        k_cache: torch.Tensor,
+        v_cache: torch.Tensor,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
         batch_size = q.shape[0]
         q_len = q.shape[1]
         kv_len = k_cache.shape[1]
@@ -200,7 +247,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(attn, self.out_w, self.out_b)
+        attn = t2s_linear(attn, self.out_w, self.out_b)
 
         x = x + attn
         x = F.layer_norm(
@@ -218,7 +265,7 @@ class T2SBlock:
             self.norm_b2,
             self.norm_eps2,
         )
-        return x, k_cache, v_cache
+        return x
 
 
 @torch.jit.script
@@ -233,11 +280,14 @@ class T2STransformer:
         attn_mask: torch.Tensor,
         padding_mask: Optional[torch.Tensor] = None,
         torch_sdpa: bool = True,
+        qkv: Optional[torch.Tensor] = None,
     ):
         k_cache: List[torch.Tensor] = []
         v_cache: List[torch.Tensor] = []
         for i in range(self.num_blocks):
-            x, k_cache_, v_cache_ = self.blocks[i].process_prompt(x, attn_mask, padding_mask, torch_sdpa)
+            x, k_cache_, v_cache_ = self.blocks[i].process_prompt(
+                x, attn_mask, padding_mask, torch_sdpa, qkv if i == 0 else None
+            )
             k_cache.append(k_cache_)
             v_cache.append(v_cache_)
         return x, k_cache, v_cache
@@ -256,6 +306,99 @@ class T2STransformer:
             )
         return x, k_cache, v_cache
 
+    def process_prompt_static(
+        self,
+        x: torch.Tensor,
+        attn_mask: torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        padding_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+        qkv: Optional[torch.Tensor] = None,
+    ):
+        """process_prompt writing the prompt k/v into the head of preallocated caches."""
+        for i in range(self.num_blocks):
+            x, k_cache_, v_cache_ = self.blocks[i].process_prompt(
+                x, attn_mask, padding_mask, torch_sdpa, qkv if i == 0 else None
+            )
+            k_cache[i].narrow(1, 0, k_cache_.shape[1]).copy_(k_cache_)
+            v_cache[i].narrow(1, 0, v_cache_.shape[1]).copy_(v_cache_)
+        return x
+
+    def decode_next_token_static(
+        self,
+        x: torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        cache_len: int,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_static(x, k_cache[i], v_cache[i], cache_len, attn_mask, torch_sdpa)
+        return x
+
+
+class T2SKVCache:
+    """
+    Preallocated K/V caches of all layers for infer_panel_batch_infer_static.
+
+    Every layer gets a (bsz, capacity, hidden_dim) buffer that process_prompt_static and
+    decode_next_token_static write in place, so decoding neither concatenates nor
+    re-pads per token. All rows share the write pointer `length` (prompts are left
+    padded to the same length), `key_mask` marks padded and not yet written columns.
+    Rows are slots: a finished row keeps its slot until compact() drops finished rows
+    with one index_select over the caches.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        bsz: int,
+        capacity: int,
+        hidden_dim: int,
+        dtype: torch.dtype,
+        device: torch.device,
+    ):
+        self.capacity = capacity
+        self.length = 0
+        self.k_cache = [torch.zeros(bsz, capacity, hidden_dim, dtype=dtype, device=device) for _ in range(num_layers)]
+        self.v_cache = [torch.zeros(bsz, capacity, hidden_dim, dtype=dtype, device=device) for _ in range(num_layers)]
+        self.key_mask = torch.ones(bsz, capacity, dtype=torch.bool, device=device)
+
+    def set_prompt_mask(self, key_mask: torch.Tensor):
+        self.length = key_mask.shape[1]
+        self.key_mask[:, : self.length] = key_mask
+
+    def next_mask(self) -> torch.Tensor:
+        """Unmask the column of the token being decoded, return the attention mask of the step."""
+        self.key_mask[:, self.length] = False
+        return self.key_mask[:, None, None, : self.length + 1]
+
+    def compact(self, index: torch.Tensor):
+        self.k_cache = [torch.index_select(k, dim=0, index=index) for k in self.k_cache]
+        self.v_cache = [torch.index_select(v, dim=0, index=index) for v in self.v_cache]
+        self.key_mask = torch.index_select(self.key_mask, dim=0, index=index)
+
+
+class T2SPromptPrefix:
+    """
+    The part of the first decoding step that only depends on the reference prompt.
+
+    Prompt phones attend bidirectionally to the phones of the sentence and the prompt
+    semantic tokens attend to all phones, so the K/V of every layer after the first depend
+    on the sentence and cannot be shared between sentences. What every sentence of a prompt
+    shares is everything before the first attention: the embeddings of the prompt phones,
+    the embeddings of the prompt semantic tokens and their layer-0 q/k/v projection.
+    Batches only read these tensors (expand + concat), they are never written in place.
+    """
+
+    def __init__(self, x_len: int, x_emb: torch.Tensor, y_pos: torch.Tensor, y_qkv: torch.Tensor):
+        self.x_len = x_len  # number of prompt phones at the head of every x
+        self.x_emb = x_emb  # (x_len, embedding_dim)
+        self.y_pos = y_pos  # (1, y_len, embedding_dim)
+        self.y_qkv = y_qkv  # (1, y_len, 3 * embedding_dim)
+
 
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
@@ -352,6 +495,15 @@ class Text2SemanticDecoder(nn.Module):
 
         self.t2s_transformer = T2STransformer(self.num_layers, blocks)
 
+        # LRU of T2SPromptPrefix, see get_prompt_prefix()
+        self.prompt_prefix_cache: "OrderedDict[str, T2SPromptPrefix]" = OrderedDict()
+        self.prompt_prefix_cache_size: int = 8
+        self._prompt_prefix_lock = threading.Lock()
+        # optional T2SDecodeGraph used by infer_panel_batch_infer_static
+        self.decode_graph = None
+        # fp32, bf16 or int8, set by TTS_infer_pack.cpu_precision.set_t2s_precision on CPU
+        self.cpu_precision: str = "fp32"
+
     def make_input_data(self, x, x_lens, y, y_lens, bert_feature):
         x = self.ar_text_embedding(x)
         x = x + self.bert_proj(bert_feature.transpose(1, 2))
@@ -580,6 +732,32 @@ class Text2SemanticDecoder(nn.Module):
         # 错位
         return targets[:, :-1], targets
 
+    def row_caps(self, bsz: int, early_stop_num: int, max_new_tokens: Optional[List[int]] = None) -> List[int]:
+        """
+        The step at which every row is retired if it has not reached EOS yet: early_stop_num,
+        the row's budget in max_new_tokens or the 1500 step limit, whichever comes first.
+        A row retired at step idx keeps its first idx tokens.
+        """
+        cap = 1499 if early_stop_num == -1 else min(early_stop_num, 1499)
+        if max_new_tokens is None:
+            return [cap] * bsz
+        return [min(cap, max(int(n), 1)) for n in max_new_tokens]
+
+    def mark_loops(self, finish_idx: torch.Tensor, y: torch.Tensor, idx: int, loop_window: int) -> torch.Tensor:
+        """
+        Mark rows stuck in a loop as finished at step idx (see detect_loops), without a host sync.
+        Such a row keeps the tokens generated before its repeating tail of loop_window tokens.
+
+        Args:
+            finish_idx: LongTensor (bsz,), the step at which every row finished, -1 while decoding.
+            y: LongTensor (bsz, n), the rows, ending with the token of step idx.
+        """
+        max_period = max(loop_window // 4, 1)
+        if loop_window <= 0 or idx + 1 < loop_window + max_period:
+            return finish_idx
+        period = detect_loops(y[:, y.shape[1] - loop_window - max_period :], loop_window, max_period)
+        return torch.where(finish_idx.lt(0).logical_and(period > 0), idx - loop_window + 1, finish_idx)
+
     def infer_panel_batch_infer(
         self,
         x: List[torch.LongTensor],  #####全部文本token
@@ -608,36 +786,425 @@ class Text2SemanticDecoder(nn.Module):
             )
 
         max_len = kwargs.get("max_len", x_lens.max())
+        prompt_prefix = kwargs.get("prompt_prefix", None)
+        xy_pos, attn_mask = self.make_batch_prompt(x, x_lens, prompts, bert_feature, max_len, prompt_prefix)
+        qkv = self.make_prompt_qkv(xy_pos, prompt_prefix)
+        bsz = xy_pos.shape[0]
+
+        # AR Decoder
+        y = prompts
+        y_len = y.shape[1]
+        prefix_len = y.shape[1]
+        stop = False
+
+        k_cache = None
+        v_cache = None
+        ref_free = False
+        sampler = T2SSampler(prompts, self.vocab_size, top_k, top_p, temperature, repetition_penalty)
+        # EOS 只在设备上记录（生成到 EOS 的步数，-1 为未结束），每 sync_every 步才同步一次并移除已结束的行
+        sync_every = max(int(kwargs.get("eos_sync_every", 1)), 1)
+        finish_idx = torch.full((bsz,), -1, dtype=torch.long, device=y.device)
+        row_caps = self.row_caps(bsz, early_stop_num, kwargs.get("max_new_tokens", None))
+        loop_window = int(kwargs.get("loop_window", 0))
+
+        ###### decode #####
+        y_list = [None] * y.shape[0]
+        batch_idx_map = list(range(y.shape[0]))
+        idx_list = [None] * y.shape[0]
+        for idx in tqdm(range(1500)):
+            if idx == 0:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None, True, qkv)
+            else:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
+            logits = self.ar_predict_layer(xy_dec[:, -1])
+
+            if idx == 0:
+                attn_mask = F.pad(attn_mask[:, :, -1].unsqueeze(-2), (0, 1), value=False)
+                logits = logits[:, :-1]
+            else:
+                attn_mask = F.pad(attn_mask, (0, 1), value=False)
+
+            samples, tokens = sampler(logits)
+            y = torch.concat([y, samples], dim=1)
+
+            ####### 移除batch中已经生成完毕的序列,进一步优化计算量
+            finished = (samples[:, 0] == self.EOS).logical_or(tokens == self.EOS)  ###如果生成到EOS，则停止
+            finish_idx = torch.where(finished.logical_and(finish_idx < 0), idx, finish_idx)
+            capped = any(row_caps[batch_index] <= idx for batch_index in batch_idx_map)
+            if capped or (idx + 1) % sync_every == 0:
+                finish_idx = self.mark_loops(finish_idx, y, idx, loop_window)
+                reserved = []
+                for i, finish in enumerate(finish_idx.tolist()):
+                    batch_index = batch_idx_map[i]
+                    if finish >= 0:
+                        # 与逐步检查时一致：去掉 EOS 那一步的采样
+                        idx_list[batch_index] = finish
+                        y_list[batch_index] = y[i, : prefix_len + finish]
+                    elif row_caps[batch_index] <= idx:
+                        # 达到该句的长度上限
+                        idx_list[batch_index] = idx
+                        y_list[batch_index] = y[i, :-1]
+                    else:
+                        reserved.append(i)
+
+                # 只保留batch中未生成完毕的序列
+                if len(reserved) < len(batch_idx_map):
+                    batch_idx_map = [batch_idx_map[i] for i in reserved]
+                    reserved_idx_of_batch_for_y = torch.tensor(reserved, dtype=torch.long, device=y.device)
+                    y = torch.index_select(y, dim=0, index=reserved_idx_of_batch_for_y)
+                    attn_mask = torch.index_select(attn_mask, dim=0, index=reserved_idx_of_batch_for_y)
+                    finish_idx = torch.index_select(finish_idx, dim=0, index=reserved_idx_of_batch_for_y)
+                    sampler.compact(reserved_idx_of_batch_for_y)
+                    if k_cache is not None:
+                        for i in range(len(k_cache)):
+                            k_cache[i] = torch.index_select(k_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
+                            v_cache[i] = torch.index_select(v_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
+
+            if None not in idx_list:
+                stop = True
+
+            if stop:
+                if y.shape[1] == 0:
+                    y = torch.concat([y, torch.zeros_like(samples)], dim=1)
+                    print("bad zero prediction")
+                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                break
+
+            ####################### update next step ###################################
+            y_emb = self.ar_audio_embedding(y[:, -1:])
+            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
+                :, y_len + idx
+            ].to(dtype=y_emb.dtype, device=y_emb.device)
+
+        if None in idx_list:
+            for i in range(bsz):
+                if idx_list[i] is None:
+                    idx_list[i] = 1500 - 1  ###如果没有生成到EOS，就用最大长度代替
+
+        if ref_free:
+            return y_list, [0] * bsz
+        # print(idx_list)
+        return y_list, idx_list
+
+    def infer_panel_batch_infer_static(
+        self,
+        x: List[torch.LongTensor],  #####全部文本token
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,  ####参考音频token
+        bert_feature: List[torch.LongTensor],
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        """
+        infer_panel_batch_infer on a preallocated T2SKVCache: k/v, the attention mask and y are
+        written in place, and finished rows are only dropped from the batch (one index_select)
+        once at most half of the rows are still decoding.
+
+        With a decode_graph (T2SDecodeGraph) the batch decodes on its buffers with the captured
+        step whenever it fits, otherwise on a T2SKVCache of its own.
+        """
+        if prompts is None:
+            print("Warning: Prompt free is not supported batch_infer! switch to naive_infer")
+            return self.infer_panel_naive_batched(
+                x,
+                x_lens,
+                prompts,
+                bert_feature,
+                top_k=top_k,
+                top_p=top_p,
+                early_stop_num=early_stop_num,
+                temperature=temperature,
+                **kwargs,
+            )
+
+        max_len = kwargs.get("max_len", x_lens.max())
+        prompt_prefix = kwargs.get("prompt_prefix", None)
+        xy_pos, attn_mask = self.make_batch_prompt(x, x_lens, prompts, bert_feature, max_len, prompt_prefix)
+        qkv = self.make_prompt_qkv(xy_pos, prompt_prefix)
+        bsz, src_len = xy_pos.shape[0], xy_pos.shape[1]
+        max_steps = 1500 if early_stop_num == -1 else min(1500, early_stop_num + 1)
+        graph = None
+        if self.decode_graph is not None:
+            graph = self.decode_graph.allocate(bsz, src_len + max_steps, xy_pos.dtype, xy_pos.device)
+        if graph is not None:
+            try:
+                return self._decode_static(
+                    xy_pos,
+                    attn_mask,
+                    qkv,
+                    prompts,
+                    graph,
+                    max_steps,
+                    top_k,
+                    top_p,
+                    early_stop_num,
+                    temperature,
+                    repetition_penalty,
+                    **kwargs,
+                )
+            finally:
+                graph.release()
+        cache = T2SKVCache(self.num_layers, bsz, src_len + max_steps, self.model_dim, xy_pos.dtype, xy_pos.device)
+        return self._decode_static(
+            xy_pos,
+            attn_mask,
+            qkv,
+            prompts,
+            cache,
+            max_steps,
+            top_k,
+            top_p,
+            early_stop_num,
+            temperature,
+            repetition_penalty,
+            **kwargs,
+        )
+
+    def _decode_static(
+        self,
+        xy_pos: torch.Tensor,
+        attn_mask: torch.Tensor,
+        qkv: Optional[torch.Tensor],
+        prompts: torch.LongTensor,
+        cache,
+        max_steps: int,
+        top_k: int,
+        top_p: int,
+        early_stop_num: int,
+        temperature: float,
+        repetition_penalty: float,
+        **kwargs,
+    ):
+        """Decode loop of infer_panel_batch_infer_static on a T2SKVCache or an allocated T2SDecodeGraph."""
+        bsz = xy_pos.shape[0]
+        y_len = prompts.shape[1]
+        prefix_len = prompts.shape[1]
+        use_graph = not isinstance(cache, T2SKVCache)
+        y = torch.zeros(bsz, prefix_len + max_steps, dtype=prompts.dtype, device=prompts.device)
+        y[:, :prefix_len] = prompts
+        y_cur = prefix_len
+
+        y_list = [None] * bsz
+        idx_list = [None] * bsz
+        batch_idx_map = list(range(bsz))
+        sampler = T2SSampler(prompts, self.vocab_size, top_k, top_p, temperature, repetition_penalty)
+        sync_every = max(int(kwargs.get("eos_sync_every", 1)), 1)
+        finish_idx = torch.full((bsz,), -1, dtype=torch.long, device=xy_pos.device)
+        row_caps = self.row_caps(bsz, early_stop_num, kwargs.get("max_new_tokens", None))
+        loop_window = int(kwargs.get("loop_window", 0))
+        num_alive = bsz
+        for idx in tqdm(range(1500)):
+            if idx == 0:
+                xy_dec = self.t2s_transformer.process_prompt_static(
+                    xy_pos, attn_mask, cache.k_cache, cache.v_cache, None, True, qkv
+                )
+                cache.set_prompt_mask(attn_mask[:, 0, -1])
+                logits = self.ar_predict_layer(xy_dec[:, -1])
+            elif use_graph:
+                logits = cache.decode(xy_pos)
+            else:
+                xy_dec = self.t2s_transformer.decode_next_token_static(
+                    xy_pos, cache.k_cache, cache.v_cache, cache.length, cache.next_mask()
+                )
+                cache.length += 1
+                logits = self.ar_predict_layer(xy_dec[:, -1])
+
+            if idx == 0:
+                logits = logits[:, :-1]
+
+            samples, tokens = sampler(logits)
+            y[:, y_cur] = samples[:, 0]
+            y_cur += 1
+
+            ####### 已生成完毕的行只在设备上标记，每 sync_every 步同步一次，不立即移出batch
+            finished = (samples[:, 0] == self.EOS).logical_or(tokens == self.EOS)
+            finish_idx = torch.where(finished.logical_and(finish_idx < 0), idx, finish_idx)
+            capped = any(
+                idx_list[batch_index] is None and row_caps[batch_index] <= idx for batch_index in batch_idx_map
+            )
+            if capped or (idx + 1) % sync_every == 0:
+                finish_idx = self.mark_loops(finish_idx, y[:, :y_cur], idx, loop_window)
+                alive = []
+                for i, finish in enumerate(finish_idx.tolist()):
+                    batch_index = batch_idx_map[i]
+                    if idx_list[batch_index] is not None:
+                        continue
+                    if finish >= 0:
+                        idx_list[batch_index] = finish
+                        y_list[batch_index] = y[i, : prefix_len + finish].clone()
+                    elif row_caps[batch_index] <= idx:
+                        # 达到该句的长度上限
+                        idx_list[batch_index] = idx
+                        y_list[batch_index] = y[i, : y_cur - 1].clone()
+                    else:
+                        alive.append(i)
+                num_alive = len(alive)
+                # 存活行不足一半时才压缩batch
+                if 0 < num_alive <= y.shape[0] // 2:
+                    reserved_idx_of_batch_for_y = torch.tensor(alive, dtype=torch.long, device=y.device)
+                    batch_idx_map = [batch_idx_map[i] for i in alive]
+                    y = torch.index_select(y, dim=0, index=reserved_idx_of_batch_for_y)
+                    finish_idx = torch.index_select(finish_idx, dim=0, index=reserved_idx_of_batch_for_y)
+                    sampler.compact(reserved_idx_of_batch_for_y)
+                    cache.compact(reserved_idx_of_batch_for_y)
+
+            if num_alive == 0:
+                print(f"T2S Decoding EOS [{prefix_len} -> {y_cur}]")
+                break
+
+            ####################### update next step ###################################
+            y_emb = self.ar_audio_embedding(y[:, y_cur - 1 : y_cur])
+            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
+                :, y_len + idx
+            ].to(dtype=y_emb.dtype, device=y_emb.device)
+
+        return y_list, idx_list
+
+    def infer_panel_stream(
+        self,
+        x: List[torch.LongTensor],  #####全部文本token
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,  ####参考音频token
+        bert_feature: List[torch.LongTensor],
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        chunk_tokens: int = 24,
+        **kwargs,
+    ):
+        """
+        Decode a single sentence like infer_panel_batch_infer, but yield the semantic tokens
+        generated so far every `chunk_tokens` steps instead of only returning them at EOS.
+
+        Yields:
+            (tokens, finished): tokens is a LongTensor (n,) of all tokens generated so far,
+                the last item has finished=True and holds the same tokens infer_panel_batch_infer returns.
+        """
+        assert len(x) == 1, "infer_panel_stream decodes one sentence at a time"
+        if prompts is None:
+            # 无参考文本时不支持流式解码，整句解码完再返回
+            y_list, idx_list = self.infer_panel_naive_batched(
+                x,
+                x_lens,
+                prompts,
+                bert_feature,
+                top_k=top_k,
+                top_p=top_p,
+                early_stop_num=early_stop_num,
+                temperature=temperature,
+                **kwargs,
+            )
+            yield y_list[0][-idx_list[0] :], True
+            return
+
+        max_len = kwargs.get("max_len", x_lens.max())
+        prompt_prefix = kwargs.get("prompt_prefix", None)
+        xy_pos, attn_mask = self.make_batch_prompt(x, x_lens, prompts, bert_feature, max_len, prompt_prefix)
+        qkv = self.make_prompt_qkv(xy_pos, prompt_prefix)
+
+        y = prompts
+        y_len = y.shape[1]
+        prefix_len = y.shape[1]
+        k_cache = None
+        v_cache = None
+        emitted = 0
+        sampler = T2SSampler(prompts, self.vocab_size, top_k, top_p, temperature, repetition_penalty)
+        sync_every = max(int(kwargs.get("eos_sync_every", 1)), 1)
+        finish_idx = torch.full((1,), -1, dtype=torch.long, device=y.device)
+        row_cap = self.row_caps(1, early_stop_num, kwargs.get("max_new_tokens", None))[0]
+        loop_window = int(kwargs.get("loop_window", 0))
+        for idx in tqdm(range(1500)):
+            if idx == 0:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None, True, qkv)
+            else:
+                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
+            logits = self.ar_predict_layer(xy_dec[:, -1])
+
+            if idx == 0:
+                attn_mask = F.pad(attn_mask[:, :, -1].unsqueeze(-2), (0, 1), value=False)
+                logits = logits[:, :-1]
+            else:
+                attn_mask = F.pad(attn_mask, (0, 1), value=False)
+
+            samples, tokens = sampler(logits)
+            y = torch.concat([y, samples], dim=1)
+
+            # EOS 只在同步点、发送分块前和到达长度上限时检查
+            eos = (samples[:, 0] == self.EOS).logical_or(tokens == self.EOS)
+            finish_idx = torch.where(eos.logical_and(finish_idx < 0), idx, finish_idx)
+            capped = row_cap <= idx
+            chunk_ready = y.shape[1] - prefix_len - emitted >= chunk_tokens
+            if capped or chunk_ready or (idx + 1) % sync_every == 0:
+                finish_idx = self.mark_loops(finish_idx, y, idx, loop_window)
+                finish = int(finish_idx[0])
+                if finish >= 0 or capped:
+                    end = prefix_len + finish if finish >= 0 else y.shape[1] - 1
+                    print(f"T2S Decoding EOS [{prefix_len} -> {end + 1}]")
+                    # 与 infer_panel_batch_infer 一致，去掉最后一个采样
+                    yield y[0, prefix_len:end], True
+                    return
+
+            if chunk_ready:
+                emitted = y.shape[1] - prefix_len
+                yield y[0, prefix_len:], False
+
+            ####################### update next step ###################################
+            y_emb = self.ar_audio_embedding(y[:, -1:])
+            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
+                :, y_len + idx
+            ].to(dtype=y_emb.dtype, device=y_emb.device)
+
+    def make_batch_prompt(
+        self,
+        x: List[torch.LongTensor],
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: List[torch.LongTensor],
+        max_len: int,
+        prompt_prefix: Optional[T2SPromptPrefix] = None,
+    ):
+        """
+        Embed a batch of (text, prompt) pairs for the first decoding step of infer_panel_batch_infer.
+        The text is left padded to max_len, all rows share the prompt length. With a prompt_prefix
+        (see get_prompt_prefix) only the sentence phones are embedded, the prompt phones and
+        prompt semantic tokens are taken from the prefix.
+
+        Returns:
+            xy_pos: (bsz, max_len + y_len, embedding_dim) input of process_prompt.
+            attn_mask: (bsz, num_head, src_len, src_len) bool, True where attention is masked.
+        """
         x_list = []
         for x_item, bert_item in zip(x, bert_feature):
             # max_len = max(max_len, x_item.shape[0], bert_item.shape[1])
-            x_item = self.ar_text_embedding(x_item.unsqueeze(0))
-            x_item = x_item + self.bert_proj(bert_item.transpose(0, 1).unsqueeze(0))
-            x_item = self.ar_text_position(x_item).squeeze(0)
+            if prompt_prefix is not None:
+                x_item = self.embed_text(x_item, bert_item, prompt_prefix.x_len)
+                x_item = torch.concat([prompt_prefix.x_emb.to(x_item.dtype), x_item], dim=0)
+            else:
+                x_item = self.ar_text_embedding(x_item.unsqueeze(0))
+                x_item = x_item + self.bert_proj(bert_item.transpose(0, 1).unsqueeze(0))
+                x_item = self.ar_text_position(x_item).squeeze(0)
             # x_item = F.pad(x_item,(0,0,0,max_len-x_item.shape[0]),value=0) if x_item.shape[0]<max_len else x_item  ### padding right
             x_item = (
                 F.pad(x_item, (0, 0, max_len - x_item.shape[0], 0), value=0) if x_item.shape[0] < max_len else x_item
             )  ### padding left
             x_list.append(x_item)
         x: torch.Tensor = torch.stack(x_list, dim=0)
-
-        # AR Decoder
-        y = prompts
-
         x_len = x.shape[1]
-        stop = False
 
-        k_cache = None
-        v_cache = None
         ###################  first step ##########################
-        assert y is not None, "Error: Prompt free is not supported batch_infer!"
-        ref_free = False
-
-        y_emb = self.ar_audio_embedding(y)
-        y_len = y_emb.shape[1]
-        prefix_len = y.shape[1]
-        y_lens = torch.LongTensor([y_emb.shape[1]] * y_emb.shape[0]).to(x.device)
-        y_pos = self.ar_audio_position(y_emb)
+        assert prompts is not None, "Error: Prompt free is not supported batch_infer!"
+        if prompt_prefix is not None:
+            y_pos = prompt_prefix.y_pos.expand(x.shape[0], -1, -1)
+        else:
+            y_pos = self.ar_audio_position(self.ar_audio_embedding(prompts))
+        y_len = y_pos.shape[1]
+        y_lens = torch.LongTensor([y_len] * y_pos.shape[0]).to(x.device)
         xy_pos = torch.concat([x, y_pos], dim=1)
 
         ##### create mask #####
@@ -694,89 +1261,69 @@ class Text2SemanticDecoder(nn.Module):
         # [PAD, PAD, PAD, 1, 2, 3,   4,   5, EOS],
         # [PAD, PAD, PAD, 1, 2, 3,   4,   5,   6]]
 
-        ###### decode #####
-        y_list = [None] * y.shape[0]
-        batch_idx_map = list(range(y.shape[0]))
-        idx_list = [None] * y.shape[0]
-        for idx in tqdm(range(1500)):
-            if idx == 0:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
-            else:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
-            logits = self.ar_predict_layer(xy_dec[:, -1])
-
-            if idx == 0:
-                attn_mask = F.pad(attn_mask[:, :, -1].unsqueeze(-2), (0, 1), value=False)
-                logits = logits[:, :-1]
-            else:
-                attn_mask = F.pad(attn_mask, (0, 1), value=False)
-
-            samples = sample(
-                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
-            )[0]
+        return xy_pos, attn_mask
 
-            y = torch.concat([y, samples], dim=1)
+    def embed_text(self, x: torch.LongTensor, bert_feature: torch.Tensor, start: int = 0) -> torch.Tensor:
+        """Embed phones x[start:] (with their bert features) at text positions start.., returns (len - start, embedding_dim)."""
+        x_emb = self.ar_text_embedding(x[start:].unsqueeze(0)).squeeze(0)
+        x_emb = x_emb + self.bert_proj(bert_feature[:, start:].transpose(0, 1))
+        position = self.ar_text_position
+        position.extend_pe(x_emb.new_zeros(1, x.shape[0]))
+        pe = position.pe[0, start : x.shape[0]].to(dtype=x_emb.dtype, device=x_emb.device)
+        return x_emb * position.x_scale + position.alpha * pe
 
-            ####### 移除batch中已经生成完毕的序列,进一步优化计算量
-            tokens = torch.argmax(logits, dim=-1)
-            reserved_idx_of_batch_for_y = None
-            if (self.EOS in samples[:, 0]) or (self.EOS in tokens):  ###如果生成到EOS，则停止
-                l1 = samples[:, 0] == self.EOS
-                l2 = tokens == self.EOS
-                l = l1.logical_or(l2)
-                removed_idx_of_batch_for_y = torch.where(l == True)[0].tolist()
-                reserved_idx_of_batch_for_y = torch.where(l == False)[0]
-                # batch_indexs = torch.tensor(batch_idx_map, device=y.device)[removed_idx_of_batch_for_y]
-                for i in removed_idx_of_batch_for_y:
-                    batch_index = batch_idx_map[i]
-                    idx_list[batch_index] = idx
-                    y_list[batch_index] = y[i, :-1]
-
-                batch_idx_map = [batch_idx_map[i] for i in reserved_idx_of_batch_for_y.tolist()]
-
-            # 只保留batch中未生成完毕的序列
-            if reserved_idx_of_batch_for_y is not None:
-                # index = torch.LongTensor(batch_idx_map).to(y.device)
-                y = torch.index_select(y, dim=0, index=reserved_idx_of_batch_for_y)
-                attn_mask = torch.index_select(attn_mask, dim=0, index=reserved_idx_of_batch_for_y)
-                if k_cache is not None:
-                    for i in range(len(k_cache)):
-                        k_cache[i] = torch.index_select(k_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
-                        v_cache[i] = torch.index_select(v_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
-
-            if (early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num) or idx == 1499:
-                print("use early stop num:", early_stop_num)
-                stop = True
-                for i, batch_index in enumerate(batch_idx_map):
-                    batch_index = batch_idx_map[i]
-                    idx_list[batch_index] = idx
-                    y_list[batch_index] = y[i, :-1]
-
-            if None not in idx_list:
-                stop = True
-
-            if stop:
-                if y.shape[1] == 0:
-                    y = torch.concat([y, torch.zeros_like(samples)], dim=1)
-                    print("bad zero prediction")
-                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
-                break
-
-            ####################### update next step ###################################
-            y_emb = self.ar_audio_embedding(y[:, -1:])
-            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
-                :, y_len + idx
-            ].to(dtype=y_emb.dtype, device=y_emb.device)
-
-        if None in idx_list:
-            for i in range(x.shape[0]):
-                if idx_list[i] is None:
-                    idx_list[i] = 1500 - 1  ###如果没有生成到EOS，就用最大长度代替
-
-        if ref_free:
-            return y_list, [0] * x.shape[0]
-        # print(idx_list)
-        return y_list, idx_list
+    @torch.no_grad()
+    def get_prompt_prefix(
+        self,
+        key: str,
+        phones: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        prompts: torch.LongTensor,
+    ) -> T2SPromptPrefix:
+        """
+        Get the T2SPromptPrefix of a reference prompt from the LRU of this model, computing it on a miss.
+        The cache lives on the model, so entries never outlive (or mix) T2S weights.
+
+        Args:
+            key: str, identifies the prompt phones, bert features and prompt semantic tokens.
+            phones: LongTensor (x_len,), phones of the prompt text.
+            bert_feature: Tensor (1024, x_len), bert features of the prompt text.
+            prompts: LongTensor (y_len,) or (1, y_len), prompt semantic tokens.
+        """
+        weight = self.ar_predict_layer.weight
+        with self._prompt_prefix_lock:
+            prefix = self.prompt_prefix_cache.get(key, None)
+            if prefix is not None and prefix.y_pos.dtype == weight.dtype and prefix.y_pos.device == weight.device:
+                self.prompt_prefix_cache.move_to_end(key)
+                return prefix
+
+        phones = torch.as_tensor(phones, dtype=torch.long, device=weight.device)
+        bert_feature = bert_feature.to(dtype=weight.dtype, device=weight.device)
+        prompts = prompts.to(weight.device).view(1, -1)
+        x_emb = self.embed_text(phones, bert_feature)
+        y_pos = self.ar_audio_position(self.ar_audio_embedding(prompts))
+        block = self.t2s_transformer.blocks[0]
+        y_qkv = t2s_linear(y_pos, block.qkv_w, block.qkv_b)
+        prefix = T2SPromptPrefix(phones.shape[0], x_emb, y_pos, y_qkv)
+
+        with self._prompt_prefix_lock:
+            if self.prompt_prefix_cache_size > 0:
+                self.prompt_prefix_cache[key] = prefix
+                while len(self.prompt_prefix_cache) > self.prompt_prefix_cache_size:
+                    self.prompt_prefix_cache.popitem(last=False)
+        return prefix
+
+    def make_prompt_qkv(
+        self, xy_pos: torch.Tensor, prompt_prefix: Optional[T2SPromptPrefix] = None
+    ) -> Optional[torch.Tensor]:
+        """Layer-0 q/k/v of a make_batch_prompt() batch, reusing the projection of the prompt semantic tokens."""
+        if prompt_prefix is None:
+            return None
+        block = self.t2s_transformer.blocks[0]
+        y_len = prompt_prefix.y_qkv.shape[1]
+        x_qkv = t2s_linear(xy_pos[:, :-y_len], block.qkv_w, block.qkv_b)
+        y_qkv = prompt_prefix.y_qkv.to(x_qkv.dtype).expand(xy_pos.shape[0], -1, -1)
+        return torch.concat([x_qkv, y_qkv], dim=1)
 
     def infer_panel_naive_batched(
         self,
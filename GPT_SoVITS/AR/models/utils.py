@@ -1,6 +1,7 @@
 # modified from https://github.com/yangdongchao/SoundStorm/blob/master/soundstorm/s1/AR/models/utils.py
 # reference: https://github.com/lifeiteng/vall-e
-from typing import Tuple
+import math
+from typing import List, Tuple
 
 import torch
 import torch.nn.functional as F
@@ -199,6 +200,139 @@ def sample(
     return idx_next, probs
 
 
+def token_budget(phone_counts: List[int], prompt_phones: int, prompt_tokens: int, factor: float) -> Optional[List[int]]:
+    """
+    Upper bound of the semantic tokens of every sentence: its phone count times the speaking rate
+    of the reference (prompt_tokens semantic tokens for prompt_phones phones) times factor, plus
+    one second (25 tokens). None when factor <= 0 or the reference has no phones.
+    """
+    if factor <= 0 or prompt_phones <= 0:
+        return None
+    rate = prompt_tokens / prompt_phones
+    return [math.ceil(n * rate * factor) + 25 for n in phone_counts]
+
+
+def detect_loops(tail: torch.Tensor, window: int, max_period: int) -> torch.Tensor:
+    """
+    Find rows whose last `window` tokens repeat with a period of at most `max_period` tokens,
+    i.e. the decoder is stuck in a loop.
+
+    Args:
+        tail: LongTensor (bsz, >= window + max_period), the last generated tokens of every row.
+    Returns:
+        LongTensor (bsz,), the smallest period of the loop, 0 for rows that are not looping.
+    """
+    periods = torch.zeros(tail.shape[0], dtype=torch.long, device=tail.device)
+    last = tail[:, tail.shape[1] - window :]
+    for period in range(max_period, 0, -1):
+        shifted = tail[:, tail.shape[1] - window - period : tail.shape[1] - period]
+        periods = torch.where((last == shifted).all(dim=-1), period, periods)
+    return periods
+
+
+class T2SSampler:
+    """
+    Batched sampler of the T2S decode loops, equivalent to calling `sample` on every row with its
+    own parameters, without a host sync.
+
+    - the repetition penalty reads an incremental (bsz, vocab) token count instead of gathering and
+      scattering over the whole y history, the count is updated with every sampled token;
+    - top-k runs first, top-p is then applied to the k candidates only: their cumulative probabilities
+      are normalized with the logsumexp of the full vocab, so the result is the one of top-p on the full
+      sorted vocab followed by top-k, without sorting the vocab;
+    - top_k, top_p, temperature and repetition_penalty are per-row tensors, rows of requests with
+      different parameters share one call;
+    - the argmax of the penalized logits (the second EOS check of the decode loops) is the first
+      top-k candidate and comes for free.
+
+    Args:
+        prompts: LongTensor (bsz, prompt_len), the tokens already in y.
+        vocab_size: int, number of semantic tokens including EOS.
+        top_k, top_p, temperature, repetition_penalty: a scalar for every row, or a list/tensor of bsz values.
+            top_k <= 0 disables top-k, top_p >= 1 disables top-p.
+    """
+
+    def __init__(
+        self,
+        prompts: torch.LongTensor,
+        vocab_size: int,
+        top_k=15,
+        top_p=1.0,
+        temperature=1.0,
+        repetition_penalty=1.35,
+    ):
+        bsz, device = prompts.shape[0], prompts.device
+        self.vocab_size = vocab_size
+        self.top_k = self._rows(top_k, bsz, torch.long, device)
+        self.top_p = self._rows(top_p, bsz, torch.float32, device)
+        self.temperature = self._rows(temperature, bsz, torch.float32, device).clamp(min=1e-5)
+        self.repetition_penalty = self._rows(repetition_penalty, bsz, torch.float32, device)
+        top_k = top_k.tolist() if isinstance(top_k, torch.Tensor) else top_k
+        top_k = list(top_k) if isinstance(top_k, (list, tuple)) else [top_k]
+        # number of candidates kept by the widest row, vocab_size when a row has no top-k
+        self.max_k = vocab_size if min(top_k) <= 0 else min(max(top_k), vocab_size)
+        self.counts = torch.zeros((bsz, vocab_size), dtype=torch.int32, device=device)
+        self.counts.scatter_add_(1, prompts.long(), torch.ones_like(prompts, dtype=torch.int32))
+
+    @staticmethod
+    def _rows(value, bsz: int, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+        if isinstance(value, torch.Tensor):
+            return value.to(dtype=dtype, device=device).reshape(bsz)
+        if isinstance(value, (list, tuple)):
+            return torch.tensor(value, dtype=dtype, device=device)
+        return torch.full((bsz,), value, dtype=dtype, device=device)
+
+    def __call__(self, logits: torch.Tensor) -> Tuple[torch.LongTensor, torch.LongTensor]:
+        """
+        Args:
+            logits: Tensor (bsz, V), V may be vocab_size - 1 when the EOS column is dropped.
+        Returns:
+            samples: LongTensor (bsz, 1), the sampled tokens, already counted for the repetition penalty.
+            tokens: LongTensor (bsz,), argmax of the penalized logits.
+        """
+        logits = logits.float()
+        vocab = logits.shape[1]
+        rp = self.repetition_penalty.unsqueeze(1)
+        penalized = torch.where(logits < 0, logits * rp, logits / rp)
+        logits = torch.where(self.counts[:, :vocab] > 0, penalized, logits)
+
+        values, indices = torch.topk(logits, min(self.max_k, vocab), dim=-1)
+        tokens = indices[:, 0]
+
+        positions = torch.arange(values.shape[1], device=values.device).unsqueeze(0)
+        top_k = self.top_k.unsqueeze(1)
+        to_remove = (top_k > 0).logical_and(positions >= top_k)
+        cum_probs = torch.cumsum(torch.exp(values - torch.logsumexp(logits, dim=-1, keepdim=True)), dim=-1)
+        top_p = self.top_p.unsqueeze(1)
+        to_remove = to_remove.logical_or((top_p < 1.0).logical_and(cum_probs > top_p))
+        to_remove[:, 0] = False  # keep at least one option
+
+        values = (values / self.temperature.unsqueeze(1)).masked_fill(to_remove, -float("Inf"))
+        probs = torch.nn.functional.softmax(values, dim=-1)
+        q = torch.empty_like(probs).exponential_(1)
+        samples = indices.gather(1, torch.argmax(probs / q, dim=-1, keepdim=True))
+
+        self.counts.scatter_add_(1, samples, torch.ones_like(samples, dtype=torch.int32))
+        return samples, tokens
+
+    def compact(self, index: torch.LongTensor) -> None:
+        """Keep only the rows in `index`, in that order."""
+        self.top_k = self.top_k.index_select(0, index)
+        self.top_p = self.top_p.index_select(0, index)
+        self.temperature = self.temperature.index_select(0, index)
+        self.repetition_penalty = self.repetition_penalty.index_select(0, index)
+        self.counts = self.counts.index_select(0, index)
+
+    def extend(self, other: "T2SSampler") -> None:
+        """Append the rows of another sampler after the rows of this one."""
+        self.top_k = torch.cat([self.top_k, other.top_k])
+        self.top_p = torch.cat([self.top_p, other.top_p])
+        self.temperature = torch.cat([self.temperature, other.temperature])
+        self.repetition_penalty = torch.cat([self.repetition_penalty, other.repetition_penalty])
+        self.counts = torch.cat([self.counts, other.counts])
+        self.max_k = max(self.max_k, other.max_k)
+
+
 def dpo_loss(
     policy_chosen_logps: torch.FloatTensor,
     policy_rejected_logps: torch.FloatTensor,
@@ -0,0 +1,87 @@
+import importlib.util
+import json
+import os
+import sys
+
+# to import BigVGAN and module from GPT_SoVITS
+gpt_sovits_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(gpt_sovits_dir)
+
+import torch
+from BigVGAN.bigvgan import BigVGAN
+from BigVGAN.env import AttrDict
+from module.models import Generator
+
+# chunked_vocoder is loaded by path, importing TTS_infer_pack would run its __init__ and load the whole TTS stack
+spec = importlib.util.spec_from_file_location(
+    "chunked_vocoder", os.path.join(gpt_sovits_dir, "TTS_infer_pack", "chunked_vocoder.py")
+)
+chunked_vocoder = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(chunked_vocoder)
+ChunkedVocoder, receptive_field = chunked_vocoder.ChunkedVocoder, chunked_vocoder.receptive_field
+
+
+def make_bigvgan():
+    """bigvgan_v2_24khz_100band_256x with fewer channels, randomly initialized"""
+    with open(os.path.join(gpt_sovits_dir, "BigVGAN", "configs", "bigvgan_v2_24khz_100band_256x.json")) as f:
+        h = AttrDict(json.load(f))
+    h.upsample_initial_channel = 128
+    model = BigVGAN(h, use_cuda_kernel=False)
+    model.remove_weight_norm()
+    return model.eval(), 256
+
+
+def make_generator():
+    """the v4 vocoder with fewer channels, randomly initialized"""
+    model = Generator(
+        initial_channel=100,
+        resblock="1",
+        resblock_kernel_sizes=[3, 7, 11],
+        resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+        upsample_rates=[10, 6, 2, 2, 2],
+        upsample_initial_channel=64,
+        upsample_kernel_sizes=[20, 12, 4, 4, 4],
+        gin_channels=0,
+        is_bias=True,
+    )
+    model.remove_weight_norm()
+    return model.eval(), 480
+
+
+def check_chunked_vocoder(vocoder, upsample_rate, frames=300, window_frames=64):
+    torch.manual_seed(0)
+    mel = torch.randn(1, 100, frames) - 4
+    with torch.inference_mode():
+        full = vocoder(mel)[0, 0]
+    context = receptive_field(vocoder, 100, upsample_rate)
+    chunked_vocoder = ChunkedVocoder(vocoder, upsample_rate, window_frames, context)
+
+    # a whole mel, window by window
+    chunked = torch.cat(list(chunked_vocoder(mel)))
+    assert chunked.shape == full.shape, (chunked.shape, full.shape)
+    diff = (chunked - full).abs().max().item()
+    print(f"{vocoder.__class__.__name__}: context={context} frames, windowed max abs diff={diff:.2e}")
+    assert diff < 1e-4
+
+    # uneven pieces fed as they come, like CFM chunks
+    bounds = [0, 7, 90, 91, 200, frames]
+    pieces = [chunked_vocoder.feed(mel[:, :, a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+    pieces.append(chunked_vocoder.flush())
+    streamed = torch.cat(pieces)
+    assert streamed.shape == full.shape, (streamed.shape, full.shape)
+    diff = (streamed - full).abs().max().item()
+    print(f"{vocoder.__class__.__name__}: streamed max abs diff={diff:.2e}")
+    assert diff < 1e-4
+
+
+def test_chunked_bigvgan():
+    check_chunked_vocoder(*make_bigvgan())
+
+
+def test_chunked_generator():
+    check_chunked_vocoder(*make_generator())
+
+
+if __name__ == "__main__":
+    test_chunked_bigvgan()
+    test_chunked_generator()
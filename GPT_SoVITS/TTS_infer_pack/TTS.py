@@ -3,9 +3,12 @@ import math
 import os
 import random
 import sys
+import threading
 import time
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from copy import deepcopy
+from functools import partial
 
 import torchaudio
 from tqdm import tqdm
@@ -13,7 +16,7 @@ from tqdm import tqdm
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 import os
-from typing import List, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 import ffmpeg
 import librosa
@@ -21,7 +24,9 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 import yaml
+from AR.models.t2s_decode_graph import T2SDecodeGraph
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
+from AR.models.utils import token_budget
 from BigVGAN.bigvgan import BigVGAN
 from feature_extractor.cnhubert import CNHubert
 from module.mel_processing import mel_spectrogram_torch, spectrogram_torch
@@ -34,6 +39,18 @@ from tools.audio_sr import AP_BWE
 from tools.i18n.i18n import I18nAuto, scan_language_list
 from TTS_infer_pack.text_segmentation_method import splits
 from TTS_infer_pack.TextPreprocessor import TextPreprocessor
+from TTS_infer_pack.model_pool import ModelPool, weights_key
+from TTS_infer_pack.prompt_cache import PromptFeatureCache, make_key
+from TTS_infer_pack.text_cache import TextFeatureCache, frontend_fingerprint
+from TTS_infer_pack.t2s_scheduler import T2SScheduler
+from TTS_infer_pack.chunked_vocoder import ChunkedVocoder, receptive_field
+from TTS_infer_pack.cpu_precision import (
+    autocast_call,
+    autocast_iter,
+    convert_module,
+    parse_cpu_precision,
+    set_t2s_precision,
+)
 from sv import SV
 
 resample_transform_dict = {}
@@ -328,6 +345,52 @@ class TTS_Config:
         self.bert_base_path = self.configs.get("bert_base_path", None)
         self.cnhuhbert_base_path = self.configs.get("cnhuhbert_base_path", None)
         self.languages = self.v1_languages if self.version == "v1" else self.v2_languages
+        # number of resident GPT/SoVITS pairs kept by the model pool, 0 disables the pool
+        self.model_pool_size: int = int(self.configs.get("model_pool_size", 0))
+        # memory budget (MB) of the model pool, 0 means unlimited
+        self.model_pool_max_mem: int = int(self.configs.get("model_pool_max_mem", 0))
+        # number of reference prompts whose features are kept in memory
+        self.prompt_cache_size: int = int(self.configs.get("prompt_cache_size", 16))
+        # directory of the on-disk prompt feature cache, empty disables it
+        self.prompt_cache_dir: str = self.configs.get("prompt_cache_dir", "")
+        # number of texts whose phones and BERT features are kept in memory, 0 disables it
+        self.text_cache_size: int = int(self.configs.get("text_cache_size", 256))
+        # directory of the memory-mapped text feature store, empty disables it
+        self.text_cache_dir: str = self.configs.get("text_cache_dir", "")
+        # size limit (MB) of the text feature store
+        self.text_cache_max_mb: int = int(self.configs.get("text_cache_max_mb", 1024))
+        # decode the T2S rows of concurrent run() calls in one batch (parallel_infer only)
+        self.t2s_continuous_batching: bool = bool(self.configs.get("t2s_continuous_batching", False))
+        # maximum number of sentences decoded together by the continuous batching scheduler
+        self.t2s_max_batch_size: int = int(self.configs.get("t2s_max_batch_size", 32))
+        # decode parallel_infer batches on preallocated KV caches instead of concatenating per token
+        self.t2s_static_kv_cache: bool = bool(self.configs.get("t2s_static_kv_cache", False))
+        # number of reference prompts whose T2S prefix (prompt embeddings, layer-0 q/k/v) is kept per T2S model
+        self.t2s_prefix_cache_size: int = int(self.configs.get("t2s_prefix_cache_size", 8))
+        # decode steps between two host reads of the T2S EOS flags, 1 checks every token
+        self.t2s_eos_sync_every: int = int(self.configs.get("t2s_eos_sync_every", 1))
+        # decode parallel_infer batches with a captured single-token step (CUDA graph), only used on CUDA
+        self.t2s_decode_graph: bool = bool(self.configs.get("t2s_decode_graph", False))
+        # batch size buckets of the captured decode step, larger batches decode eagerly
+        self.t2s_graph_batch_sizes: list = list(self.configs.get("t2s_graph_batch_sizes", [1, 4, 8]))
+        # cache columns (prompt + generated tokens) of the captured decode step, longer sequences decode eagerly
+        self.t2s_graph_capacity: int = int(self.configs.get("t2s_graph_capacity", 2048))
+        # cap every sentence at phones x reference tokens per phone x this factor (+1s), 0 only uses max_sec
+        self.t2s_budget_factor: float = float(self.configs.get("t2s_budget_factor", 0))
+        # retire rows whose last t2s_loop_window semantic tokens repeat, 0 disables loop detection
+        self.t2s_loop_window: int = int(self.configs.get("t2s_loop_window", 0))
+        # decode parallel sentences with SoVITS as a padded batch instead of one concatenated sequence
+        self.sovits_padded_decode: bool = bool(self.configs.get("sovits_padded_decode", False))
+        # ODE solver of the v3/v4 CFM: euler, midpoint or heun
+        self.cfm_solver: str = str(self.configs.get("cfm_solver", "euler"))
+        # bends the CFM timestep schedule, -1..0 puts more steps near the noise end, 0 is uniform
+        self.cfm_sway: float = float(self.configs.get("cfm_sway", 0.0))
+        # stop the CFM early once the velocity changes less than this between steps, 0 always runs sample_steps
+        self.cfm_adaptive_tol: float = float(self.configs.get("cfm_adaptive_tol", 0.0))
+        # vocode v3/v4 mel in windows of this many frames (plus the receptive field as context), 0 is one pass
+        self.vocoder_window_frames: int = int(self.configs.get("vocoder_window_frames", 0))
+        # precision of the T2S / BERT / HuBERT models when running on CPU: fp32, bf16 or int8, one value or a dict
+        self.cpu_precision: dict = parse_cpu_precision(self.configs.get("cpu_precision", "fp32"))
 
         self.use_vocoder: bool = False
 
@@ -385,6 +448,29 @@ class TTS_Config:
             "vits_weights_path": self.vits_weights_path,
             "bert_base_path": self.bert_base_path,
             "cnhuhbert_base_path": self.cnhuhbert_base_path,
+            "model_pool_size": self.model_pool_size,
+            "model_pool_max_mem": self.model_pool_max_mem,
+            "prompt_cache_size": self.prompt_cache_size,
+            "prompt_cache_dir": self.prompt_cache_dir,
+            "text_cache_size": self.text_cache_size,
+            "text_cache_dir": self.text_cache_dir,
+            "text_cache_max_mb": self.text_cache_max_mb,
+            "t2s_continuous_batching": self.t2s_continuous_batching,
+            "t2s_max_batch_size": self.t2s_max_batch_size,
+            "t2s_static_kv_cache": self.t2s_static_kv_cache,
+            "t2s_prefix_cache_size": self.t2s_prefix_cache_size,
+            "t2s_eos_sync_every": self.t2s_eos_sync_every,
+            "t2s_decode_graph": self.t2s_decode_graph,
+            "t2s_graph_batch_sizes": self.t2s_graph_batch_sizes,
+            "t2s_graph_capacity": self.t2s_graph_capacity,
+            "t2s_budget_factor": self.t2s_budget_factor,
+            "t2s_loop_window": self.t2s_loop_window,
+            "sovits_padded_decode": self.sovits_padded_decode,
+            "cfm_solver": self.cfm_solver,
+            "cfm_sway": self.cfm_sway,
+            "cfm_adaptive_tol": self.cfm_adaptive_tol,
+            "vocoder_window_frames": self.vocoder_window_frames,
+            "cpu_precision": self.cpu_precision,
         }
         return self.config
 
@@ -434,11 +520,44 @@ class TTS:
             "upsample_rate": None,
             "overlapped_len": None,
         }
+        # streamed v3/v4 chunks are vocoded here, on its own CUDA stream, while the CFM samples the next chunk
+        self._vocoder_executor: Optional[ThreadPoolExecutor] = None
+        self._vocoder_stream = None
+        # receptive field of the vocoder in mel frames, the context of ChunkedVocoder windows
+        self._vocoder_context: Optional[int] = None
+
+        # resident T2S/SoVITS models, so switching back to a recently used speaker skips the reload
+        self.model_pool: ModelPool = ModelPool(
+            max_models=self.configs.model_pool_size * 2,
+            max_bytes=self.configs.model_pool_max_mem * 1024**2,
+            on_evict=self.empty_cache,
+        )
+        self._t2s_pool_key = None
+        self._vits_pool_key = None
+        # features of recently used reference audios and prompt texts
+        self.prompt_feature_cache: PromptFeatureCache = PromptFeatureCache(
+            max_entries=self.configs.prompt_cache_size,
+            cache_dir=self.configs.prompt_cache_dir,
+        )
+        # phones and BERT features of recently synthesized texts, keyed by the frontend (see init_bert_weights)
+        self.text_cache: TextFeatureCache = TextFeatureCache(
+            max_entries=self.configs.text_cache_size,
+            cache_dir=self.configs.text_cache_dir,
+            max_disk_mb=self.configs.text_cache_max_mb,
+        )
+        # shares T2S forward passes between concurrent run() calls
+        self.t2s_scheduler: T2SScheduler = (
+            T2SScheduler(self.configs.t2s_max_batch_size, self.configs.t2s_eos_sync_every, self.configs.t2s_loop_window)
+            if self.configs.t2s_continuous_batching
+            else None
+        )
+        # guards prompt_cache while a run() sets up its reference
+        self.prompt_lock = threading.RLock()
 
         self._init_models()
 
         self.text_preprocessor: TextPreprocessor = TextPreprocessor(
-            self.bert_model, self.bert_tokenizer, self.configs.device
+            self.bert_model, self.bert_tokenizer, self.configs.device, self.text_cache
         )
 
         self.prompt_cache: dict = {
@@ -451,6 +570,14 @@ class TTS:
             "bert_features": None,
             "norm_text": None,
             "aux_ref_audio_paths": [],
+            "sv_emb": None,
+            "aux_sv_emb": [],
+            "cfm_steps": {},
+            "vocoder_prompt": {},
+            "vits_key": None,
+            "prompt_version": None,
+            "ref_key": None,
+            "text_key": None,
         }
 
         self.stop_flag: bool = False
@@ -472,6 +599,9 @@ class TTS:
         self.cnhuhbert_model = self.cnhuhbert_model.to(self.configs.device)
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.cnhuhbert_model = self.cnhuhbert_model.half()
+        if str(self.configs.device) == "cpu":
+            model = self.cnhuhbert_model.model
+            self.cnhuhbert_model.model = convert_module(model, self.configs.cpu_precision["hubert"])
 
     def init_bert_weights(self, base_path: str):
         logger.info(f"Loading BERT weights from {base_path}")
@@ -479,14 +609,27 @@ class TTS:
         self.bert_model = AutoModelForMaskedLM.from_pretrained(base_path)
         self.bert_model = self.bert_model.eval()
         self.bert_model = self.bert_model.to(self.configs.device)
-        if self.configs.is_half and str(self.configs.device) != "cpu":
-            self.bert_model = self.bert_model.half()
+        if str(self.configs.device) == "cpu":
+            precision = self.configs.cpu_precision["bert"]
+            self.bert_model = convert_module(self.bert_model, precision)
+        else:
+            if self.configs.is_half:
+                self.bert_model = self.bert_model.half()
+            precision = "fp16" if self.configs.is_half else "fp32"
+        # features of fp16 and fp32 BERT differ, processes with different is_half must not share cache keys
+        self.text_cache.fingerprint = frontend_fingerprint(base_path, precision)
 
     def init_vits_weights(self, weights_path: str):
         self.configs.vits_weights_path = weights_path
         version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(weights_path)
         if "Pro" in model_version:
             self.init_sv_model()
+        self._vits_pool_key = weights_key("vits", weights_path, model_version)
+        pooled = self.model_pool.get(self._vits_pool_key)
+        if pooled is not None:
+            logger.info(f"Using resident VITS weights of {weights_path}")
+            self._use_vits_model(*pooled)
+            return
         path_sovits = self.configs.default_configs[model_version]["vits_weights_path"]
 
         if if_lora_v3 == True and os.path.exists(path_sovits) == False:
@@ -579,15 +722,47 @@ class TTS:
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.vits_model = self.vits_model.half()
 
+        self.model_pool.put(self._vits_pool_key, self.vits_model, self._vits_model_meta())
         self.configs.save_configs()
 
+    def _vits_model_meta(self) -> dict:
+        return {
+            "version": self.configs.version,
+            "filter_length": self.configs.filter_length,
+            "segment_size": self.configs.segment_size,
+            "sampling_rate": self.configs.sampling_rate,
+            "hop_length": self.configs.hop_length,
+            "win_length": self.configs.win_length,
+            "n_speakers": self.configs.n_speakers,
+            "semantic_frame_rate": self.configs.semantic_frame_rate,
+            "use_vocoder": self.configs.use_vocoder,
+        }
 
+    def _use_vits_model(self, vits_model: Union[SynthesizerTrn, SynthesizerTrnV3], meta: dict):
+        for key in ("filter_length", "segment_size", "sampling_rate", "hop_length", "win_length", "n_speakers"):
+            setattr(self.configs, key, meta[key])
+        self.configs.semantic_frame_rate = meta["semantic_frame_rate"]
+        self.configs.update_version(meta["version"])
+        self.configs.use_vocoder = meta["use_vocoder"]
+        if self.configs.use_vocoder:
+            self.init_vocoder(meta["version"])
+        self.is_v2pro = meta["version"] in {"v2Pro", "v2ProPlus"}
+        self.vits_model = vits_model
+        self.configs.save_configs()
 
     def init_t2s_weights(self, weights_path: str):
-        logger.info(f"Loading Text2Semantic weights from {weights_path}")
         self.configs.t2s_weights_path = weights_path
         self.configs.save_configs()
         self.configs.hz = 50
+        self._t2s_pool_key = weights_key("t2s", weights_path)
+        pooled = self.model_pool.get(self._t2s_pool_key)
+        if pooled is not None:
+            logger.info(f"Using resident Text2Semantic weights of {weights_path}")
+            self.t2s_model, meta = pooled
+            self.configs.max_sec = meta["max_sec"]
+            self._configure_t2s_model()
+            return
+        logger.info(f"Loading Text2Semantic weights from {weights_path}")
         dict_s1 = torch.load(weights_path, map_location=self.configs.device, weights_only=False)
         config = dict_s1["config"]
         self.configs.max_sec = config["data"]["max_sec"]
@@ -598,6 +773,21 @@ class TTS:
         self.t2s_model = t2s_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.t2s_model = self.t2s_model.half()
+        self._configure_t2s_model()
+        self.model_pool.put(self._t2s_pool_key, self.t2s_model, {"max_sec": self.configs.max_sec})
+
+    def _configure_t2s_model(self):
+        """Apply the decoding options of the configs to the current T2S model."""
+        model = self.t2s_model.model
+        model.prompt_prefix_cache_size = self.configs.t2s_prefix_cache_size
+        precision = self.configs.cpu_precision["t2s"] if str(self.configs.device) == "cpu" else "fp32"
+        if model.cpu_precision != precision:
+            set_t2s_precision(model, precision)
+        # the graph saves kernel launches of CUDA, on CPU it is slower than the static KV cache
+        if not self.configs.t2s_decode_graph or "cuda" not in str(self.configs.device):
+            model.decode_graph = None
+        elif model.decode_graph is None:
+            model.decode_graph = T2SDecodeGraph(model, self.configs.t2s_graph_batch_sizes, self.configs.t2s_graph_capacity)
 
     def init_vocoder(self, version: str):
         if version == "v3":
@@ -659,6 +849,7 @@ class TTS:
             self.vocoder = self.vocoder.half().to(self.configs.device)
         else:
             self.vocoder = self.vocoder.to(self.configs.device)
+        self._vocoder_context = None
 
     def init_sr_model(self):
         if self.sr_model is not None:
@@ -688,6 +879,8 @@ class TTS:
 
         self.configs.is_half = enable
         self.precision = torch.float16 if enable else torch.float32
+        # resident models keep their old precision, drop them instead of converting every one
+        self.model_pool.clear()
         if save:
             self.configs.save_configs()
         if enable:
@@ -720,16 +913,27 @@ class TTS:
             device: torch.device, the device to use for all models.
         """
         self.configs.device = device
+        self.model_pool.clear()
         if save:
             self.configs.save_configs()
         if self.t2s_model is not None:
             self.t2s_model = self.t2s_model.to(device)
+            self._configure_t2s_model()
         if self.vits_model is not None:
             self.vits_model = self.vits_model.to(device)
+        # the bf16 / int8 BERT and HuBERT only exist on CPU, load them again in the precision of the new device
         if self.bert_model is not None:
-            self.bert_model = self.bert_model.to(device)
+            if self.configs.cpu_precision["bert"] == "fp32":
+                self.bert_model = self.bert_model.to(device)
+            else:
+                self.init_bert_weights(self.configs.bert_base_path)
+            self.text_preprocessor.bert_model = self.bert_model
+            self.text_preprocessor.device = device
         if self.cnhuhbert_model is not None:
-            self.cnhuhbert_model = self.cnhuhbert_model.to(device)
+            if self.configs.cpu_precision["hubert"] == "fp32":
+                self.cnhuhbert_model = self.cnhuhbert_model.to(device)
+            else:
+                self.init_cnhuhbert_weights(self.configs.cnhuhbert_base_path)
         if self.vocoder is not None:
             self.vocoder = self.vocoder.to(device)
         if self.sr_model is not None:
@@ -742,25 +946,120 @@ class TTS:
         Args:
             ref_audio_path: str, the path of the reference audio.
         """
-        self._set_prompt_semantic(ref_audio_path)
-        self._set_ref_spec(ref_audio_path)
+        features = self._get_ref_features(ref_audio_path)
+        device = self.configs.device
+        self.prompt_cache["prompt_semantic"] = features["prompt_semantic"].to(device)
+        audio_16k = features.get("audio_16k", None)
+        spec_audio = (features["refer_spec"].to(device), audio_16k.to(device) if audio_16k is not None else None)
+        if self.prompt_cache["refer_spec"] in [[], None]:
+            self.prompt_cache["refer_spec"] = [spec_audio]
+        else:
+            self.prompt_cache["refer_spec"][0] = spec_audio
+        sv_emb = features.get("sv_emb", None)
+        self.prompt_cache["sv_emb"] = sv_emb.to(device) if sv_emb is not None else None
+        self.prompt_cache["raw_audio"] = features["raw_audio"].to(device)
+        self.prompt_cache["raw_sr"] = features["raw_sr"]
+        self.prompt_cache["vits_key"] = self._vits_pool_key
+        self.prompt_cache["ref_key"] = self._ref_features_key(ref_audio_path)
+        self.prompt_cache["cfm_steps"] = {}
+        self.prompt_cache["vocoder_prompt"] = {}
         self._set_ref_audio_path(ref_audio_path)
 
     def _set_ref_audio_path(self, ref_audio_path):
         self.prompt_cache["ref_audio_path"] = ref_audio_path
 
-    def _set_ref_spec(self, ref_audio_path):
-        spec_audio = self._get_ref_spec(ref_audio_path)
-        if self.prompt_cache["refer_spec"] in [[], None]:
-            self.prompt_cache["refer_spec"] = [spec_audio]
-        else:
-            self.prompt_cache["refer_spec"][0] = spec_audio
+    def _snapshot_prompt_cache(self) -> dict:
+        """Shallow copy of prompt_cache, later set_ref_audio() calls do not affect it."""
+        prompt_cache = dict(self.prompt_cache)
+        prompt_cache["refer_spec"] = list(self.prompt_cache["refer_spec"])
+        prompt_cache["aux_sv_emb"] = list(self.prompt_cache["aux_sv_emb"])
+        return prompt_cache
+
+    def _ref_features_key(self, ref_audio_path: str, kind: str = "ref") -> str:
+        # prompt_semantic depends on the HuBERT precision, fp32 keeps the keys of existing caches
+        hubert_precision = self.configs.cpu_precision["hubert"] if str(self.configs.device) == "cpu" else "fp32"
+        return make_key(
+            kind,
+            self.prompt_feature_cache.file_hash(ref_audio_path),
+            self._vits_pool_key,
+            self.configs.version,
+            self.configs.cnhuhbert_base_path,
+            self.configs.sampling_rate,
+            self.configs.filter_length,
+            self.configs.hop_length,
+            self.configs.win_length,
+            self.configs.is_half,
+            *([] if hubert_precision == "fp32" else [hubert_precision]),
+        )
+
+    @staticmethod
+    def ref_features_sidecar(ref_audio_path: str) -> str:
+        """Path of the precomputed feature file written next to a reference audio by precompute_ref_features()."""
+        return os.path.splitext(ref_audio_path)[0] + ".features.npz"
+
+    def _get_ref_features(self, ref_audio_path: str) -> dict:
+        """
+        Get the features of a reference audio from the prompt feature cache (or its precomputed sidecar file),
+            extracting and caching them on a miss.
+        Args:
+            ref_audio_path: str, the path of the reference audio.
+        Returns:
+            dict: prompt_semantic, refer_spec, audio_16k (v2Pro), sv_emb (v2Pro), raw_audio and raw_sr, on CPU.
+        """
+        key = self._ref_features_key(ref_audio_path)
+        features = self.prompt_feature_cache.get(key, sidecar=self.ref_features_sidecar(ref_audio_path))
+        if features is None:
+            features = self.prompt_feature_cache.put(key, self._extract_ref_features(ref_audio_path))
+        return features
+
+    def _extract_ref_features(self, ref_audio_path: str) -> dict:
+        prompt_semantic = self._get_prompt_semantic(ref_audio_path)
+        raw_audio, raw_sr = self._load_ref_audio(ref_audio_path)
+        spec, audio_16k = self._get_ref_spec(ref_audio_path, raw_audio, raw_sr)
+        sv_emb = self.sv_model.compute_embedding3(audio_16k) if self.is_v2pro else None
+        return {
+            "prompt_semantic": prompt_semantic,
+            "refer_spec": spec,
+            "audio_16k": audio_16k,
+            "sv_emb": sv_emb,
+            "raw_audio": raw_audio,
+            "raw_sr": raw_sr,
+        }
 
-    def _get_ref_spec(self, ref_audio_path):
+    def _get_aux_ref_features(self, aux_ref_audio_paths: List[str]) -> List[dict]:
+        """
+        Get refer_spec, audio_16k (v2Pro) and sv_emb (v2Pro) of auxiliary reference audios from the prompt feature cache,
+            the speaker embeddings of all misses are computed in one SV call.
+        Args:
+            aux_ref_audio_paths: list of str, existing audio paths.
+        Returns:
+            list of dict, one per path, on CPU.
+        """
+        keys = [self._ref_features_key(path, "aux") for path in aux_ref_audio_paths]
+        features = [self.prompt_feature_cache.get(key) for key in keys]
+        missing = [i for i, entry in enumerate(features) if entry is None]
+        if len(missing) == 0:
+            return features
+        extracted = []
+        for i in missing:
+            spec, audio_16k = self._get_ref_spec(aux_ref_audio_paths[i])
+            extracted.append({"refer_spec": spec, "audio_16k": audio_16k})
+        if self.is_v2pro:
+            sv_embs = self.sv_model.compute_embeddings([entry["audio_16k"] for entry in extracted])
+            for entry, sv_emb in zip(extracted, sv_embs):
+                entry["sv_emb"] = sv_emb.unsqueeze(0)
+        for i, entry in zip(missing, extracted):
+            features[i] = self.prompt_feature_cache.put(keys[i], entry)
+        return features
+
+    def _load_ref_audio(self, ref_audio_path: str):
         raw_audio, raw_sr = torchaudio.load(ref_audio_path)
         raw_audio = raw_audio.to(self.configs.device).float()
-        self.prompt_cache["raw_audio"] = raw_audio
-        self.prompt_cache["raw_sr"] = raw_sr
+        return raw_audio, raw_sr
+
+    def _get_ref_spec(self, ref_audio_path, raw_audio: torch.Tensor = None, raw_sr: int = None):
+        if raw_audio is None:
+            raw_audio, raw_sr = self._load_ref_audio(ref_audio_path)
 
         if raw_sr != self.configs.sampling_rate:
             audio = raw_audio.to(self.configs.device)
@@ -793,7 +1092,7 @@ class TTS:
             audio = None
         return spec, audio
 
-    def _set_prompt_semantic(self, ref_wav_path: str):
+    def _get_prompt_semantic(self, ref_wav_path: str) -> torch.Tensor:
         zero_wav = np.zeros(
             int(self.configs.sampling_rate * 0.3),
             dtype=np.float16 if self.configs.is_half else np.float32,
@@ -817,7 +1116,56 @@ class TTS:
             codes = self.vits_model.extract_latent(hubert_feature)
 
             prompt_semantic = codes[0, 0].to(self.configs.device)
-            self.prompt_cache["prompt_semantic"] = prompt_semantic
+        return prompt_semantic
+
+    @staticmethod
+    def _normalize_prompt_text(prompt_text: str, prompt_lang: str) -> str:
+        prompt_text = prompt_text.strip("\n")
+        if prompt_text[-1] not in splits:
+            prompt_text += "。" if prompt_lang != "en" else "."
+        return prompt_text
+
+    def _prompt_text_key(self, prompt_text: str, prompt_lang: str) -> str:
+        return make_key("text", prompt_text, prompt_lang, self.configs.version, self.configs.bert_base_path)
+
+    def _get_prompt_text_features(self, prompt_text: str, prompt_lang: str, sidecar: str = None):
+        key = self._prompt_text_key(prompt_text, prompt_lang)
+        features = self.prompt_feature_cache.get(key, sidecar=sidecar)
+        if features is None:
+            phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
+                prompt_text, prompt_lang, self.configs.version
+            )
+            features = self.prompt_feature_cache.put(
+                key, {"phones": phones, "bert_features": bert_features, "norm_text": norm_text}
+            )
+        return features["phones"], features["bert_features"].to(self.configs.device), features["norm_text"]
+
+    @torch.no_grad()
+    def precompute_ref_features(self, ref_audio_path: str, prompt_text: str = "", prompt_lang: str = "") -> str:
+        """
+        Extract the features of a reference audio (and of its prompt text) with the loaded models
+            and write them to the sidecar file next to the audio, so that the first request using
+            this reference loads them instead of running CNHubert/SV/BERT.
+            The sidecar is keyed like the feature cache, it is ignored once the weights or settings change.
+        Args:
+            ref_audio_path: str, the path of the reference audio.
+            prompt_text: str, the prompt text of the reference audio, "" to skip the text features.
+            prompt_lang: str, the language of the prompt text.
+        Returns:
+            str: the path of the sidecar file.
+        """
+        entries = {self._ref_features_key(ref_audio_path): self._get_ref_features(ref_audio_path)}
+        if prompt_text not in [None, ""]:
+            prompt_text = self._normalize_prompt_text(prompt_text, prompt_lang)
+            phones, bert_features, norm_text = self._get_prompt_text_features(prompt_text, prompt_lang)
+            entries[self._prompt_text_key(prompt_text, prompt_lang)] = {
+                "phones": phones,
+                "bert_features": bert_features,
+                "norm_text": norm_text,
+            }
+        sidecar = self.ref_features_sidecar(ref_audio_path)
+        PromptFeatureCache.save_file(sidecar, entries)
+        return sidecar
 
     def batch_sequences(self, sequences: List[torch.Tensor], axis: int = 0, pad_value: int = 0, max_length: int = None):
         seq = sequences[0]
@@ -1010,6 +1358,10 @@ class TTS:
                     "repetition_penalty": 1.35    # float. repetition penalty for T2S model.
                     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
                     "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                    "stream_chunk_tokens": 0,     # int. >0 streams every N semantic tokens within a sentence (v1/v2/v2Pro, implies return_fragment).
+                                                  #      v3/v4 stream every CFM chunk of a sentence instead, without super_sampling.
+                    "stream_overlap_tokens": 4,   # int. tokens crossfaded between consecutive streamed chunks.
+                    "stream_context_tokens": 24,  # int. previous tokens decoded with every streamed chunk for context.
                 }
         returns:
             Tuple[int, np.ndarray]: sampling rate and audio data.
@@ -1039,13 +1391,39 @@ class TTS:
         repetition_penalty = inputs.get("repetition_penalty", 1.35)
         sample_steps = inputs.get("sample_steps", 32)
         super_sampling = inputs.get("super_sampling", False)
+        stream_chunk_tokens = int(inputs.get("stream_chunk_tokens", 0))
+        stream_overlap_tokens = int(inputs.get("stream_overlap_tokens", 4))
+        stream_context_tokens = int(inputs.get("stream_context_tokens", 24))
+
+        vocoder_stream = False
+        if stream_chunk_tokens > 0:
+            return_fragment = True
+            batch_size = 1
+            if self.configs.use_vocoder:
+                # v3/v4 stream a sentence CFM chunk by CFM chunk, overlapping with the vocoder of the previous chunk
+                vocoder_stream = True
+                stream_chunk_tokens = 0
+                if super_sampling and self.configs.version == "v3":
+                    # super-sampling works on whole sentences, per chunk it would change the sampling rate
+                    # mid-stream and leave seams at the chunk borders
+                    logger.warning("super_sampling is ignored when streaming with stream_chunk_tokens > 0")
+                    super_sampling = False
+            else:
+                stream_overlap_tokens = max(0, min(stream_overlap_tokens, stream_chunk_tokens - 1))
 
+        t2s_model = self.t2s_model.model
         if parallel_infer:
             logger.info(i18n("并行推理模式已开启"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_batch_infer
+            if self.t2s_scheduler is not None:
+                infer_panel = partial(self.t2s_scheduler.infer_panel, t2s_model)
+            elif self.configs.t2s_static_kv_cache or t2s_model.decode_graph is not None:
+                infer_panel = t2s_model.infer_panel_batch_infer_static
+            else:
+                infer_panel = t2s_model.infer_panel_batch_infer
         else:
             logger.info(i18n("并行推理模式已关闭"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_naive_batched
+            infer_panel = t2s_model.infer_panel_naive_batched
+        infer_panel = autocast_call(infer_panel, t2s_model.cpu_precision)
 
         if return_fragment:
             logger.info(i18n("分段返回模式已开启"))
@@ -1079,50 +1457,80 @@ class TTS:
         if no_prompt_text and self.configs.use_vocoder:
             raise NO_PROMPT_ERROR("prompt_text cannot be empty when using SoVITS_V3")
 
-        if ref_audio_path in [None, ""] and (
-            (self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])
-        ):
-            raise ValueError(
-                "ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()"
-            )
-
         ###### setting reference audio and prompt text preprocessing ########
         t0 = time.perf_counter()
-        if (ref_audio_path is not None) and (
-            ref_audio_path != self.prompt_cache["ref_audio_path"]
-            or (self.is_v2pro and self.prompt_cache["refer_spec"][0][1] is None)
-        ):
-            if not os.path.exists(ref_audio_path):
-                raise ValueError(f"{ref_audio_path} not exists")
-            self.set_ref_audio(ref_audio_path)
-
-        aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
-        paths = set(aux_ref_audio_paths) & set(self.prompt_cache["aux_ref_audio_paths"])
-        if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
-            self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
-            self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
-            for path in aux_ref_audio_paths:
-                if path in [None, ""]:
-                    continue
-                if not os.path.exists(path):
-                    logger.warning(i18n("音频文件不存在，跳过："), path)
-                    continue
-                self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
-
-        if not no_prompt_text:
-            prompt_text = prompt_text.strip("\n")
-            if prompt_text[-1] not in splits:
-                prompt_text += "。" if prompt_lang != "en" else "."
-            logger.info(i18n("实际输入的参考文本:"), prompt_text)
-            if self.prompt_cache["prompt_text"] != prompt_text:
-                phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
-                    prompt_text, prompt_lang, self.configs.version
+        # concurrent calls may switch the reference, keep a snapshot of the prompt for this call
+        with self.prompt_lock:
+            if ref_audio_path in [None, ""] and (
+                (self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])
+            ):
+                raise ValueError(
+                    "ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()"
                 )
-                self.prompt_cache["prompt_text"] = prompt_text
-                self.prompt_cache["prompt_lang"] = prompt_lang
-                self.prompt_cache["phones"] = phones
-                self.prompt_cache["bert_features"] = bert_features
-                self.prompt_cache["norm_text"] = norm_text
+
+            if (ref_audio_path is not None) and (
+                ref_audio_path != self.prompt_cache["ref_audio_path"]
+                or self.prompt_cache["vits_key"] != self._vits_pool_key
+                or (self.is_v2pro and self.prompt_cache["refer_spec"][0][1] is None)
+            ):
+                if not os.path.exists(ref_audio_path):
+                    raise ValueError(f"{ref_audio_path} not exists")
+                self.set_ref_audio(ref_audio_path)
+
+            aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
+            paths = set(aux_ref_audio_paths) & set(self.prompt_cache["aux_ref_audio_paths"])
+            if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
+                self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
+                self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
+                self.prompt_cache["aux_sv_emb"] = []
+                existing_paths = []
+                for path in aux_ref_audio_paths:
+                    if path in [None, ""]:
+                        continue
+                    if not os.path.exists(path):
+                        logger.warning(i18n("音频文件不存在，跳过："), path)
+                        continue
+                    existing_paths.append(path)
+                # speaker embeddings are computed here once per reference, not for every sentence batch
+                device = self.configs.device
+                for features in self._get_aux_ref_features(existing_paths):
+                    audio_16k = features.get("audio_16k", None)
+                    sv_emb = features.get("sv_emb", None)
+                    self.prompt_cache["refer_spec"].append(
+                        (features["refer_spec"].to(device), audio_16k.to(device) if audio_16k is not None else None)
+                    )
+                    self.prompt_cache["aux_sv_emb"].append(sv_emb.to(device) if sv_emb is not None else None)
+
+            if not no_prompt_text:
+                prompt_text = self._normalize_prompt_text(prompt_text, prompt_lang)
+                logger.info(f"{i18n('实际输入的参考文本:')} {prompt_text}")
+                if (
+                    self.prompt_cache["prompt_text"] != prompt_text
+                    or self.prompt_cache["prompt_lang"] != prompt_lang
+                    or self.prompt_cache["prompt_version"] != self.configs.version
+                ):
+                    ref_path = self.prompt_cache["ref_audio_path"]
+                    phones, bert_features, norm_text = self._get_prompt_text_features(
+                        prompt_text, prompt_lang, self.ref_features_sidecar(ref_path) if ref_path else None
+                    )
+                    self.prompt_cache["prompt_text"] = prompt_text
+                    self.prompt_cache["prompt_lang"] = prompt_lang
+                    self.prompt_cache["prompt_version"] = self.configs.version
+                    self.prompt_cache["phones"] = phones
+                    self.prompt_cache["bert_features"] = bert_features
+                    self.prompt_cache["norm_text"] = norm_text
+                    self.prompt_cache["text_key"] = self._prompt_text_key(prompt_text, prompt_lang)
+            prompt_cache = self._snapshot_prompt_cache()
+
+        # embeddings of the reference prompt shared by all sentences (and requests) using it
+        prompt_prefix = None
+        if not no_prompt_text and parallel_infer:
+            prompt_prefix = t2s_model.get_prompt_prefix(
+                make_key("t2s_prefix", prompt_cache["ref_key"], prompt_cache["text_key"]),
+                prompt_cache["phones"],
+                prompt_cache["bert_features"].to(dtype=self.precision),
+                prompt_cache["prompt_semantic"],
+            )
 
         ###### text preprocessing ########
         t1 = time.perf_counter()
@@ -1136,7 +1544,7 @@ class TTS:
             batch_index_list: list = None
             data, batch_index_list = self.to_batch(
                 data,
-                prompt_data=self.prompt_cache if not no_prompt_text else None,
+                prompt_data=prompt_cache if not no_prompt_text else None,
                 batch_size=batch_size,
                 threshold=batch_threshold,
                 split_bucket=split_bucket,
@@ -1155,10 +1563,8 @@ class TTS:
             def make_batch(batch_texts):
                 batch_data = []
                 logger.info(f"############ {i18n('提取文本Bert特征')} ############")
-                for text in tqdm(batch_texts):
-                    phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
-                        text, text_lang, self.configs.version
-                    )
+                features = self.text_preprocessor.extract_features(batch_texts, text_lang, self.configs.version)
+                for phones, bert_features, norm_text in features:
                     if phones is None:
                         continue
                     res = {
@@ -1171,7 +1577,7 @@ class TTS:
                     return None
                 batch, _ = self.to_batch(
                     batch_data,
-                    prompt_data=self.prompt_cache if not no_prompt_text else None,
+                    prompt_data=prompt_cache if not no_prompt_text else None,
                     batch_size=batch_size,
                     threshold=batch_threshold,
                     split_bucket=False,
@@ -1204,16 +1610,58 @@ class TTS:
                 norm_text: str = item["norm_text"]
                 max_len = item["max_len"]
 
-                logger.info(i18n("前端处理后的文本(每句):"), norm_text)
+                logger.info(f"{i18n('前端处理后的文本(每句):')} {norm_text}")
                 if no_prompt_text:
                     prompt = None
+                    max_new_tokens = None
                 else:
                     prompt = (
-                        self.prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
+                        prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
                     )
+                    max_new_tokens = self._token_budget(prompt_cache, batch_phones)
+
+                if stream_chunk_tokens > 0:
+                    logger.info(f"############ {i18n('预测语义Token')} ############")
+                    refer_audio_spec, sv_emb = self._get_refer_audio_spec(prompt_cache)
+                    t2s_stream = t2s_model.infer_panel_stream(
+                        all_phoneme_ids,
+                        all_phoneme_lens,
+                        prompt,
+                        all_bert_features,
+                        top_k=top_k,
+                        top_p=top_p,
+                        temperature=temperature,
+                        early_stop_num=self.configs.hz * self.configs.max_sec,
+                        max_len=max_len,
+                        repetition_penalty=repetition_penalty,
+                        chunk_tokens=stream_chunk_tokens,
+                        prompt_prefix=prompt_prefix,
+                        eos_sync_every=self.configs.t2s_eos_sync_every,
+                        max_new_tokens=max_new_tokens,
+                        loop_window=self.configs.t2s_loop_window,
+                    )
+                    t2s_stream = autocast_iter(t2s_stream, t2s_model.cpu_precision)
+                    for audio_chunk in self._stream_sentence(
+                        t2s_stream,
+                        batch_phones[0],
+                        refer_audio_spec,
+                        sv_emb,
+                        speed_factor,
+                        stream_overlap_tokens,
+                        stream_context_tokens,
+                        fragment_interval,
+                    ):
+                        yield output_sr, audio_chunk
+                        if self.stop_flag:
+                            break
+                    t_34 += time.perf_counter() - t3
+                    if self.stop_flag:
+                        yield 16000, np.zeros(int(16000), dtype=np.int16)
+                        return
+                    continue
 
                 logger.info(f"############ {i18n('预测语义Token')} ############")
-                pred_semantic_list, idx_list = self.t2s_model.model.infer_panel(
+                pred_semantic_list, idx_list = infer_panel(
                     all_phoneme_ids,
                     all_phoneme_lens,
                     prompt,
@@ -1225,37 +1673,47 @@ class TTS:
                     early_stop_num=self.configs.hz * self.configs.max_sec,
                     max_len=max_len,
                     repetition_penalty=repetition_penalty,
+                    prompt_prefix=prompt_prefix,
+                    eos_sync_every=self.configs.t2s_eos_sync_every,
+                    max_new_tokens=max_new_tokens,
+                    loop_window=self.configs.t2s_loop_window,
                 )
                 t4 = time.perf_counter()
                 t_34 += t4 - t3
 
-                refer_audio_spec = []
-                if self.is_v2pro:
-                    sv_emb = []
-                for spec, audio_tensor in self.prompt_cache["refer_spec"]:
-                    spec = spec.to(dtype=self.precision, device=self.configs.device)
-                    refer_audio_spec.append(spec)
-                    if self.is_v2pro:
-                        sv_emb_single = self.sv_model.compute_embedding3(audio_tensor)
-                        sv_emb.append(sv_emb_single.to(dtype=self.precision))
+                if vocoder_stream:
+                    logger.info(f"############ {i18n('合成音频')} ############")
+                    for audio_chunk in self.using_vocoder_synthesis_stream(
+                        pred_semantic_list[0][-idx_list[0] :].unsqueeze(0).unsqueeze(0),
+                        batch_phones[0].unsqueeze(0).to(self.configs.device),
+                        speed=speed_factor,
+                        sample_steps=sample_steps,
+                        prompt_cache=prompt_cache,
+                        fragment_interval=fragment_interval,
+                    ):
+                        yield output_sr, audio_chunk
+                        if self.stop_flag:
+                            break
+                    t_45 += time.perf_counter() - t4
+                    if self.stop_flag:
+                        yield 16000, np.zeros(int(16000), dtype=np.int16)
+                        return
+                    continue
+
+                refer_audio_spec, sv_emb = self._get_refer_audio_spec(prompt_cache)
 
                 batch_audio_fragment = []
 
-                # ## vits并行推理 method 1
-                # pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
-                # pred_semantic_len = torch.LongTensor([item.shape[0] for item in pred_semantic_list]).to(self.configs.device)
-                # pred_semantic = self.batch_sequences(pred_semantic_list, axis=0, pad_value=0).unsqueeze(0)
-                # max_len = 0
-                # for i in range(0, len(batch_phones)):
-                #     max_len = max(max_len, batch_phones[i].shape[-1])
-                # batch_phones = self.batch_sequences(batch_phones, axis=0, pad_value=0, max_length=max_len)
-                # batch_phones = batch_phones.to(self.configs.device)
-                # batch_audio_fragment = (self.vits_model.batched_decode(
-                #         pred_semantic, pred_semantic_len, batch_phones, batch_phones_len,refer_audio_spec
-                #     ))
                 logger.info(f"############ {i18n('合成音频')} ############")
                 if not self.configs.use_vocoder:
-                    if speed_factor == 1.0:
+                    if speed_factor == 1.0 and self.configs.sovits_padded_decode:
+                        logger.info(f"{i18n('并行合成中')}...")
+                        # ## vits并行推理 method 1
+                        pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
+                        batch_audio_fragment = self.padded_vits_decode(
+                            pred_semantic_list, batch_phones, refer_audio_spec, sv_emb
+                        )
+                    elif speed_factor == 1.0:
                         logger.info(f"{i18n('并行合成中')}...")
                         # ## vits并行推理 method 2
                         pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
@@ -1302,7 +1760,12 @@ class TTS:
                     if parallel_infer:
                         logger.info(f"{i18n('并行合成中')}...")
                         audio_fragments = self.using_vocoder_synthesis_batched_infer(
-                            idx_list, pred_semantic_list, batch_phones, speed=speed_factor, sample_steps=sample_steps
+                            idx_list,
+                            pred_semantic_list,
+                            batch_phones,
+                            speed=speed_factor,
+                            sample_steps=sample_steps,
+                            prompt_cache=prompt_cache,
                         )
                         batch_audio_fragment.extend(audio_fragments)
                     else:
@@ -1312,7 +1775,11 @@ class TTS:
                                 pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
                             )  # .unsqueeze(0)#mq要多unsqueeze一次
                             audio_fragment = self.using_vocoder_synthesis(
-                                _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
+                                _pred_semantic,
+                                phones,
+                                speed=speed_factor,
+                                sample_steps=sample_steps,
+                                prompt_cache=prompt_cache,
                             )
                             batch_audio_fragment.append(audio_fragment)
 
@@ -1355,17 +1822,106 @@ class TTS:
             logger.exception("发生错误!")
             # 必须返回一个空音频, 否则会导致显存不释放。
             yield 16000, np.zeros(int(16000), dtype=np.int16)
-            # 重置模型, 否则会导致显存释放不完全。
-            del self.t2s_model
-            del self.vits_model
-            self.t2s_model = None
-            self.vits_model = None
-            self.init_t2s_weights(self.configs.t2s_weights_path)
-            self.init_vits_weights(self.configs.vits_weights_path)
+            # 不再重载模型: 模型由并发的请求与调度器共用(常驻模型池), 出错的请求不会改动权重,
+            # 重载会让其他进行中的请求一起失败。显存由 finally 中的 empty_cache 释放。
             raise e
         finally:
             self.empty_cache()
 
+    def _token_budget(self, prompt_cache: dict, batch_phones: List[torch.LongTensor]) -> Optional[List[int]]:
+        """Per sentence semantic token budget of t2s_budget_factor (see token_budget), None when disabled."""
+        if prompt_cache["prompt_semantic"] is None or not prompt_cache["phones"]:
+            return None
+        return token_budget(
+            [phones.shape[-1] for phones in batch_phones],
+            len(prompt_cache["phones"]),
+            prompt_cache["prompt_semantic"].shape[-1],
+            self.configs.t2s_budget_factor,
+        )
+
+    def _get_refer_audio_spec(self, prompt_cache: dict):
+        """Reference spectrograms (and v2Pro speaker embeddings, else None) of a prompt_cache snapshot for vits_model.decode."""
+        refer_audio_spec = []
+        sv_emb = [] if self.is_v2pro else None
+        for i, (spec, audio_tensor) in enumerate(prompt_cache["refer_spec"]):
+            spec = spec.to(dtype=self.precision, device=self.configs.device)
+            refer_audio_spec.append(spec)
+            if self.is_v2pro:
+                if i == 0:
+                    sv_emb_single = prompt_cache["sv_emb"]
+                elif i - 1 < len(prompt_cache["aux_sv_emb"]):
+                    sv_emb_single = prompt_cache["aux_sv_emb"][i - 1]
+                else:
+                    sv_emb_single = None
+                if sv_emb_single is None:
+                    sv_emb_single = self.sv_model.compute_embedding3(audio_tensor)
+                sv_emb.append(sv_emb_single.to(dtype=self.precision))
+        return refer_audio_spec, sv_emb
+
+    def _stream_sentence(
+        self,
+        t2s_stream,
+        phones: torch.LongTensor,
+        refer_audio_spec: List[torch.Tensor],
+        sv_emb: Optional[List[torch.Tensor]],
+        speed_factor: float = 1.0,
+        overlap_tokens: int = 4,
+        context_tokens: int = 24,
+        fragment_interval: float = 0.3,
+    ):
+        """
+        Synthesize one sentence while its semantic tokens are being decoded.
+
+        Every window of new tokens from t2s_stream (see Text2SemanticDecoder.infer_panel_stream) is
+        decoded by the SoVITS model together with up to `overlap_tokens + context_tokens` previous
+        tokens. The audio of the context tokens is dropped, and the audio of the overlap tokens is
+        stitched to the withheld tail of the previous window with sola_algorithm.
+
+        Args:
+            t2s_stream: generator of (tokens so far, finished).
+            phones: LongTensor, phones of the sentence.
+            refer_audio_spec, sv_emb: see _get_refer_audio_spec().
+        Yields:
+            np.ndarray: int16 audio chunks, the last one is followed by fragment_interval seconds of silence.
+        """
+        phones = phones.unsqueeze(0).to(self.configs.device)
+        pending = None  # audio of the last overlap_tokens of the previous window, not sent yet
+        start = 0  # first token without audio
+        for tokens, finished in t2s_stream:
+            end = tokens.shape[0]
+            if end <= start and not finished:
+                continue
+            keep_from = max(0, start - overlap_tokens)
+            begin = max(0, keep_from - context_tokens)
+            codes = tokens[begin:end].view(1, 1, -1).to(self.configs.device)
+            if self.is_v2pro:
+                audio = self.vits_model.decode(codes, phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb)
+            else:
+                audio = self.vits_model.decode(codes, phones, refer_audio_spec, speed=speed_factor)
+            audio = audio.detach()[0, 0, :]
+            samples_per_token = audio.shape[0] / max(end - begin, 1)
+            audio = audio[int(round((keep_from - begin) * samples_per_token)) :]
+            if pending is not None and 1 < pending.shape[0] <= audio.shape[0]:
+                audio = self.sola_algorithm([pending, audio], pending.shape[0])
+            elif pending is not None:
+                audio = torch.cat([pending, audio], dim=0)
+
+            if finished:
+                silence = torch.zeros(
+                    int(self.configs.sampling_rate * fragment_interval), dtype=audio.dtype, device=audio.device
+                )
+                yield self._to_int16(torch.cat([audio, silence], dim=0))
+                return
+            tail = min(int(round(overlap_tokens * samples_per_token)), audio.shape[0])
+            pending = audio[audio.shape[0] - tail :].clone()
+            start = end
+            if audio.shape[0] > tail:
+                yield self._to_int16(audio[: audio.shape[0] - tail])
+
+    @staticmethod
+    def _to_int16(audio: torch.Tensor) -> np.ndarray:
+        return (audio.float().clamp(-1, 1).cpu().numpy() * 32767).astype(np.int16)
+
     def empty_cache(self):
         try:
             gc.collect()  # 触发gc的垃圾回收。避免内存一直增长。
@@ -1430,19 +1986,105 @@ class TTS:
 
         return sr, audio
 
-    def using_vocoder_synthesis(
-        self, semantic_tokens: torch.Tensor, phones: torch.Tensor, speed: float = 1.0, sample_steps: int = 32
-    ):
-        prompt_semantic_tokens = self.prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
-        prompt_phones = torch.LongTensor(self.prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
-        raw_entry = self.prompt_cache["refer_spec"][0]
+    def padded_vits_decode(
+        self,
+        pred_semantic_list: List[torch.LongTensor],
+        batch_phones: List[torch.LongTensor],
+        refer_audio_spec: List[torch.Tensor],
+        sv_emb: List[torch.Tensor] = None,
+    ) -> List[torch.Tensor]:
+        """
+        Decode a batch of sentences with the SoVITS model (v1/v2/v2Pro) as one padded, masked batch.
+            The cost grows with batch size x longest sentence instead of the square of the concatenated length,
+            and no sentence attends to the tokens or phones of its neighbours.
+        Args:
+            pred_semantic_list: list of LongTensor (T,), the semantic tokens of every sentence.
+            batch_phones: list of LongTensor (T_text,), the phones of every sentence.
+            refer_audio_spec: list of reference spectrograms, see _get_refer_audio_spec.
+            sv_emb: list of speaker embeddings (v2Pro).
+        Returns:
+            list of waveforms (T_wav,), one per sentence.
+        """
+        device = self.configs.device
+        codes_lengths = torch.LongTensor([item.shape[0] for item in pred_semantic_list]).to(device)
+        text_lengths = torch.LongTensor([item.shape[-1] for item in batch_phones]).to(device)
+        codes = self.batch_sequences(pred_semantic_list, axis=0, pad_value=0).unsqueeze(0).to(device)
+        phones = self.batch_sequences(batch_phones, axis=0, pad_value=0).to(device)
+        audio_fragments = self.vits_model.batched_decode(
+            codes, codes_lengths, phones, text_lengths, refer_audio_spec, sv_emb=sv_emb
+        )
+        return [audio_fragment.detach() for audio_fragment in audio_fragments]
+
+    def cfm_inference(
+        self, fea: torch.Tensor, mel2: torch.Tensor, sample_steps: int, prompt_cache: dict
+    ) -> torch.Tensor:
+        """
+        Run the CFM of the v3/v4 model with the configured solver, timestep schedule and early stop.
+            The first adaptive run of a reference caches the number of steps it took in prompt_cache["cfm_steps"],
+            later chunks of the same reference run that many steps without the per-step convergence check (a host sync).
+        Args:
+            fea: (B, T, C) features of the reference plus the chunk.
+            mel2: (1, n_mels, T_ref) normalized mel spectrogram of the reference.
+            sample_steps: int, number of steps of the timestep schedule.
+            prompt_cache: dict, see _snapshot_prompt_cache.
+        Returns:
+            (B, n_mels, T) normalized mel spectrogram.
+        """
+        configs = self.configs
+        key = (prompt_cache["vits_key"], sample_steps, configs.cfm_solver, configs.cfm_sway, configs.cfm_adaptive_tol)
+        max_steps = prompt_cache["cfm_steps"].get(key, None) if configs.cfm_adaptive_tol > 0 else None
+        pred_spec, steps = self.vits_model.cfm.inference(
+            fea,
+            torch.LongTensor([fea.size(1)]).to(fea.device),
+            mel2,
+            sample_steps,
+            inference_cfg_rate=0,
+            solver=configs.cfm_solver,
+            sway=configs.cfm_sway,
+            adaptive_tol=configs.cfm_adaptive_tol if max_steps is None else 0.0,
+            max_steps=max_steps,
+            return_steps=True,
+        )
+        if configs.cfm_adaptive_tol > 0 and max_steps is None:
+            prompt_cache["cfm_steps"][key] = steps
+        return pred_spec
+
+    def _get_vocoder_prompt(self, prompt_cache: dict):
+        """
+        Prompt conditioning of the v3/v4 CFM: the reference features and the normalized reference mel,
+            both trimmed to the last T_min <= T_ref frames.
+            It only depends on the reference audio, the prompt text and the SoVITS model, so it is computed once
+            and kept in prompt_cache["vocoder_prompt"] (reset by set_ref_audio). Callers must not modify the tensors.
+        Returns:
+            refer_audio_spec, fea_ref (1, C, T_min), ge, mel2 (1, n_mels, T_min), T_min
+        """
+        key = (
+            prompt_cache["vits_key"],
+            prompt_cache["text_key"],
+            self.configs.version,
+            self.precision,
+            self.vocoder_configs["T_ref"],
+        )
+        memo = prompt_cache["vocoder_prompt"].get(key, None)
+        if memo is None:
+            memo = self._compute_vocoder_prompt(prompt_cache)
+            if len(prompt_cache["vocoder_prompt"]) >= 8:
+                prompt_cache["vocoder_prompt"].clear()
+            prompt_cache["vocoder_prompt"][key] = memo
+        return memo
+
+    @torch.no_grad()
+    def _compute_vocoder_prompt(self, prompt_cache: dict):
+        prompt_semantic_tokens = prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
+        prompt_phones = torch.LongTensor(prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
+        raw_entry = prompt_cache["refer_spec"][0]
         if isinstance(raw_entry, tuple):
             raw_entry = raw_entry[0]
         refer_audio_spec = raw_entry.to(dtype=self.precision, device=self.configs.device)
 
         fea_ref, ge = self.vits_model.decode_encp(prompt_semantic_tokens, prompt_phones, refer_audio_spec)
-        ref_audio: torch.Tensor = self.prompt_cache["raw_audio"]
-        ref_sr = self.prompt_cache["raw_sr"]
+        ref_audio: torch.Tensor = prompt_cache["raw_audio"]
+        ref_sr = prompt_cache["raw_sr"]
         ref_audio = ref_audio.to(self.configs.device).float()
         if ref_audio.shape[0] == 2:
             ref_audio = ref_audio.mean(0).unsqueeze(0)
@@ -1458,14 +2100,25 @@ class TTS:
         mel2 = mel2[:, :, :T_min]
         fea_ref = fea_ref[:, :, :T_min]
         T_ref = self.vocoder_configs["T_ref"]
-        T_chunk = self.vocoder_configs["T_chunk"]
         if T_min > T_ref:
             mel2 = mel2[:, :, -T_ref:]
             fea_ref = fea_ref[:, :, -T_ref:]
             T_min = T_ref
-        chunk_len = T_chunk - T_min
 
         mel2 = mel2.to(self.precision)
+        return refer_audio_spec, fea_ref, ge, mel2, T_min
+
+    def using_vocoder_synthesis(
+        self,
+        semantic_tokens: torch.Tensor,
+        phones: torch.Tensor,
+        speed: float = 1.0,
+        sample_steps: int = 32,
+        prompt_cache: dict = None,
+    ):
+        prompt_cache = self.prompt_cache if prompt_cache is None else prompt_cache
+        refer_audio_spec, fea_ref, ge, mel2, T_min = self._get_vocoder_prompt(prompt_cache)
+        chunk_len = self.vocoder_configs["T_chunk"] - T_min
         fea_todo, ge = self.vits_model.decode_encp(semantic_tokens, phones, refer_audio_spec, ge, speed)
 
         cfm_resss = []
@@ -1477,9 +2130,7 @@ class TTS:
             idx += chunk_len
             fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
 
-            cfm_res = self.vits_model.cfm.inference(
-                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
-            )
+            cfm_res = self.cfm_inference(fea, mel2, sample_steps, prompt_cache)
             cfm_res = cfm_res[:, :, mel2.shape[2] :]
 
             mel2 = cfm_res[:, :, -T_min:]
@@ -1489,12 +2140,92 @@ class TTS:
         cfm_res = torch.cat(cfm_resss, 2)
         cfm_res = denorm_spec(cfm_res)
 
-        with torch.inference_mode():
-            wav_gen = self.vocoder(cfm_res)
-            audio = wav_gen[0][0]  # .cpu().detach().numpy()
+        audio = self._vocode(cfm_res)
 
         return audio
 
+    def using_vocoder_synthesis_stream(
+        self,
+        semantic_tokens: torch.Tensor,
+        phones: torch.Tensor,
+        speed: float = 1.0,
+        sample_steps: int = 32,
+        prompt_cache: dict = None,
+        fragment_interval: float = 0.3,
+    ):
+        """
+        using_vocoder_synthesis() as a generator: every CFM chunk is vocoded on a background thread as soon as it
+            is sampled, while the CFM samples the next chunk, so at most one chunk waits for the vocoder.
+            The chunks go through one ChunkedVocoder, the audio of the last frames of a chunk waits for the
+            right context from the next one.
+        Yields:
+            np.ndarray: int16 audio chunks, the last one is followed by fragment_interval seconds of silence.
+        """
+        prompt_cache = self.prompt_cache if prompt_cache is None else prompt_cache
+        refer_audio_spec, fea_ref, ge, mel2, T_min = self._get_vocoder_prompt(prompt_cache)
+        chunk_len = self.vocoder_configs["T_chunk"] - T_min
+        fea_todo, ge = self.vits_model.decode_encp(semantic_tokens, phones, refer_audio_spec, ge, speed)
+        vocoder = self._chunked_vocoder(self.configs.vocoder_window_frames or chunk_len)
+
+        pending = None
+        for idx in range(0, fea_todo.shape[2], chunk_len):
+            fea_todo_chunk = fea_todo[:, :, idx : idx + chunk_len]
+            fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
+
+            cfm_res = self.cfm_inference(fea, mel2, sample_steps, prompt_cache)
+            cfm_res = cfm_res[:, :, mel2.shape[2] :]
+
+            mel2 = cfm_res[:, :, -T_min:]
+            fea_ref = fea_todo_chunk[:, :, -T_min:]
+
+            future = self._vocode_async(vocoder, denorm_spec(cfm_res))
+            if pending is not None and pending.result().shape[0] > 0:
+                yield pending.result()
+            pending = future
+
+        last = self._vocode_async(vocoder, None).result()
+        if pending is not None:
+            last = np.concatenate([pending.result(), last])
+        silence = np.zeros(int(self.vocoder_configs["sr"] * fragment_interval), dtype=np.int16)
+        yield np.concatenate([last, silence])
+
+    def _chunked_vocoder(self, window_frames: int) -> ChunkedVocoder:
+        """A ChunkedVocoder of the current vocoder, its context is the receptive field measured once per vocoder."""
+        upsample_rate = self.vocoder_configs["upsample_rate"]
+        if self._vocoder_context is None:
+            self._vocoder_context = receptive_field(self.vocoder, 100, upsample_rate)
+        return ChunkedVocoder(self.vocoder, upsample_rate, window_frames, self._vocoder_context)
+
+    def _vocode(self, mel: torch.Tensor) -> torch.Tensor:
+        """Vocode mel (1, n_mels, T) in windows of vocoder_window_frames, in one pass if that is 0 or not shorter."""
+        window_frames = self.configs.vocoder_window_frames
+        if window_frames <= 0 or mel.shape[2] <= window_frames:
+            with torch.inference_mode():
+                return self.vocoder(mel)[0][0]
+        return torch.cat(list(self._chunked_vocoder(window_frames)(mel)))
+
+    def _vocode_async(self, vocoder: ChunkedVocoder, mel: Optional[torch.Tensor]) -> Future:
+        """vocoder.feed(mel), or vocoder.flush() if mel is None, on the vocoder thread. Future of int16 audio."""
+        if self._vocoder_executor is None:
+            self._vocoder_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vocoder")
+        device = torch.device(self.configs.device)
+        producer = torch.cuda.current_stream(device) if device.type == "cuda" else None
+
+        def vocode() -> np.ndarray:
+            with torch.inference_mode():
+                if producer is None:
+                    return self._to_int16(vocoder.feed(mel) if mel is not None else vocoder.flush())
+                if self._vocoder_stream is None:
+                    self._vocoder_stream = torch.cuda.Stream(device)
+                self._vocoder_stream.wait_stream(producer)
+                if mel is not None:
+                    mel.record_stream(self._vocoder_stream)
+                with torch.cuda.stream(self._vocoder_stream):
+                    # the copy to host in _to_int16 waits for this stream only
+                    return self._to_int16(vocoder.feed(mel) if mel is not None else vocoder.flush())
+
+        return self._vocoder_executor.submit(vocode)
+
     def using_vocoder_synthesis_batched_infer(
         self,
         idx_list: List[int],
@@ -1502,40 +2233,11 @@ class TTS:
         batch_phones: List[torch.Tensor],
         speed: float = 1.0,
         sample_steps: int = 32,
+        prompt_cache: dict = None,
     ) -> List[torch.Tensor]:
-        prompt_semantic_tokens = self.prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
-        prompt_phones = torch.LongTensor(self.prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
-        raw_entry = self.prompt_cache["refer_spec"][0]
-        if isinstance(raw_entry, tuple):
-            raw_entry = raw_entry[0]
-        refer_audio_spec = raw_entry.to(dtype=self.precision, device=self.configs.device)
-
-        fea_ref, ge = self.vits_model.decode_encp(prompt_semantic_tokens, prompt_phones, refer_audio_spec)
-        ref_audio: torch.Tensor = self.prompt_cache["raw_audio"]
-        ref_sr = self.prompt_cache["raw_sr"]
-        ref_audio = ref_audio.to(self.configs.device).float()
-        if ref_audio.shape[0] == 2:
-            ref_audio = ref_audio.mean(0).unsqueeze(0)
-
-        # tgt_sr = self.vocoder_configs["sr"]
-        tgt_sr = 24000 if self.configs.version == "v3" else 32000
-        if ref_sr != tgt_sr:
-            ref_audio = resample(ref_audio, ref_sr, tgt_sr, self.configs.device)
-
-        mel2 = mel_fn(ref_audio) if self.configs.version == "v3" else mel_fn_v4(ref_audio)
-        mel2 = norm_spec(mel2)
-        T_min = min(mel2.shape[2], fea_ref.shape[2])
-        mel2 = mel2[:, :, :T_min]
-        fea_ref = fea_ref[:, :, :T_min]
-        T_ref = self.vocoder_configs["T_ref"]
-        T_chunk = self.vocoder_configs["T_chunk"]
-        if T_min > T_ref:
-            mel2 = mel2[:, :, -T_ref:]
-            fea_ref = fea_ref[:, :, -T_ref:]
-            T_min = T_ref
-        chunk_len = T_chunk - T_min
-
-        mel2 = mel2.to(self.precision)
+        prompt_cache = self.prompt_cache if prompt_cache is None else prompt_cache
+        refer_audio_spec, fea_ref, ge, mel2, T_min = self._get_vocoder_prompt(prompt_cache)
+        chunk_len = self.vocoder_configs["T_chunk"] - T_min
 
         # #### batched inference
         overlapped_len = self.vocoder_configs["overlapped_len"]
@@ -1576,9 +2278,7 @@ class TTS:
         bs = feat_chunks.shape[0]
         fea_ref = fea_ref.repeat(bs, 1, 1)
         fea = torch.cat([fea_ref, feat_chunks], 2).transpose(2, 1)
-        pred_spec = self.vits_model.cfm.inference(
-            fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
-        )
+        pred_spec = self.cfm_inference(fea, mel2, sample_steps, prompt_cache)
         pred_spec = pred_spec[:, :, -chunk_len:]
         dd = pred_spec.shape[1]
         pred_spec = pred_spec.permute(1, 0, 2).contiguous().view(dd, -1).unsqueeze(0)
@@ -1586,9 +2286,7 @@ class TTS:
 
         pred_spec = denorm_spec(pred_spec)
 
-        with torch.no_grad():
-            wav_gen = self.vocoder(pred_spec)
-            audio = wav_gen[0][0]  # .cpu().detach().numpy()
+        audio = self._vocode(pred_spec)
 
         audio_fragments = []
         upsample_rate = self.vocoder_configs["upsample_rate"]
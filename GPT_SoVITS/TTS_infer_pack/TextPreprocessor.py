@@ -2,8 +2,6 @@ import os
 import sys
 import threading
 
-from tqdm import tqdm
-
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 
@@ -11,11 +9,13 @@ import re
 import torch
 from text.LangSegmenter import LangSegmenter
 from text import chinese
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from text.cleaner import clean_text
 from text import cleaned_text_to_sequence
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from TTS_infer_pack.text_segmentation_method import split_big_text, splits, get_method as get_seg_method
+from TTS_infer_pack.bert_batcher import BertBatcher
+from TTS_infer_pack.text_cache import TextFeatureCache
 
 from tools.i18n.i18n import I18nAuto, scan_language_list
 
@@ -50,11 +50,22 @@ def merge_short_text_in_array(texts: str, threshold: int) -> list:
 
 
 class TextPreprocessor:
-    def __init__(self, bert_model: AutoModelForMaskedLM, tokenizer: AutoTokenizer, device: torch.device):
+    def __init__(
+        self,
+        bert_model: AutoModelForMaskedLM,
+        tokenizer: AutoTokenizer,
+        device: torch.device,
+        text_cache: Optional[TextFeatureCache] = None,
+    ):
         self.bert_model = bert_model
         self.tokenizer = tokenizer
         self.device = device
-        self.bert_lock = threading.RLock()
+        self.text_cache = text_cache
+        # the text frontends (g2p) are not thread safe, BERT runs outside of this lock, batched by bert_batcher
+        self.frontend_lock = threading.RLock()
+        # padded tokens (segments x longest segment) of one BERT forward
+        self.bert_batch_tokens = 8192
+        self.bert_batcher = BertBatcher(self.get_bert_features)
 
     def preprocess(self, text: str, lang: str, text_split_method: str, version: str = "v2") -> List[Dict]:
         print(f"############ {i18n('切分文本')} ############")
@@ -62,8 +73,7 @@ class TextPreprocessor:
         texts = self.pre_seg_text(text, lang, text_split_method)
         result = []
         print(f"############ {i18n('提取文本Bert特征')} ############")
-        for text in tqdm(texts):
-            phones, bert_features, norm_text = self.segment_and_extract_feature_for_text(text, lang, version)
+        for phones, bert_features, norm_text in self.extract_features(texts, lang, version):
             if phones is None or norm_text == "":
                 continue
             res = {
@@ -119,93 +129,197 @@ class TextPreprocessor:
     ) -> Tuple[list, torch.Tensor, str]:
         return self.get_phones_and_bert(text, language, version)
 
+    def extract_features(
+        self, texts: List[str], language: str, version: str = "v1"
+    ) -> List[Tuple[list, torch.Tensor, str]]:
+        """segment_and_extract_feature_for_text of every text, with the BERT features of all texts in one batch."""
+        return self.get_phones_and_bert_batch(texts, language, version)
+
     def get_phones_and_bert(self, text: str, language: str, version: str, final: bool = False):
-        with self.bert_lock:
-            text = re.sub(r' {2,}', ' ', text)
-            textlist = []
-            langlist = []
-            if language == "all_zh":
-                for tmp in LangSegmenter.getTexts(text,"zh"):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "all_yue":
-                for tmp in LangSegmenter.getTexts(text,"zh"):
-                    if tmp["lang"] == "zh":
-                        tmp["lang"] = "yue"
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "all_ja":
-                for tmp in LangSegmenter.getTexts(text,"ja"):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "all_ko":
-                for tmp in LangSegmenter.getTexts(text,"ko"):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "en":
-                langlist.append("en")
-                textlist.append(text)
-            elif language == "auto":
-                for tmp in LangSegmenter.getTexts(text):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "auto_yue":
-                for tmp in LangSegmenter.getTexts(text):
-                    if tmp["lang"] == "zh":
-                        tmp["lang"] = "yue"
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            else:
-                for tmp in LangSegmenter.getTexts(text):
-                    if langlist:
-                        if (tmp["lang"] == "en" and langlist[-1] == "en") or (tmp["lang"] != "en" and langlist[-1] != "en"):
-                            textlist[-1] += tmp["text"]
-                            continue
-                    if tmp["lang"] == "en":
-                        langlist.append(tmp["lang"])
-                    else:
-                        # 因无法区别中日韩文汉字,以用户输入为准
-                        langlist.append(language)
-                    textlist.append(tmp["text"])
-            # print(textlist)
-            # print(langlist)
-            phones_list = []
+        return self.get_phones_and_bert_batch([text], language, version, final)[0]
+
+    def get_phones_and_bert_batch(
+        self, texts: List[str], language: str, version: str, final: bool = False
+    ) -> List[Tuple[list, torch.Tensor, str]]:
+        """
+        Phones, phone level BERT features (1024, phones) and normalized text of every text.
+
+        Texts found in text_cache skip the frontend. The others are cleaned one by one under frontend_lock,
+        then the zh segments of all of them go through BERT together (with the segments of concurrent callers,
+        see BertBatcher).
+        """
+        if self.text_cache is None or not self.text_cache.enabled:
+            return self._extract(texts, language, version, final)
+        keys = [self.text_cache.key(text, language, version, final) for text in texts]
+        result = [self.text_cache.get(key) for key in keys]
+        missing = [i for i in range(len(texts)) if result[i] is None]
+        if len(missing) > 0:
+            extracted = self._extract([texts[i] for i in missing], language, version, final)
+            for i, (phones, bert, norm_text) in zip(missing, extracted):
+                result[i] = self.text_cache.put(keys[i], phones, bert, norm_text)
+        return [(phones, bert.to(self.device), norm_text) for phones, bert, norm_text in result]
+
+    def _extract(
+        self, texts: List[str], language: str, version: str, final: bool = False
+    ) -> List[Tuple[list, torch.Tensor, str]]:
+        with self.frontend_lock:
+            split_list = [self.split_languages(text, language) for text in texts]
+            normalized = {}
+            if version != "v1":
+                # polyphones of every zh segment in one g2pW batch, imported here as clean_text does,
+                # loading g2pW only once it is needed. The normalized segments are passed on to clean_text
+                from text import chinese2
+
+                for textlist, langlist in split_list:
+                    for segment, lang in zip(textlist, langlist):
+                        if lang.replace("all_", "") == "zh" and segment not in normalized:
+                            normalized[segment] = chinese2.text_normalize(segment)
+                chinese2.prefetch(list(normalized.values()))
+            segments_list = [
+                self.clean_segments(text, language, version, final, split=split, normalized=normalized)
+                for text, split in zip(texts, split_list)
+            ]
+        features = iter(
+            self.bert_batcher(
+                [
+                    (norm_text, word2ph)
+                    for segments in segments_list
+                    for _, word2ph, norm_text, lang in segments
+                    if lang == "zh"
+                ]
+            )
+        )
+        result = []
+        for segments in segments_list:
             bert_list = []
-            norm_text_list = []
-            for i in range(len(textlist)):
-                lang = langlist[i]
-                phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang, version)
-                bert = self.get_bert_inf(phones, word2ph, norm_text, lang)
-                phones_list.append(phones)
-                norm_text_list.append(norm_text)
-                bert_list.append(bert)
+            for phones, _, _, lang in segments:
+                if lang == "zh":
+                    bert_list.append(next(features))
+                else:
+                    bert_list.append(torch.zeros((1024, len(phones)), dtype=torch.float32).to(self.device))
             bert = torch.cat(bert_list, dim=1)
-            phones = sum(phones_list, [])
-            norm_text = "".join(norm_text_list)
+            phones = sum([segment[0] for segment in segments], [])
+            norm_text = "".join([segment[2] for segment in segments])
+            result.append((phones, bert, norm_text))
+        return result
+
+    def clean_segments(
+        self,
+        text: str,
+        language: str,
+        version: str,
+        final: bool = False,
+        split: Optional[Tuple[List[str], List[str]]] = None,
+        normalized: Optional[Dict[str, str]] = None,
+    ) -> List[Tuple[list, list, str, str]]:
+        """
+        Split text by language and clean every segment, returns (phones, word2ph, norm_text, language) of each.
+        split: split_languages(text, language) when already known.
+        normalized: zh segment -> its text_normalize result, for segments already normalized.
+        """
+        textlist, langlist = split if split is not None else self.split_languages(text, language)
+        segments = []
+        for i in range(len(textlist)):
+            lang = langlist[i].replace("all_", "")
+            norm_text = normalized.get(textlist[i]) if normalized is not None and lang == "zh" else None
+            phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang, version, norm_text)
+            segments.append((phones, word2ph, norm_text, lang))
 
-            if not final and len(phones) < 6:
-                return self.get_phones_and_bert("." + text, language, version, final=True)
+        if not final and sum(len(segment[0]) for segment in segments) < 6:
+            return self.clean_segments("." + text, language, version, final=True)
 
-            return phones, bert, norm_text
+        return segments
+
+    def split_languages(self, text: str, language: str) -> Tuple[List[str], List[str]]:
+        """Split text into segments of one language each, returns (texts, languages)."""
+        text = re.sub(r' {2,}', ' ', text)
+        textlist = []
+        langlist = []
+        if language == "all_zh":
+            for tmp in LangSegmenter.getTexts(text,"zh"):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "all_yue":
+            for tmp in LangSegmenter.getTexts(text,"zh"):
+                if tmp["lang"] == "zh":
+                    tmp["lang"] = "yue"
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "all_ja":
+            for tmp in LangSegmenter.getTexts(text,"ja"):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "all_ko":
+            for tmp in LangSegmenter.getTexts(text,"ko"):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "en":
+            langlist.append("en")
+            textlist.append(text)
+        elif language == "auto":
+            for tmp in LangSegmenter.getTexts(text):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "auto_yue":
+            for tmp in LangSegmenter.getTexts(text):
+                if tmp["lang"] == "zh":
+                    tmp["lang"] = "yue"
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        else:
+            for tmp in LangSegmenter.getTexts(text):
+                if langlist:
+                    if (tmp["lang"] == "en" and langlist[-1] == "en") or (tmp["lang"] != "en" and langlist[-1] != "en"):
+                        textlist[-1] += tmp["text"]
+                        continue
+                if tmp["lang"] == "en":
+                    langlist.append(tmp["lang"])
+                else:
+                    # 因无法区别中日韩文汉字,以用户输入为准
+                    langlist.append(language)
+                textlist.append(tmp["text"])
+        # print(textlist)
+        # print(langlist)
+        return textlist, langlist
 
     def get_bert_feature(self, text: str, word2ph: list) -> torch.Tensor:
+        return self.bert_batcher([(text, word2ph)])[0]
+
+    def get_bert_features(self, items: List[Tuple[str, list]]) -> List[torch.Tensor]:
+        """
+        Phone level BERT features (1024, phones) of zh segments given as (norm_text, word2ph), on self.device.
+        The segments are sorted by length and run in padded batches of at most bert_batch_tokens tokens.
+        """
+        features = [None] * len(items)
+        order = sorted(range(len(items)), key=lambda i: len(items[i][0]), reverse=True)
+        start = 0
+        while start < len(order):
+            longest = len(items[order[start]][0]) + 2  # [CLS] and [SEP]
+            end = start + max(self.bert_batch_tokens // longest, 1)
+            batch = order[start:end]
+            for i, feature in zip(batch, self._bert_forward([items[i] for i in batch])):
+                features[i] = feature
+            start = end
+        return features
+
+    def _bert_forward(self, items: List[Tuple[str, list]]) -> List[torch.Tensor]:
         with torch.no_grad():
-            inputs = self.tokenizer(text, return_tensors="pt")
+            inputs = self.tokenizer([text for text, _ in items], padding=True, return_tensors="pt")
             for i in inputs:
                 inputs[i] = inputs[i].to(self.device)
             res = self.bert_model(**inputs, output_hidden_states=True)
-            res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
-        assert len(word2ph) == len(text)
-        phone_level_feature = []
-        for i in range(len(word2ph)):
-            repeat_feature = res[i].repeat(word2ph[i], 1)
-            phone_level_feature.append(repeat_feature)
-        phone_level_feature = torch.cat(phone_level_feature, dim=0)
-        return phone_level_feature.T
-
-    def clean_text_inf(self, text: str, language: str, version: str = "v2"):
+            hidden = res["hidden_states"][-3]
+        n_tokens = (inputs["attention_mask"].sum(dim=1) - 2).tolist()
+        features = []
+        for row, (text, word2ph) in enumerate(items):
+            assert len(word2ph) == len(text) and n_tokens[row] >= len(word2ph)
+            repeats = torch.tensor(word2ph, dtype=torch.long, device=hidden.device)
+            features.append(hidden[row, 1 : 1 + len(word2ph)].repeat_interleave(repeats, dim=0).T)
+        return features
+
+    def clean_text_inf(self, text: str, language: str, version: str = "v2", norm_text: Optional[str] = None):
         language = language.replace("all_", "")
-        phones, word2ph, norm_text = clean_text(text, language, version)
+        phones, word2ph, norm_text = clean_text(text, language, version, norm_text)
         phones = cleaned_text_to_sequence(phones, version)
         return phones, word2ph, norm_text
 
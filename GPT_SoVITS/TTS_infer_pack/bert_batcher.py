@@ -0,0 +1,72 @@
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import torch
+
+# (norm_text, word2ph) of one zh segment
+BertItem = Tuple[str, List[int]]
+
+
+class _BertRequest:
+    """The zh segments of one caller, and their phone level features once computed."""
+
+    def __init__(self, items: List[BertItem]):
+        self.items = items
+        self.features: Optional[List[torch.Tensor]] = None
+        self.error: Optional[BaseException] = None
+
+
+class BertBatcher:
+    """
+    Batches the BERT forwards of concurrent callers without a thread of its own.
+
+    A caller queues its segments, if no forward is running it becomes the leader: it takes the
+    segments of every queued caller (its own included), runs them with `run_batch` and hands the
+    results back. Callers arriving meanwhile queue up and wait, the next leader takes all of them
+    at once, so under load every forward covers the segments of several requests.
+
+    Args:
+        run_batch: callable, list of (norm_text, word2ph) -> list of phone level features (1024, phones),
+            it splits the list into forwards of its own.
+    """
+
+    def __init__(self, run_batch: Callable[[List[BertItem]], List[torch.Tensor]]):
+        self.run_batch = run_batch
+        self._pending: List[_BertRequest] = []
+        self._busy = False
+        self._cond = threading.Condition()
+
+    def __call__(self, items: List[BertItem]) -> List[torch.Tensor]:
+        if len(items) == 0:
+            return []
+        request = _BertRequest(items)
+        with self._cond:
+            self._pending.append(request)
+            while request.features is None and request.error is None:
+                if self._busy:
+                    self._cond.wait()
+                    continue
+                self._busy = True
+                requests, self._pending = self._pending, []
+                self._cond.release()
+                try:
+                    self._run(requests)
+                finally:
+                    self._cond.acquire()
+                    self._busy = False
+                    self._cond.notify_all()
+        if request.error is not None:
+            raise request.error
+        return request.features
+
+    def _run(self, requests: List[_BertRequest]) -> None:
+        try:
+            features = self.run_batch([item for request in requests for item in request.items])
+        except Exception as e:
+            for request in requests:
+                request.error = e
+            return
+        start = 0
+        for request in requests:
+            request.features = features[start : start + len(request.items)]
+            start += len(request.items)
@@ -0,0 +1,137 @@
+from typing import Iterator, Optional
+
+import torch
+
+
+@torch.inference_mode()
+def receptive_field(vocoder: torch.nn.Module, n_mels: int, upsample_rate: int, max_frames: int = 64) -> int:
+    """
+    Number of mel frames on each side of a frame that change its audio, measured by perturbing the
+    middle frame of a constant mel, at most max_frames.
+
+    Works for any stack of convolutions (BigVGAN, module.models.Generator): the padding at the edges of a
+    window spreads inward exactly as far as a perturbation does.
+    """
+    param = next(vocoder.parameters())
+    frames = 2 * max_frames + 1
+    mel = torch.full((1, n_mels, frames), -4.0, dtype=param.dtype, device=param.device)
+    perturbed = mel.clone()
+    perturbed[:, :, max_frames] += 1.0
+    diff = (vocoder(perturbed) - vocoder(mel))[0, 0].float().abs()
+    diff = diff[: frames * upsample_rate].view(frames, upsample_rate).amax(dim=1)
+    changed = torch.nonzero(diff > diff.max() * 1e-4).flatten()
+    if changed.numel() == 0:
+        return 1
+    radius = int(max(max_frames - changed.min().item(), changed.max().item() - max_frames))
+    return min(radius + 1, max_frames)
+
+
+class ChunkedVocoder:
+    """
+    Vocode a mel spectrogram in windows of `window_frames` frames, each one with `context_frames` frames of
+    context on both sides, so peak memory depends on the window, not on the length of the utterance.
+
+    With context_frames at least the receptive field of the vocoder (see receptive_field()), every window
+    yields exactly the samples a full-length pass would. Consecutive windows also overlap by
+    `crossfade_frames`, whose audio is crossfaded, which hides the error of a shorter context.
+
+    The mel can be fed incrementally with feed() as it is produced (the audio of a frame is only returned
+    once context_frames frames after it are known), flush() returns the rest. One instance vocodes one
+    utterance at a time.
+
+    Args:
+        vocoder: BigVGAN or module.models.Generator, mel (1, n_mels, T) -> audio (1, 1, T * upsample_rate).
+        upsample_rate: int, audio samples per mel frame.
+        window_frames: int, new frames vocoded per window.
+        context_frames: int, context frames on each side of a window.
+        crossfade_frames: int, frames crossfaded between consecutive windows.
+    """
+
+    def __init__(
+        self,
+        vocoder: torch.nn.Module,
+        upsample_rate: int,
+        window_frames: int = 256,
+        context_frames: int = 32,
+        crossfade_frames: int = 2,
+    ):
+        self.vocoder = vocoder
+        self.upsample_rate = upsample_rate
+        self.crossfade_frames = max(crossfade_frames, 0)
+        self.window_frames = max(window_frames, self.crossfade_frames + 1)
+        self.context_frames = max(context_frames, 0)
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer: Optional[torch.Tensor] = None
+        self._buffer_start = 0  # absolute index of the first frame in _buffer
+        self._total = 0  # frames fed so far
+        self._next = 0  # first frame whose audio has not been vocoded
+        self._tail: Optional[torch.Tensor] = None  # audio of the last crossfade_frames, not returned yet
+
+    def __call__(self, mel: torch.Tensor) -> Iterator[torch.Tensor]:
+        """Vocode a whole mel (1, n_mels, T) window by window, yields audio (samples,)."""
+        self.reset()
+        for start in range(0, mel.shape[2], self.window_frames):
+            audio = self.feed(mel[:, :, start : start + self.window_frames])
+            if audio.shape[0] > 0:
+                yield audio
+        audio = self.flush()
+        if audio.shape[0] > 0:
+            yield audio
+
+    def feed(self, mel: torch.Tensor) -> torch.Tensor:
+        """Append mel frames (1, n_mels, T), returns the audio (samples,) that is final by now, may be empty."""
+        self._buffer = mel if self._buffer is None else torch.cat([self._buffer, mel], 2)
+        self._total += mel.shape[2]
+        pieces = []
+        ready = self._total - self.context_frames
+        while ready > self._next:
+            pieces.append(self._vocode(min(self._next + self.window_frames, ready), final=False))
+        return self._cat(pieces, mel)
+
+    def flush(self) -> torch.Tensor:
+        """The audio of all frames not returned yet, then reset()."""
+        pieces = []
+        while self._next < self._total:
+            end = min(self._next + self.window_frames, self._total)
+            pieces.append(self._vocode(end, final=end == self._total))
+        if self._tail is not None:
+            pieces.append(self._tail)
+        audio = self._cat(pieces, self._buffer)
+        self.reset()
+        return audio
+
+    @torch.inference_mode()
+    def _vocode(self, end: int, final: bool) -> torch.Tensor:
+        start = self._next
+        up = self.upsample_rate
+        head = start - self.crossfade_frames if self._tail is not None else start
+        lo = max(head - self.context_frames, 0)
+        hi = min(end + self.context_frames, self._total)
+        mel = self._buffer[:, :, lo - self._buffer_start : hi - self._buffer_start]
+        audio = self.vocoder(mel)[0, 0, (head - lo) * up : (end - lo) * up]
+
+        if self._tail is not None:
+            n = self._tail.shape[0]
+            fade = torch.linspace(0, 1, n + 2, dtype=audio.dtype, device=audio.device)[1:-1]
+            audio = torch.cat([self._tail * (1 - fade) + audio[:n] * fade, audio[n:]])
+        n = self.crossfade_frames * up
+        if final or n == 0:
+            self._tail = None
+        else:
+            self._tail = audio[audio.shape[0] - n :]
+            audio = audio[: audio.shape[0] - n]
+
+        self._next = end
+        keep = max(end - self.crossfade_frames - self.context_frames, 0)
+        if keep > self._buffer_start:
+            self._buffer = self._buffer[:, :, keep - self._buffer_start :]
+            self._buffer_start = keep
+        return audio
+
+    @staticmethod
+    def _cat(pieces: list, like: Optional[torch.Tensor]) -> torch.Tensor:
+        if len(pieces) == 0:
+            return torch.zeros(0) if like is None else torch.zeros(0, dtype=like.dtype, device=like.device)
+        return pieces[0] if len(pieces) == 1 else torch.cat(pieces)
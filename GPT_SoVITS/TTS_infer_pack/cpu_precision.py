@@ -0,0 +1,175 @@
+import contextlib
+import functools
+from typing import Callable, Iterator, Union
+
+import torch
+from torch import nn
+
+from tools.logger import logger
+
+PRECISIONS = ("fp32", "bf16", "int8")
+COMPONENTS = ("t2s", "bert", "hubert")
+
+
+def parse_cpu_precision(value: Union[str, dict, None]) -> dict:
+    """
+    The precision of every component on CPU, from a single precision for all of them or a dict
+    {"t2s": ..., "bert": ..., "hubert": ...} (missing components stay fp32).
+    """
+    if value in [None, ""]:
+        value = "fp32"
+    if isinstance(value, str):
+        value = {component: value for component in COMPONENTS}
+    precision = {component: "fp32" for component in COMPONENTS}
+    for component, mode in dict(value).items():
+        if component not in COMPONENTS:
+            raise ValueError(f"unknown cpu_precision component {component}, expected one of {COMPONENTS}")
+        if mode not in PRECISIONS:
+            raise ValueError(f"unknown cpu_precision {mode} for {component}, expected one of {PRECISIONS}")
+        precision[component] = mode
+    return precision
+
+
+@functools.lru_cache(maxsize=None)
+def bf16_supported() -> bool:
+    """Whether the CPU computes bf16 natively (AVX512-BF16 or AMX), elsewhere bf16 autocast is slower than fp32."""
+    is_supported = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    if is_supported is not None:
+        try:
+            return bool(is_supported())
+        except RuntimeError:
+            pass
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def resolve(precision: str) -> str:
+    """precision, or fp32 when it is bf16 and the CPU has no bf16 support."""
+    if precision == "bf16" and not bf16_supported():
+        logger.warning("This CPU has no native bf16 support, fall back to fp32.")
+        return "fp32"
+    return precision
+
+
+def autocast(precision: str):
+    """CPU bf16 autocast context for bf16, a no-op for the others."""
+    if precision == "bf16":
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def autocast_call(fn: Callable, precision: str) -> Callable:
+    """fn, called under autocast(precision)."""
+    if precision != "bf16":
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with autocast(precision):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def autocast_iter(iterator: Iterator, precision: str) -> Iterator:
+    """
+    The items of iterator, each one produced under autocast(precision). The autocast state is left
+    as it was between two items, so the consumer (e.g. SoVITS) runs in its own precision.
+    """
+    if precision != "bf16":
+        yield from iterator
+        return
+    while True:
+        with autocast(precision):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _to_float(output):
+    if isinstance(output, torch.Tensor):
+        return output.float() if output.is_floating_point() else output
+    if isinstance(output, tuple):
+        return tuple(_to_float(item) for item in output)
+    if isinstance(output, dict):
+        for key in list(output.keys()):
+            output[key] = _to_float(output[key])
+    return output
+
+
+class AutocastModule(nn.Module):
+    """Runs module under CPU bf16 autocast, floating point outputs are returned in fp32."""
+
+    def __init__(self, module: nn.Module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, *args, **kwargs):
+        with autocast("bf16"):
+            output = self.module(*args, **kwargs)
+        return _to_float(output)
+
+
+def quantize_int8(module: nn.Module) -> nn.Module:
+    """module with every nn.Linear replaced in place by an int8 dynamic quantized one."""
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def convert_module(module: nn.Module, precision: str) -> nn.Module:
+    """
+    A CPU model (BERT, the HuBERT of CNHubert) in precision: itself for fp32, wrapped in an AutocastModule for bf16,
+    with int8 dynamic quantized linears for int8 (in place). bf16 falls back to fp32 where the CPU does not support it.
+    """
+    precision = resolve(precision)
+    if precision == "bf16":
+        return AutocastModule(module)
+    if precision == "int8":
+        return quantize_int8(module)
+    return module
+
+
+def _linear(weight: nn.Parameter, bias: nn.Parameter) -> nn.Linear:
+    linear = nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None, device="meta")
+    linear.weight = weight
+    linear.bias = bias
+    return linear
+
+
+def set_t2s_precision(model: nn.Module, precision: str) -> None:
+    """
+    Switch the T2S blocks of a Text2SemanticDecoder between fp32, bf16 and int8 on CPU.
+
+    int8 points the blocks (qkv, out and MLP projections, see t2s_model.t2s_linear) at dynamic quantized copies
+    of the linears of model.h, fp32 and bf16 at the fp32 weights themselves, the weights of model.h are never
+    modified, so a pooled model can switch back. bf16 is applied by the decode loops, which autocast to
+    model.cpu_precision.
+    """
+    precision = resolve(precision)
+    for layer, block in zip(model.h.layers, model.t2s_transformer.blocks):
+        attn = layer.self_attn
+        if precision == "int8":
+            linears = nn.ModuleList(
+                [
+                    _linear(attn.in_proj_weight, attn.in_proj_bias),
+                    _linear(attn.out_proj.weight, attn.out_proj.bias),
+                    _linear(layer.linear1.weight, layer.linear1.bias),
+                    _linear(layer.linear2.weight, layer.linear2.bias),
+                ]
+            )
+            linears = torch.ao.quantization.quantize_dynamic(linears, {nn.Linear}, dtype=torch.qint8)
+            block.qkv_w, block.out_w, block.mlp.w1, block.mlp.w2 = linears
+        else:
+            block.qkv_w = attn.in_proj_weight
+            block.out_w = attn.out_proj.weight
+            block.mlp.w1 = layer.linear1.weight
+            block.mlp.w2 = layer.linear2.weight
+    model.cpu_precision = precision
+    # the cached layer-0 q/k/v of the prompts were computed with the previous weights
+    with model._prompt_prefix_lock:
+        model.prompt_prefix_cache.clear()
@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from tools.logger import logger
+
+
+def module_nbytes(module: Any) -> int:
+    """
+    Count the bytes held by the parameters and buffers of a model.
+
+    Args:
+        module: torch.nn.Module (or any object exposing parameters()/buffers()).
+
+    Returns:
+        int: total size in bytes.
+    """
+    total = 0
+    for getter in ("parameters", "buffers"):
+        if not hasattr(module, getter):
+            continue
+        for tensor in getattr(module, getter)():
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def weights_key(kind: str, weights_path: str, version: str = "") -> Tuple[str, str, str, float]:
+    """
+    Build the pool key of a weights file: (kind, version, absolute path, mtime).
+    A rewritten file gets a new mtime, so stale entries are never hit.
+    """
+    path = os.path.abspath(weights_path)
+    return kind, version, path, os.path.getmtime(path)
+
+
+class ModelPool:
+    """
+    LRU pool of resident models.
+
+    Each entry holds a loaded model plus the metadata needed to switch back to it
+    (config values read from the checkpoint). Entries are evicted least recently
+    used first once either `max_models` or `max_bytes` is exceeded. The most
+    recently used entry is never evicted, even if it alone exceeds the budget.
+
+    Args:
+        max_models: int, maximum number of resident models, 0 disables the pool.
+        max_bytes: int, memory budget for all resident models, 0 means unlimited.
+        on_evict: callable, called after entries are dropped (e.g. to empty the device cache).
+    """
+
+    def __init__(self, max_models: int = 4, max_bytes: int = 0, on_evict: Optional[Callable[[], None]] = None):
+        self.max_models = max(int(max_models), 0)
+        self.max_bytes = max(int(max_bytes), 0)
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[Any, dict, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_models > 0
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(entry[2] for entry in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: Hashable, model: Any, meta: dict = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (model, meta or {}, module_nbytes(model))
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None and self.on_evict is not None:
+                self.on_evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            if len(self._entries) == 0:
+                return
+            self._entries.clear()
+            if self.on_evict is not None:
+                self.on_evict()
+
+    def _over_budget(self) -> bool:
+        if len(self._entries) > self.max_models:
+            return True
+        return self.max_bytes > 0 and self.nbytes > self.max_bytes
+
+    def _evict(self) -> None:
+        evicted = False
+        while len(self._entries) > 1 and self._over_budget():
+            key, (model, _, nbytes) = self._entries.popitem(last=False)
+            logger.info(f"Evict model from pool: {key[2] if len(key) > 2 else key} ({nbytes / 1024**2:.1f} MB)")
+            # only drop the reference: a request still holding the model keeps it alive until it finishes
+            del model
+            evicted = True
+        if evicted and self.on_evict is not None:
+            self.on_evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "models": len(self._entries),
+                "max_models": self.max_models,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+import torch
+
+from tools.logger import logger
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """Hash any number of printable parts into a cache key."""
+    return hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class PromptFeatureCache:
+    """
+    Two-tier cache of reference-prompt features.
+
+    The memory tier is an LRU of `max_entries` feature dicts, the disk tier keeps one
+    `.npz` file per key under `cache_dir`. A sidecar file (several entries written next to
+    a reference audio, see `save_file`) is checked before the disk tier when the caller
+    passes its path. An entry is a flat dict whose values are
+    tensors, lists of ints (phones), ints or strings, e.g.:
+        {
+            "prompt_semantic": LongTensor,
+            "refer_spec": Tensor,
+            "audio_16k": Tensor,
+            "sv_emb": Tensor,
+            "raw_audio": Tensor,
+            "raw_sr": int,
+        }
+    Tensors are kept on CPU in both tiers, callers move them to their device.
+
+    Args:
+        max_entries: int, size of the memory tier, 0 disables it.
+        cache_dir: str, directory of the disk tier, "" or None disables it.
+    """
+
+    def __init__(self, max_entries: int = 32, cache_dir: Optional[str] = None):
+        self.max_entries = max(int(max_entries), 0)
+        self.cache_dir = cache_dir if cache_dir not in ["", None] else None
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._file_hashes: Dict[tuple, str] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def file_hash(self, path: str) -> str:
+        """Content hash of a file, memoized by (path, size, mtime) so a hot file is only read once."""
+        stat = os.stat(path)
+        stamp = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        digest = self._file_hashes.get(stamp)
+        if digest is None:
+            digest = hash_file(path)
+            self._file_hashes[stamp] = digest
+        return digest
+
+    def get(self, key: str, sidecar: Optional[str] = None) -> Optional[Dict]:
+        with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return features
+        features = None
+        if sidecar is not None:
+            features = self.load_file(sidecar, key)
+        if features is None and self.cache_dir is not None:
+            features = self.load_file(self._path(key), key)
+        if features is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, features)
+        return features
+
+    def put(self, key: str, features: Dict, persist: bool = True) -> Dict:
+        features = {k: self._to_cpu(v) for k, v in features.items() if v is not None}
+        self._remember(key, features)
+        if persist and self.cache_dir is not None:
+            self.save_file(self._path(key), {key: features})
+        return features
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _remember(self, key: str, features: Dict) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = features
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _to_cpu(value):
+        if isinstance(value, torch.Tensor):
+            return value.detach().cpu()
+        return value
+
+    @staticmethod
+    def save_file(path: str, entries: Dict[str, Dict]) -> None:
+        """
+        Write feature dicts as one `.npz`, replacing the file atomically.
+
+        Args:
+            path: str, the file to write.
+            entries: dict, cache key -> feature dict.
+        """
+        arrays = {}
+        types = []
+        for i, features in enumerate(entries.values()):
+            entry_types = {}
+            for name, value in features.items():
+                if value is None:
+                    continue
+                field = f"{i}/{name}"
+                if isinstance(value, torch.Tensor):
+                    entry_types[name] = "tensor:" + str(value.dtype).replace("torch.", "")
+                    value = value.detach().cpu()
+                    if value.dtype == torch.bfloat16:
+                        value = value.float()
+                    arrays[field] = value.numpy()
+                elif isinstance(value, (list, tuple)):
+                    entry_types[name] = "list"
+                    arrays[field] = np.asarray(value, dtype=np.int64)
+                elif isinstance(value, str):
+                    entry_types[name] = "str"
+                    arrays[field] = np.asarray(value)
+                else:
+                    entry_types[name] = "int" if isinstance(value, int) else "float"
+                    arrays[field] = np.asarray(value)
+            types.append(entry_types)
+        arrays["__keys__"] = np.asarray(list(entries.keys()))
+        arrays["__types__"] = np.asarray(json.dumps(types))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write prompt feature cache {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def load_file(path: str, key: str) -> Optional[Dict]:
+        """Read the feature dict of `key` from a file written by `save_file`, None if missing or unreadable."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                keys = [str(k) for k in data["__keys__"]]
+                if key not in keys:
+                    return None
+                i = keys.index(key)
+                types = json.loads(str(data["__types__"]))[i]
+                features = {}
+                for name, kind in types.items():
+                    value = data[f"{i}/{name}"]
+                    if kind.startswith("tensor:"):
+                        features[name] = torch.from_numpy(value.copy()).to(getattr(torch, kind.split(":", 1)[1]))
+                    elif kind == "list":
+                        features[name] = value.tolist()
+                    elif kind == "str":
+                        features[name] = str(value)
+                    elif kind == "int":
+                        features[name] = int(value)
+                    else:
+                        features[name] = float(value)
+        except Exception as e:
+            logger.warning(f"Ignore broken prompt feature cache {path}: {e}")
+            return None
+        return features
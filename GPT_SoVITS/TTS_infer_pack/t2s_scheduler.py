@@ -0,0 +1,348 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from AR.models.utils import T2SSampler, detect_loops
+from tools.logger import logger
+from TTS_infer_pack.cpu_precision import autocast
+
+
+class _T2SRequest:
+    """The sentences of one infer_panel call and their sampling parameters."""
+
+    def __init__(
+        self,
+        x: List[torch.LongTensor],
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: List[torch.Tensor],
+        max_len: int,
+        sampling: Tuple[int, float, float, float],
+        row_caps: List[int],
+        prompt_prefix=None,
+    ):
+        self.x = x
+        self.x_lens = x_lens
+        self.prompts = prompts
+        self.bert_feature = bert_feature
+        self.max_len = max_len
+        self.sampling = sampling
+        self.row_caps = row_caps  # see Text2SemanticDecoder.row_caps
+        self.prompt_prefix = prompt_prefix
+        self.y_list: List[Optional[torch.Tensor]] = [None] * len(x)
+        self.idx_list: List[Optional[int]] = [None] * len(x)
+        self.remaining = len(x)
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+    def finish_row(self, row: int, y: torch.Tensor, idx: int) -> None:
+        self.y_list[row] = y
+        self.idx_list[row] = idx
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.done.set()
+
+    def fail(self, error: BaseException) -> None:
+        if not self.done.is_set():
+            self.error = error
+            self.done.set()
+
+
+class _DecodeWorker(threading.Thread):
+    """
+    Decode loop of one T2S model.
+
+    The running batch is a set of rows from any number of requests. Every iteration first
+    runs the prompt pass of newly admitted requests, then one decode step of the running
+    rows, so new sentences join at a token boundary instead of waiting for the batch to
+    drain. KV caches of rows with different lengths are left padded and masked, each row
+    keeps its own audio position. Every row is sampled with the parameters of its request in
+    one T2SSampler call. EOS and loops (see Text2SemanticDecoder.mark_loops) are recorded
+    on the device and only read back every `sync_every` steps (or when a row hits its
+    length cap), rows are then retired the same way infer_panel_batch_infer does it.
+    """
+
+    def __init__(self, scheduler: "T2SScheduler", model):
+        super().__init__(name="t2s-decode", daemon=True)
+        self.scheduler = scheduler
+        self.model = model
+        self.pending: List[_T2SRequest] = []
+        # running batch
+        self.k_cache: Optional[List[torch.Tensor]] = None
+        self.v_cache: Optional[List[torch.Tensor]] = None
+        self.key_mask: Optional[torch.Tensor] = None  # (bsz, kv_len) bool, True for padding
+        self.y: Optional[torch.Tensor] = None  # (bsz, y_len) left padded with each row's first token
+        self.rows: List[list] = []  # [request, row index in the request, prompt length, generated tokens]
+        self.sampler: Optional[T2SSampler] = None
+        self.steps: Optional[torch.Tensor] = None  # (bsz,) generated tokens of every row, on device
+        self.finish_step: Optional[torch.Tensor] = None  # (bsz,) generated tokens at EOS, -1 while running
+        self.unsynced = 0
+
+    def run(self):
+        with torch.no_grad():
+            while True:
+                admitted = self.scheduler._admit(self)
+                if admitted is None:
+                    return
+                try:
+                    with autocast(self.model.cpu_precision):
+                        self.step(admitted)
+                except Exception as e:
+                    logger.exception("T2S continuous batching step failed")
+                    for request in set([row[0] for row in self.rows] + admitted):
+                        request.fail(e)
+                    self.reset()
+
+    def reset(self) -> None:
+        self.k_cache = None
+        self.v_cache = None
+        self.key_mask = None
+        self.y = None
+        self.rows = []
+        self.sampler = None
+        self.steps = None
+        self.finish_step = None
+        self.unsynced = 0
+
+    def step(self, admitted: List[_T2SRequest]) -> None:
+        model = self.model
+        logits_list = []
+        if len(self.rows) > 0:
+            xy_pos = self.next_input()
+            self.key_mask = F.pad(self.key_mask, (0, 1), value=False)
+            attn_mask = self.key_mask[:, None, None, :]
+            xy_dec, self.k_cache, self.v_cache = model.t2s_transformer.decode_next_token(
+                xy_pos, self.k_cache, self.v_cache, attn_mask
+            )
+            logits_list.append(model.ar_predict_layer(xy_dec[:, -1]))
+
+        for request in admitted:
+            xy_pos, attn_mask = model.make_batch_prompt(
+                request.x, request.x_lens, request.prompts, request.bert_feature, request.max_len, request.prompt_prefix
+            )
+            qkv = model.make_prompt_qkv(xy_pos, request.prompt_prefix)
+            xy_dec, k_cache, v_cache = model.t2s_transformer.process_prompt(xy_pos, attn_mask, None, True, qkv)
+            logits = model.ar_predict_layer(xy_dec[:, -1])
+            logits[:, -1] = float("-inf")  # no EOS at the first step, like infer_panel_batch_infer
+            logits_list.append(logits)
+            self.merge(request, k_cache, v_cache, attn_mask[:, 0, -1])
+
+        logits = torch.cat(logits_list, dim=0)
+        samples, tokens = self.sampler(logits)
+        self.y = torch.cat([self.y, samples.to(self.y.dtype)], dim=1)
+        for row in self.rows:
+            row[3] += 1
+        self.steps += 1
+        eos = self.model.EOS
+        finished = (samples[:, 0] == eos).logical_or(tokens == eos).logical_and(self.finish_step < 0)
+        self.finish_step = torch.where(finished, self.steps, self.finish_step)
+        self.unsynced += 1
+        self.retire()
+
+    def next_input(self) -> torch.Tensor:
+        model = self.model
+        y_emb = model.ar_audio_embedding(self.y[:, -1:])
+        position = torch.tensor([row[2] + row[3] - 1 for row in self.rows], device=y_emb.device)
+        pe = model.ar_audio_position.pe[0, position].unsqueeze(1).to(dtype=y_emb.dtype, device=y_emb.device)
+        return y_emb * model.ar_audio_position.x_scale + model.ar_audio_position.alpha * pe
+
+    def merge(self, request: _T2SRequest, k_cache, v_cache, key_mask: torch.Tensor) -> None:
+        prompts = request.prompts
+        sampler = T2SSampler(prompts, self.model.vocab_size, *request.sampling)
+        steps = torch.zeros(prompts.shape[0], dtype=torch.long, device=prompts.device)
+        if self.k_cache is None:
+            self.k_cache, self.v_cache, self.key_mask, self.y = k_cache, v_cache, key_mask, prompts
+            self.sampler, self.steps, self.finish_step = sampler, steps, steps - 1
+        else:
+            kv_len = max(self.key_mask.shape[1], key_mask.shape[1])
+            self.k_cache = [
+                torch.cat([_pad_left(old, kv_len), _pad_left(new, kv_len)], dim=0)
+                for old, new in zip(self.k_cache, k_cache)
+            ]
+            self.v_cache = [
+                torch.cat([_pad_left(old, kv_len), _pad_left(new, kv_len)], dim=0)
+                for old, new in zip(self.v_cache, v_cache)
+            ]
+            self.key_mask = torch.cat(
+                [_pad_left(self.key_mask, kv_len, True), _pad_left(key_mask, kv_len, True)], dim=0
+            )
+            y_len = max(self.y.shape[1], prompts.shape[1])
+            self.y = torch.cat([_pad_left_repeat(self.y, y_len), _pad_left_repeat(prompts, y_len)], dim=0)
+            self.sampler.extend(sampler)
+            self.steps = torch.cat([self.steps, steps])
+            self.finish_step = torch.cat([self.finish_step, steps - 1])
+        for i in range(prompts.shape[0]):
+            self.rows.append([request, i, prompts.shape[1], 0])
+
+    def mark_loops(self) -> None:
+        """Mark rows stuck in a loop as finished, keeping the tokens before their repeating tail."""
+        window = self.scheduler.loop_window
+        max_period = max(window // 4, 1)
+        if window <= 0 or self.y.shape[1] < window + max_period:
+            return
+        period = detect_loops(self.y[:, -window - max_period :], window, max_period)
+        looping = (period > 0).logical_and(self.steps >= window + max_period).logical_and(self.finish_step < 0)
+        self.finish_step = torch.where(looping, self.steps - window + 1, self.finish_step)
+
+    def retire(self) -> None:
+        capped = [step > request.row_caps[index] for request, index, _, step in self.rows]
+        if self.unsynced < self.scheduler.sync_every and not any(capped):
+            return
+        self.unsynced = 0
+        self.mark_loops()
+        finish_step = self.finish_step.tolist()
+        y_lens = self.y.shape[1]
+        keep = []
+        for i, row in enumerate(self.rows):
+            request, index, prompt_len, step = row
+            if finish_step[i] >= 0 or capped[i]:
+                # the row may have run past its EOS until this sync, cut it at the EOS step
+                end = finish_step[i] if finish_step[i] >= 0 else step
+                start = y_lens - prompt_len - step
+                request.finish_row(index, self.y[i, start : start + prompt_len + end - 1], end - 1)
+            else:
+                keep.append(i)
+        if len(keep) == len(self.rows):
+            return
+        if len(keep) == 0:
+            self.reset()
+            return
+        index = torch.tensor(keep, device=self.y.device)
+        self.rows = [self.rows[i] for i in keep]
+        self.y = self.y.index_select(0, index)
+        self.key_mask = self.key_mask.index_select(0, index)
+        self.k_cache = [k.index_select(0, index) for k in self.k_cache]
+        self.v_cache = [v.index_select(0, index) for v in self.v_cache]
+        self.sampler.compact(index)
+        self.steps = self.steps.index_select(0, index)
+        self.finish_step = self.finish_step.index_select(0, index)
+        # drop the left columns that became padding for every remaining row
+        start = int((~self.key_mask).any(dim=0).int().argmax())
+        if start > 0:
+            self.key_mask = self.key_mask[:, start:]
+            self.k_cache = [k[:, start:] for k in self.k_cache]
+            self.v_cache = [v[:, start:] for v in self.v_cache]
+        longest = max(row[2] + row[3] for row in self.rows)
+        if longest < self.y.shape[1]:
+            self.y = self.y[:, -longest:]
+
+
+def _pad_left(x: torch.Tensor, length: int, value=0) -> torch.Tensor:
+    if x.shape[1] >= length:
+        return x
+    pad = [0, 0] * (x.dim() - 2) + [length - x.shape[1], 0]
+    return F.pad(x, pad, value=value)
+
+
+def _pad_left_repeat(y: torch.Tensor, length: int) -> torch.Tensor:
+    """Left pad token ids with the first token of each row, which leaves the repetition penalty unchanged."""
+    if y.shape[1] >= length:
+        return y
+    return torch.cat([y[:, :1].expand(-1, length - y.shape[1]), y], dim=1)
+
+
+class T2SScheduler:
+    """
+    Continuous (iteration level) batching of T2S decoding across concurrent requests.
+
+    `infer_panel` has the signature and return value of
+    Text2SemanticDecoder.infer_panel_batch_infer, but instead of decoding the
+    sentences of one call on its own it hands them to the decode thread of the
+    model, where they are admitted into the running batch at the next token
+    boundary. Callers sharing a T2S model therefore share every forward pass.
+    One decode thread runs per model, it exits once it has no rows left.
+
+    Args:
+        max_batch_size: int, maximum number of rows decoded together,
+            requests that do not fit wait until rows retire.
+        sync_every: int, number of decode steps between two reads of the EOS flags,
+            finished rows keep their slot (and compute) until the next read.
+        loop_window: int, retire rows whose last loop_window tokens repeat, 0 disables it.
+    """
+
+    def __init__(self, max_batch_size: int = 32, sync_every: int = 1, loop_window: int = 0):
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.sync_every = max(int(sync_every), 1)
+        self.loop_window = max(int(loop_window), 0)
+        self._workers: Dict[int, _DecodeWorker] = {}
+        self._cond = threading.Condition()
+
+    def infer_panel(
+        self,
+        model,
+        x: List[torch.LongTensor],
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: List[torch.Tensor],
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        if prompts is None:
+            return model.infer_panel_naive_batched(
+                x,
+                x_lens,
+                prompts,
+                bert_feature,
+                top_k=top_k,
+                top_p=top_p,
+                early_stop_num=early_stop_num,
+                temperature=temperature,
+                repetition_penalty=repetition_penalty,
+                **kwargs,
+            )
+        request = _T2SRequest(
+            x,
+            x_lens,
+            prompts,
+            bert_feature,
+            kwargs.get("max_len", x_lens.max()),
+            (top_k, top_p, temperature, repetition_penalty),
+            model.row_caps(len(x), early_stop_num, kwargs.get("max_new_tokens", None)),
+            kwargs.get("prompt_prefix", None),
+        )
+        with self._cond:
+            worker = self._workers.get(id(model))
+            if worker is None:
+                worker = _DecodeWorker(self, model)
+                self._workers[id(model)] = worker
+                worker.start()
+            worker.pending.append(request)
+            self._cond.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.y_list, request.idx_list
+
+    def _admit(self, worker: _DecodeWorker) -> Optional[List[_T2SRequest]]:
+        """Take the pending requests that fit into the running batch, None tells an idle worker to exit."""
+        with self._cond:
+            while len(worker.rows) == 0 and len(worker.pending) == 0:
+                if not self._cond.wait(timeout=1.0):
+                    if len(worker.pending) == 0:
+                        del self._workers[id(worker.model)]
+                        return None
+            admitted = []
+            free = self.max_batch_size - len(worker.rows)
+            while len(worker.pending) > 0:
+                request = worker.pending[0]
+                # a request larger than the whole batch still runs, alone
+                if len(request.x) > free and (len(worker.rows) > 0 or len(admitted) > 0):
+                    break
+                admitted.append(worker.pending.pop(0))
+                free -= len(request.x)
+            return admitted
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "models": len(self._workers),
+                "rows": sum(len(worker.rows) for worker in self._workers.values()),
+                "pending": sum(len(worker.pending) for worker in self._workers.values()),
+                "max_batch_size": self.max_batch_size,
+            }
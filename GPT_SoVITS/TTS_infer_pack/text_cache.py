@@ -0,0 +1,264 @@
+import contextlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import torch
+
+from tools.logger import logger
+from TTS_infer_pack.prompt_cache import make_key
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# GPT_SoVITS/text, the normalization and G2P code and dictionaries
+TEXT_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "text")
+
+BERT_DIM = 1024
+
+
+@contextlib.contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock on `path` across processes, also between two handles of one process."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def frontend_fingerprint(*parts) -> str:
+    """
+    Key of the text frontend: size and mtime of every file of GPT_SoVITS/text (generated caches excluded),
+    plus any parts (BERT weights and precision), so cached features are dropped once any of them changes.
+    """
+    stamps = []
+    for root, dirs, files in os.walk(TEXT_FRONTEND_DIR):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            if name.endswith((".pickle", ".pyc")) or "cache" in name:
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            stamps.append((os.path.relpath(path, TEXT_FRONTEND_DIR), stat.st_size, stat.st_mtime_ns))
+    return make_key(stamps, *parts)
+
+
+class TextFeatureCache:
+    """
+    Cache of TextPreprocessor.get_phones_and_bert: (text, language, version) -> (phones, BERT features, norm_text).
+
+    The memory tier is an LRU of `max_entries` entries. The optional disk tier under `cache_dir` appends
+    phones (int32) and phone level BERT features (fp16, phones x 1024) to two flat files, read back through
+    memory maps, and one line per entry to index.jsonl. It stops growing at `max_disk_mb` (delete the directory
+    to start over). Several processes (e.g. the workers of gsvi_router) may share the directory: appends and the
+    cleanup at start hold a lock file, take their offset from the size of the data files, and entries appended by
+    other processes are picked up from index.jsonl. BERT features are kept in fp16 in both tiers and returned in
+    fp32 on CPU, a miss returns the rounded features as well so hits and misses give the same result.
+
+    Keys include `fingerprint` (see frontend_fingerprint), set by the owner.
+
+    Args:
+        max_entries: int, size of the memory tier, 0 disables it.
+        cache_dir: str, directory of the disk tier, "" or None disables it.
+        max_disk_mb: int, size limit of the disk tier.
+    """
+
+    def __init__(self, max_entries: int = 1024, cache_dir: Optional[str] = None, max_disk_mb: int = 1024):
+        self.max_entries = max(int(max_entries), 0)
+        self.cache_dir = cache_dir if cache_dir not in ["", None] else None
+        self.max_disk_bytes = max(int(max_disk_mb), 0) * 1024**2
+        self.fingerprint = ""
+        self._entries: "OrderedDict[str, Tuple[list, torch.Tensor, str]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # disk tier: key -> (first phone, number of phones, norm_text)
+        self._index: Dict[str, Tuple[int, int, str]] = {}
+        self._index_offset = 0  # bytes of index.jsonl read into _index
+        self._disk_phones = 0
+        self._writable = self.cache_dir is not None
+        self._phones_map: Optional[np.memmap] = None
+        self._bert_map: Optional[np.memmap] = None
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.cache_dir is not None
+
+    def key(self, *parts) -> str:
+        return make_key(self.fingerprint, *parts)
+
+    def get(self, key: str) -> Optional[Tuple[list, torch.Tensor, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1].float(), entry[2]
+            entry = self._read(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+            return entry[0], entry[1].float(), entry[2]
+
+    def put(self, key: str, phones: list, bert: torch.Tensor, norm_text: str) -> Tuple[list, torch.Tensor, str]:
+        """Store an entry, returns it as get() would."""
+        entry = (list(phones), bert.detach().to("cpu", torch.float16), norm_text)
+        with self._lock:
+            self._remember(key, entry)
+            if self._writable and key not in self._index:
+                self._write(key, entry)
+        return entry[0], entry[1].float(), entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "disk_entries": len(self._index),
+            "disk_mb": round(self._disk_bytes(self._disk_phones) / 1024**2, 1),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def _remember(self, key: str, entry: Tuple[list, torch.Tensor, str]) -> None:
+        if self.max_entries == 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def _disk_bytes(n_phones: int) -> int:
+        return n_phones * (4 + 2 * BERT_DIM)
+
+    def _load_index(self) -> None:
+        with _file_lock(self._path("lock")):
+            self._sync_index()
+            # drop the data of entries whose index line was never written (a crash while appending),
+            # live writers only append while holding the lock
+            for path, item_size in ((self._path("phones.bin"), 4), (self._path("bert.bin"), 2 * BERT_DIM)):
+                if os.path.exists(path) and os.path.getsize(path) > self._disk_phones * item_size:
+                    try:
+                        with open(path, "r+b") as f:
+                            f.truncate(self._disk_phones * item_size)
+                    except OSError as e:  # mapped by another process on Windows, _write skips the data instead
+                        logger.warning(f"Failed to truncate {path}: {e}")
+
+    def _data_phones(self) -> int:
+        """Number of phones in the data files, the offset of the next entry."""
+        sizes = [
+            -(-os.path.getsize(path) // item_size) if os.path.exists(path) else 0
+            for path, item_size in ((self._path("phones.bin"), 4), (self._path("bert.bin"), 2 * BERT_DIM))
+        ]
+        return max(sizes)
+
+    def _sync_index(self) -> None:
+        """Read the lines appended to index.jsonl since the last call, by this or another process."""
+        index_path = self._path("index.jsonl")
+        if not os.path.exists(index_path) or os.path.getsize(index_path) <= self._index_offset:
+            return
+        with open(index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # a line without its newline is still being written, or was cut short by a crash
+        data = data[: data.rfind(b"\n") + 1]
+        self._index_offset += len(data)
+        size = self._data_phones()
+        for line in data.splitlines():
+            try:
+                item = json.loads(line)
+                start, count = int(item["start"]), int(item["phones"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if start + count <= size:
+                self._index[item["key"]] = (start, count, item["norm_text"])
+                self._disk_phones = max(self._disk_phones, start + count)
+
+    def _read(self, key: str) -> Optional[Tuple[list, torch.Tensor, str]]:
+        if key not in self._index and self.cache_dir is not None:
+            self._sync_index()
+        item = self._index.get(key)
+        if item is None:
+            return None
+        start, count, norm_text = item
+        try:
+            if self._phones_map is None or self._phones_map.shape[0] < start + count:
+                self._phones_map = np.memmap(self._path("phones.bin"), dtype=np.int32, mode="r")
+                self._bert_map = np.memmap(self._path("bert.bin"), dtype=np.float16, mode="r").reshape(-1, BERT_DIM)
+            phones = self._phones_map[start : start + count].tolist()
+            bert = torch.from_numpy(np.array(self._bert_map[start : start + count]).T)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignore broken text feature cache {self.cache_dir}: {e}")
+            del self._index[key]
+            return None
+        return phones, bert, norm_text
+
+    def _write(self, key: str, entry: Tuple[list, torch.Tensor, str]) -> None:
+        phones, bert, norm_text = entry
+        count = len(phones)
+        try:
+            with _file_lock(self._path("lock")):
+                self._sync_index()
+                if key in self._index:  # written by another process meanwhile
+                    return
+                start = self._data_phones()
+                if self._disk_bytes(start + count) > self.max_disk_bytes:
+                    return
+                # the data before its index line, an entry is only found once it is complete. Data files
+                # left out of step by a failed write are padded to the common offset first
+                for path, data, item_size in (
+                    (self._path("phones.bin"), np.asarray(phones, dtype=np.int32).tobytes(), 4),
+                    (self._path("bert.bin"), bert.T.contiguous().numpy().tobytes(), 2 * BERT_DIM),
+                ):
+                    with open(path, "ab") as f:
+                        f.write(b"\0" * (start * item_size - f.tell()) + data)
+                line = {"key": key, "start": start, "phones": count, "norm_text": norm_text}
+                line = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                with open(self._path("index.jsonl"), "ab") as f:
+                    if f.tell() > self._index_offset:  # a line cut short by a crash, end it first
+                        line = b"\n" + line
+                    # the lines of other processes were read by _sync_index, ours ends the file
+                    self._index_offset = f.tell() + len(line)
+                    f.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to write text feature cache {self.cache_dir}, disable writing: {e}")
+            self._writable = False
+            return
+        self._index[key] = (start, count, norm_text)
+        self._disk_phones = start + count
@@ -1,5 +1,5 @@
 import math
-from typing import Tuple
+from typing import List, Tuple
 
 import torch
 import torchaudio
@@ -13,6 +13,7 @@ __all__ = [
     "mel_scale_scalar",
     "spectrogram",
     "fbank",
+    "fbank_batch",
     "mfcc",
     "vtln_warp_freq",
     "vtln_warp_mel_freq",
@@ -625,6 +626,52 @@ def fbank(
     # size (num_mel_bins, padded_window_size // 2)
     # print(num_mel_bins, padded_window_size, sample_frequency, low_freq, high_freq, vtln_low, vtln_high, vtln_warp)
 
+    mel_energies = _get_cached_mel_banks(
+        num_mel_bins,
+        padded_window_size,
+        sample_frequency,
+        low_freq,
+        high_freq,
+        vtln_low,
+        vtln_high,
+        vtln_warp,
+        device,
+        dtype,
+    )
+
+    # sum with mel fiterbanks over the power spectrum, size (m, num_mel_bins)
+    mel_energies = torch.mm(spectrum, mel_energies.T)
+    if use_log_fbank:
+        # avoid log of zero (which should be prevented anyway by dithering)
+        mel_energies = torch.max(mel_energies, _get_epsilon(device, dtype)).log()
+
+    # if use_energy then add it as the last column for htk_compat == true else first column
+    if use_energy:
+        signal_log_energy = signal_log_energy.unsqueeze(1)  # size (m, 1)
+        # returns size (m, num_mel_bins + 1)
+        if htk_compat:
+            mel_energies = torch.cat((mel_energies, signal_log_energy), dim=1)
+        else:
+            mel_energies = torch.cat((signal_log_energy, mel_energies), dim=1)
+
+    mel_energies = _subtract_column_mean(mel_energies, subtract_mean)
+    return mel_energies
+
+
+def _get_cached_mel_banks(
+    num_mel_bins: int,
+    padded_window_size: int,
+    sample_frequency: float,
+    low_freq: float,
+    high_freq: float,
+    vtln_low: float,
+    vtln_high: float,
+    vtln_warp: float,
+    device=None,
+    dtype=None,
+) -> Tensor:
+    r"""get_mel_banks memoized in `cache`, with the zero right column added,
+    size (num_mel_bins, padded_window_size // 2 + 1)"""
     cache_key = "%s-%s-%s-%s-%s-%s-%s-%s-%s-%s" % (
         num_mel_bins,
         padded_window_size,
@@ -655,25 +702,96 @@ def fbank(
         mel_energies = cache[cache_key]
 
     # pad right column with zeros and add dimension, size (num_mel_bins, padded_window_size // 2 + 1)
-    mel_energies = torch.nn.functional.pad(mel_energies, (0, 1), mode="constant", value=0)
+    return torch.nn.functional.pad(mel_energies, (0, 1), mode="constant", value=0)
 
-    # sum with mel fiterbanks over the power spectrum, size (m, num_mel_bins)
-    mel_energies = torch.mm(spectrum, mel_energies.T)
+
+def fbank_batch(
+    waveforms: List[Tensor],
+    blackman_coeff: float = 0.42,
+    dither: float = 0.0,
+    frame_length: float = 25.0,
+    frame_shift: float = 10.0,
+    high_freq: float = 0.0,
+    low_freq: float = 20.0,
+    num_mel_bins: int = 23,
+    preemphasis_coefficient: float = 0.97,
+    remove_dc_offset: bool = True,
+    round_to_power_of_two: bool = True,
+    sample_frequency: float = 16000.0,
+    use_log_fbank: bool = True,
+    use_power: bool = True,
+    vtln_high: float = -500.0,
+    vtln_low: float = 100.0,
+    vtln_warp: float = 1.0,
+    window_type: str = POVEY,
+) -> List[Tensor]:
+    r"""fbank of several mono waveforms of different lengths in one vectorized pass.
+
+    The waveforms are zero padded to the longest one and framed together. With ``snip_edges=True`` a
+    frame only reads samples of its own waveform, so cutting every result to its own number of frames
+    gives what fbank returns for each waveform on its own. Only the options of fbank used for speaker
+    embeddings are supported: snip_edges, no energy column and no mean subtraction.
+
+    Args:
+        waveforms (List[Tensor]): mono waveforms, each of size (n) or (1, n), on the same device and dtype
+        The other arguments are the ones of fbank.
+
+    Returns:
+        List[Tensor]: the fbank of every waveform, of size (m_i, ``num_mel_bins``)
+    """
+    waveforms = [waveform.reshape(-1) for waveform in waveforms]
+    device, dtype = waveforms[0].device, waveforms[0].dtype
+    window_shift = int(sample_frequency * frame_shift * MILLISECONDS_TO_SECONDS)
+    window_size = int(sample_frequency * frame_length * MILLISECONDS_TO_SECONDS)
+    padded_window_size = _next_power_of_2(window_size) if round_to_power_of_two else window_size
+    lengths = [waveform.shape[0] for waveform in waveforms]
+    assert 2 <= window_size <= min(lengths), "choose a window size {} that is [2, {}]".format(window_size, min(lengths))
+    assert 0 < window_shift, "`window_shift` must be greater than 0"
+    assert 0.0 <= preemphasis_coefficient <= 1.0, "`preemphasis_coefficient` must be between [0,1]"
+
+    # size (B, n_max) -> (B, m_max, window_size)
+    batch = torch.nn.utils.rnn.pad_sequence(waveforms, batch_first=True)
+    strided_input = batch.unfold(1, window_size, window_shift)
+
+    if dither != 0.0:
+        strided_input = strided_input + torch.randn(strided_input.shape, device=device, dtype=dtype) * dither
+
+    if remove_dc_offset:
+        strided_input = strided_input - torch.mean(strided_input, dim=-1, keepdim=True)
+
+    if preemphasis_coefficient != 0.0:
+        offset_strided_input = torch.cat((strided_input[..., :1], strided_input[..., :-1]), dim=-1)
+        strided_input = strided_input - preemphasis_coefficient * offset_strided_input
+
+    window_function = _feature_window_function(window_type, window_size, blackman_coeff, device, dtype)
+    strided_input = strided_input * window_function
+
+    if padded_window_size != window_size:
+        strided_input = torch.nn.functional.pad(strided_input, (0, padded_window_size - window_size))
+
+    # size (B, m_max, padded_window_size // 2 + 1)
+    spectrum = torch.fft.rfft(strided_input).abs()
+    if use_power:
+        spectrum = spectrum.pow(2.0)
+
+    mel_energies = _get_cached_mel_banks(
+        num_mel_bins,
+        padded_window_size,
+        sample_frequency,
+        low_freq,
+        high_freq,
+        vtln_low,
+        vtln_high,
+        vtln_warp,
+        device,
+        dtype,
+    )
+    # size (B, m_max, num_mel_bins)
+    mel_energies = torch.matmul(spectrum, mel_energies.T)
     if use_log_fbank:
-        # avoid log of zero (which should be prevented anyway by dithering)
         mel_energies = torch.max(mel_energies, _get_epsilon(device, dtype)).log()
 
-    # if use_energy then add it as the last column for htk_compat == true else first column
-    if use_energy:
-        signal_log_energy = signal_log_energy.unsqueeze(1)  # size (m, 1)
-        # returns size (m, num_mel_bins + 1)
-        if htk_compat:
-            mel_energies = torch.cat((mel_energies, signal_log_energy), dim=1)
-        else:
-            mel_energies = torch.cat((signal_log_energy, mel_energies), dim=1)
-
-    mel_energies = _subtract_column_mean(mel_energies, subtract_mean)
-    return mel_energies
+    return [mel_energies[i, : 1 + (length - window_size) // window_shift] for i, length in enumerate(lengths)]
 
 
 def _get_dct_matrix(num_ceps: int, num_mel_bins: int) -> Tensor:
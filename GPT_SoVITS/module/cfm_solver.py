@@ -0,0 +1,71 @@
+import math
+from typing import Callable, List, Optional, Tuple
+
+import torch
+
+SOLVERS = ("euler", "midpoint", "heun")
+
+
+def timesteps(n_timesteps: int, sway: float = 0.0) -> List[float]:
+    """
+    n_timesteps + 1 time points from 0 to 1.
+
+    sway (between -1 and 1) bends the uniform schedule: below 0 the steps get denser near t = 0,
+    where the velocity of the flow changes most (sway sampling of F5-TTS), 0 is uniform.
+    """
+    ts = [i / n_timesteps for i in range(n_timesteps + 1)]
+    if sway != 0:
+        ts = [t + sway * (math.cos(math.pi / 2 * t) - 1 + t) for t in ts]
+    return ts
+
+
+def _converged(v: torch.Tensor, v_prev: torch.Tensor, tol: float) -> bool:
+    change = (v - v_prev).float().norm() / v_prev.float().norm().clamp_min(1e-6)
+    return change.item() < tol
+
+
+def solve(
+    velocity: Callable[[torch.Tensor, float, float], torch.Tensor],
+    x: torch.Tensor,
+    ts: List[float],
+    solver: str = "euler",
+    adaptive_tol: float = 0.0,
+    max_steps: Optional[int] = None,
+) -> Tuple[torch.Tensor, int]:
+    """
+    Integrate dx/dt = velocity(x, t, d) from ts[0] to ts[-1], d being the size of the step the velocity is used for.
+
+    euler takes one velocity per step, midpoint and heun two (heun's last step is an euler step, so it never
+    evaluates the flow at t = 1).
+
+    The flow is nearly straight once its velocity stops changing: with adaptive_tol > 0 the solver stops as soon as
+    the relative change of the velocity between two steps is below adaptive_tol and moves x along the last velocity
+    to the end, max_steps does the same after a fixed number of steps without checking (and without syncing).
+
+    Returns:
+        x at ts[-1], the number of steps taken.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown CFM solver {solver}, expected one of {SOLVERS}")
+    n = len(ts) - 1
+    v_prev = None
+    for i in range(n):
+        t, t_next = ts[i], ts[i + 1]
+        d = t_next - t
+        if solver == "midpoint":
+            k1 = velocity(x, t, d / 2)
+            v = velocity(x + d / 2 * k1, t + d / 2, d)
+        elif solver == "heun" and i < n - 1:
+            k1 = velocity(x, t, d)
+            k2 = velocity(x + d * k1, t_next, d)
+            v = (k1 + k2) / 2
+        else:
+            v = velocity(x, t, d)
+        x = x + d * v
+        steps = i + 1
+        if steps == max_steps or (adaptive_tol > 0 and v_prev is not None and _converged(v, v_prev, adaptive_tol)):
+            if steps < n:
+                x = x + (ts[-1] - t_next) * v
+            return x, steps
+        v_prev = v
+    return x, n
@@ -10,6 +10,7 @@ from torch.nn import functional as F
 from module import commons
 from module import modules
 from module import attentions
+from module import cfm_solver
 from f5_tts.model import DiT
 from torch.nn import Conv1d, ConvTranspose1d, Conv2d
 from torch.nn.utils import weight_norm, remove_weight_norm, spectral_norm
@@ -449,20 +450,25 @@ class Generator(torch.nn.Module):
         if gin_channels != 0:
             self.cond = nn.Conv1d(gin_channels, upsample_initial_channel, 1)
 
-    def forward(self, x, g=None):
+    def forward(self, x, g=None, x_mask=None):
+        # x_mask (B, 1, T) zeroes the padding of right padded rows before every conv,
+        # so each row is vocoded as if it were alone
         x = self.conv_pre(x)
         if g is not None:
             x = x + self.cond(g)
 
         for i in range(self.num_upsamples):
+            if x_mask is not None:
+                x = x * x_mask
+                x_mask = torch.repeat_interleave(x_mask, self.ups[i].stride[0], dim=2)
             x = F.leaky_relu(x, modules.LRELU_SLOPE)
             x = self.ups[i](x)
             xs = None
             for j in range(self.num_kernels):
                 if xs is None:
-                    xs = self.resblocks[i * self.num_kernels + j](x)
+                    xs = self.resblocks[i * self.num_kernels + j](x, x_mask)
                 else:
-                    xs += self.resblocks[i * self.num_kernels + j](x)
+                    xs += self.resblocks[i * self.num_kernels + j](x, x_mask)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
         x = self.conv_post(x)
@@ -957,9 +963,8 @@ class SynthesizerTrn(nn.Module):
         o = self.dec((z * y_mask)[:, :, :], g=ge)
         return o, y_mask, (z, z_p, m_p, logs_p)
 
-    @torch.no_grad()
-    def decode(self, codes, text, refer, noise_scale=0.5, speed=1, sv_emb=None):
-        def get_ge(refer, sv_emb):
+    def get_ge(self, refer, sv_emb=None):
+        def _get_ge(refer, sv_emb):
             ge = None
             if refer is not None:
                 refer_lengths = torch.LongTensor([refer.size(2)]).to(refer.device)
@@ -977,11 +982,14 @@ class SynthesizerTrn(nn.Module):
         if type(refer) == list:
             ges = []
             for idx, _refer in enumerate(refer):
-                ge = get_ge(_refer, sv_emb[idx] if self.is_v2pro else None)
+                ge = _get_ge(_refer, sv_emb[idx] if self.is_v2pro else None)
                 ges.append(ge)
-            ge = torch.stack(ges, 0).mean(0)
-        else:
-            ge = get_ge(refer, sv_emb)
+            return torch.stack(ges, 0).mean(0)
+        return _get_ge(refer, sv_emb)
+
+    @torch.no_grad()
+    def decode(self, codes, text, refer, noise_scale=0.5, speed=1, sv_emb=None):
+        ge = self.get_ge(refer, sv_emb)
 
         y_lengths = torch.LongTensor([codes.size(2) * 2]).to(codes.device)
         text_lengths = torch.LongTensor([text.size(-1)]).to(text.device)
@@ -1004,6 +1012,46 @@ class SynthesizerTrn(nn.Module):
         o = self.dec((z * y_mask)[:, :, :], g=ge)
         return o
 
+    @torch.no_grad()
+    def batched_decode(self, codes, codes_lengths, text, text_lengths, refer, noise_scale=0.5, sv_emb=None):
+        """
+        decode() of a batch of sentences padded to the longest one. Attention, flow and vocoder convs are masked
+        per sentence, so every sentence matches its own decode() (with noise_scale=0, the noise is drawn per batch).
+
+        Args:
+            codes: (1, B, T) semantic tokens, right padded.
+            codes_lengths: (B,) number of semantic tokens of every sentence.
+            text: (B, T_text) phones, right padded.
+            text_lengths: (B,) number of phones of every sentence.
+            refer, sv_emb: as in decode(), shared by the whole batch.
+        Returns:
+            list of B waveforms (T_wav,), cut to the length of every sentence.
+        """
+        bsz = codes.size(1)
+        ge = self.get_ge(refer, sv_emb)
+        if ge is not None:
+            ge = ge.expand(bsz, -1, -1)
+
+        y_lengths = codes_lengths * 2
+
+        quantized = self.quantizer.decode(codes)
+        if self.semantic_frame_rate == "25hz":
+            quantized = F.interpolate(quantized, size=int(quantized.shape[-1] * 2), mode="nearest")
+        x, m_p, logs_p, y_mask = self.enc_p(
+            quantized,
+            y_lengths,
+            text,
+            text_lengths,
+            self.ge_to512(ge.transpose(2, 1)).transpose(2, 1) if self.is_v2pro else ge,
+        )
+        z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * noise_scale
+
+        z = self.flow(z_p, y_mask, g=ge, reverse=True)
+
+        o = self.dec(z * y_mask, g=ge, x_mask=y_mask)
+        upsample_rate = math.prod(self.upsample_rates)
+        return [o[i, 0, : int(y_lengths[i]) * upsample_rate] for i in range(bsz)]
+
     def extract_latent(self, x):
         ssl = self.ssl_proj(x)
         quantized, codes, commit_loss, quantized_list = self.quantizer(ssl)
@@ -1024,8 +1072,21 @@ class CFM(torch.nn.Module):
         self.use_conditioner_cache = True
 
     @torch.inference_mode()
-    def inference(self, mu, x_lens, prompt, n_timesteps, temperature=1.0, inference_cfg_rate=0):
-        """Forward diffusion"""
+    def inference(
+        self,
+        mu,
+        x_lens,
+        prompt,
+        n_timesteps,
+        temperature=1.0,
+        inference_cfg_rate=0,
+        solver="euler",
+        sway=0.0,
+        adaptive_tol=0.0,
+        max_steps=None,
+        return_steps=False,
+    ):
+        """Forward diffusion, see cfm_solver.solve for solver, sway, adaptive_tol and max_steps"""
         B, T = mu.size(0), mu.size(1)
         x = torch.randn([B, self.in_channels, T], device=mu.device, dtype=mu.dtype) * temperature
         prompt_len = prompt.size(-1)
@@ -1033,14 +1094,14 @@ class CFM(torch.nn.Module):
         prompt_x[..., :prompt_len] = prompt[..., :prompt_len]
         x[..., :prompt_len] = 0
         mu = mu.transpose(2, 1)
-        t = 0
-        d = 1 / n_timesteps
-        text_cache = None
-        text_cfg_cache = None
-        dt_cache = None
-        d_tensor = torch.ones(x.shape[0], device=x.device, dtype=mu.dtype) * d
-        for j in range(n_timesteps):
+        # the step size embedding (dt) is only reused while the step size does not change
+        cache = {"text": None, "text_cfg": None, "dt": None, "d": None}
+
+        def velocity(x, t, d):
             t_tensor = torch.ones(x.shape[0], device=x.device, dtype=mu.dtype) * t
+            d_tensor = torch.ones(x.shape[0], device=x.device, dtype=mu.dtype) * d
+            if cache["d"] != d:
+                cache["dt"] = None
             # v_pred = model(x, t_tensor, d_tensor, **extra_args)
             v_pred, text_emb, dt = self.estimator(
                 x,
@@ -1053,13 +1114,14 @@ class CFM(torch.nn.Module):
                 drop_audio_cond=False,
                 drop_text=False,
                 infer=True,
-                text_cache=text_cache,
-                dt_cache=dt_cache,
+                text_cache=cache["text"],
+                dt_cache=cache["dt"],
             )
             v_pred = v_pred.transpose(2, 1)
             if self.use_conditioner_cache:
-                text_cache = text_emb
-                dt_cache = dt
+                cache["text"] = text_emb
+                cache["dt"] = dt
+                cache["d"] = d
             if inference_cfg_rate > 1e-5:
                 neg, text_cfg_emb, _ = self.estimator(
                     x,
@@ -1072,16 +1134,22 @@ class CFM(torch.nn.Module):
                     drop_audio_cond=True,
                     drop_text=True,
                     infer=True,
-                    text_cache=text_cfg_cache,
-                    dt_cache=dt_cache,
+                    text_cache=cache["text_cfg"],
+                    dt_cache=cache["dt"],
                 )
                 neg = neg.transpose(2, 1)
                 if self.use_conditioner_cache:
-                    text_cfg_cache = text_cfg_emb
+                    cache["text_cfg"] = text_cfg_emb
                 v_pred = v_pred + (v_pred - neg) * inference_cfg_rate
-            x = x + d * v_pred
-            t = t + d
-            x[:, :, :prompt_len] = 0
+            # the prompt part of x stays 0
+            v_pred[:, :, :prompt_len] = 0
+            return v_pred
+
+        x, steps = cfm_solver.solve(
+            velocity, x, cfm_solver.timesteps(n_timesteps, sway), solver, adaptive_tol, max_steps
+        )
+        if return_steps:
+            return x, steps
         return x
 
     def forward(self, x1, x_lens, prompt_lens, mu, use_grad_ckpt):
@@ -83,13 +83,15 @@ if os.path.exists(txt_path) == False:
 
         return phone_level_feature.T
 
-    def process(data, res):
+    def process(data, res, normalized):
         for name, text, lan in data:
             try:
                 name = clean_path(name)
                 name = os.path.basename(name)
                 print(name)
-                phones, word2ph, norm_text = clean_text(text.replace("%", "-").replace("￥", ","), lan, version)
+                text = text.replace("%", "-").replace("￥", ",")
+                norm_text = normalized.get(text) if lan == "zh" else None
+                phones, word2ph, norm_text = clean_text(text, lan, version, norm_text)
                 path_bert = "%s/%s.pt" % (bert_dir, name)
                 if os.path.exists(path_bert) == False and lan == "zh":
                     bert_feature = get_bert_feature(norm_text, word2ph)
@@ -102,6 +104,24 @@ if os.path.exists(txt_path) == False:
             except:
                 print(name, text, traceback.format_exc())
 
+    def prefetch(data):
+        # g2pw一次推理一批中文文本的多音字，process中逐条g2p时直接命中缓存
+        # 返回 原文本 -> 规范化后的文本，process中不再重复规范化
+        if version == "v1":
+            return {}
+        texts = [text.replace("%", "-").replace("￥", ",") for _, text, lan in data if lan == "zh"]
+        if len(texts) == 0:
+            return {}
+        try:
+            from text import chinese2
+
+            normalized = {text: chinese2.text_normalize(text) for text in texts}
+            chinese2.prefetch(list(normalized.values()))
+            return normalized
+        except:
+            print(traceback.format_exc())
+            return {}
+
     todo = []
     res = []
     with open(inp_text, "r", encoding="utf8") as f:
@@ -135,7 +155,10 @@ if os.path.exists(txt_path) == False:
         except:
             print(line, traceback.format_exc())
 
-    process(todo, res)
+    batch_size = 64
+    for i in range(0, len(todo), batch_size):
+        normalized = prefetch(todo[i : i + batch_size])
+        process(todo[i : i + batch_size], res, normalized)
     opt = []
     for name, phones, word2ph, norm_text in res:
         opt.append("%s\t%s\t%s\t%s" % (name, phones, word2ph, norm_text))
@@ -26,14 +26,26 @@ class SV:
         self.is_half=is_half
 
     def compute_embedding3(self, wav):
+        return self.compute_embeddings(list(wav))
+
+    def compute_embeddings(self, wavs):
+        """
+        Speaker embeddings of several 16k waveforms of any length, (n,) or (1, n) each, as one (len(wavs), dim) tensor.
+        The fbank of all waveforms is computed in one call. Waveforms with the same number of frames share an
+        ERes2NetV2 pass, the others get their own, padding would change the time average of forward3.
+        """
         with torch.no_grad():
             if self.is_half == True:
-                wav = wav.half()
+                wavs = [wav.half() for wav in wavs]
             else:
-                wav = wav.float()
-            feat = torch.stack(
-                [Kaldi.fbank(wav0.unsqueeze(0), num_mel_bins=80, sample_frequency=16000, dither=0) for wav0 in wav]
-            )
-            sv_emb = self.embedding_model.forward3(feat)
-            
-        return sv_emb
+                wavs = [wav.float() for wav in wavs]
+            feats = Kaldi.fbank_batch(wavs, num_mel_bins=80, sample_frequency=16000, dither=0)
+            groups = {}
+            for i, feat in enumerate(feats):
+                groups.setdefault(feat.shape[0], []).append(i)
+            sv_emb = [None] * len(feats)
+            for index in groups.values():
+                embs = self.embedding_model.forward3(torch.stack([feats[i] for i in index]))
+                for i, emb in zip(index, embs):
+                    sv_emb[i] = emb
+        return torch.stack(sv_emb)
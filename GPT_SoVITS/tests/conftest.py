@@ -0,0 +1,55 @@
+import os
+import sys
+import types
+
+import pytest
+
+# to import modules the way the inference code does: from GPT_SoVITS (AR, TTS_infer_pack, text) and the repo root (tools)
+gpt_sovits_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.dirname(gpt_sovits_dir))
+sys.path.append(gpt_sovits_dir)
+
+# TTS_infer_pack/__init__ imports TTS.py and with it the whole inference stack, register the package
+# without running it so that its standalone modules (scheduler, caches) can be imported on their own
+if "TTS_infer_pack" not in sys.modules:
+    package = types.ModuleType("TTS_infer_pack")
+    package.__path__ = [os.path.join(gpt_sovits_dir, "TTS_infer_pack")]
+    sys.modules["TTS_infer_pack"] = package
+
+T2S_CONFIG = {
+    "model": {
+        "hidden_dim": 64,
+        "embedding_dim": 64,
+        "head": 4,
+        "n_layer": 2,
+        "vocab_size": 65,
+        "phoneme_vocab_size": 32,
+        "dropout": 0.0,
+        "EOS": 64,
+    }
+}
+
+
+def build_t2s_model():
+    """A small randomly initialized Text2SemanticDecoder, its greedy decodes end with EOS after 70-200 steps."""
+    import torch
+    from AR.models.t2s_model import Text2SemanticDecoder
+
+    torch.manual_seed(0)
+    return Text2SemanticDecoder(T2S_CONFIG).eval()
+
+
+@pytest.fixture(scope="session")
+def t2s_model():
+    return build_t2s_model()
+
+
+def make_t2s_inputs(lens, prompt_len=10, seed=1):
+    """(x, x_lens, prompts, bert_feature) of len(lens) sentences sharing one random prompt length."""
+    import torch
+
+    generator = torch.Generator().manual_seed(seed)
+    x = [torch.randint(0, 32, (n,), generator=generator) for n in lens]
+    bert = [torch.randn(1024, n, generator=generator) for n in lens]
+    prompts = torch.randint(0, 64, (len(lens), prompt_len), generator=generator)
+    return x, torch.tensor(lens), prompts, bert
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+try:
+    # english.py builds its g2p at import time and needs g2p_en, wordsegment and the nltk data
+    from text import english
+except (ImportError, LookupError) as e:
+    pytest.skip(f"text.english is unavailable: {e}", allow_module_level=True)
+
+
+def make_cache(path, **kwargs):
+    kwargs.setdefault("flush_every", 1000)
+    return english.OOVCache(str(path), **kwargs)
+
+
+@pytest.fixture
+def dict_files(tmp_path, monkeypatch):
+    """Point the stamp at copies of the dictionaries and of english.py, so tests can change them."""
+    paths = {}
+    for name in ["CMU_DICT_PATH", "CMU_DICT_FAST_PATH", "CMU_DICT_HOT_PATH", "__file__"]:
+        path = tmp_path / f"{name.lower()}.txt"
+        path.write_text(name, encoding="utf-8")
+        monkeypatch.setattr(english, name, str(path))
+        paths[name] = path
+    return paths
+
+
+def test_round_trip(tmp_path, dict_files):
+    path = tmp_path / "oov.pickle"
+    cache = make_cache(path)
+    cache.put("gptsovits", ["JH", "IY1"])
+    cache.put("langsegmenter", ["L", "AE1", "NG"])
+    assert not path.exists()  # below flush_every nothing is written yet
+    cache.flush()
+
+    reopened = make_cache(path)
+    assert len(reopened) == 2
+    assert reopened.get("gptsovits") == ["JH", "IY1"]
+    assert reopened.get("langsegmenter") == ["L", "AE1", "NG"]
+    assert reopened.get("missing") is None
+    # the returned phones are copies
+    reopened.get("gptsovits").append("X")
+    assert reopened.get("gptsovits") == ["JH", "IY1"]
+
+
+def test_flush_every_and_lru_on_load(tmp_path, dict_files):
+    path = tmp_path / "oov.pickle"
+    cache = make_cache(path, flush_every=3)
+    for i in range(3):
+        cache.put(f"word{i}", [f"P{i}"])
+    assert path.exists()
+    cache.get("word0")  # most recently used now
+    cache.put("word3", ["P3"])
+    cache.flush()
+
+    reopened = make_cache(path, max_entries=2)
+    assert len(reopened) == 2
+    assert reopened.get("word0") == ["P0"] and reopened.get("word3") == ["P3"]
+    assert reopened.get("word1") is None
+
+
+@pytest.mark.parametrize("name", ["CMU_DICT_PATH", "CMU_DICT_HOT_PATH", "__file__"])
+def test_changed_files_invalidate(tmp_path, dict_files, name):
+    path = tmp_path / "oov.pickle"
+    cache = make_cache(path)
+    cache.put("gptsovits", ["JH", "IY1"])
+    cache.flush()
+    assert len(make_cache(path)) == 1
+
+    dict_files[name].write_text(f"{name} changed", encoding="utf-8")
+    reopened = make_cache(path)
+    assert len(reopened) == 0 and reopened.get("gptsovits") is None
+
+
+def test_disabled_or_corrupted(tmp_path, dict_files):
+    path = tmp_path / "oov.pickle"
+    disabled = make_cache(path, max_entries=0)
+    disabled.put("gptsovits", ["JH", "IY1"])
+    disabled.flush()
+    assert len(disabled) == 0 and not path.exists()
+
+    path.write_bytes(b"not a pickle")
+    cache = make_cache(path)
+    assert len(cache) == 0
+    cache.put("gptsovits", ["JH", "IY1"])
+    cache.flush()
+    assert make_cache(path).get("gptsovits") == ["JH", "IY1"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
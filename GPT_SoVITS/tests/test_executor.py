@@ -0,0 +1,121 @@
+import asyncio
+import gc
+import threading
+
+import pytest
+from gsvi_server.executor import QueueFullError, TaskExecutor
+
+
+class Synthesis:
+    """A streaming task like tts_infer_stream: yields chunks until it is told to stop, records its close."""
+
+    def __init__(self, chunks=None, released=False):
+        self.chunks = chunks
+        self.release = threading.Event()
+        if released:
+            self.release.set()
+        self.started = threading.Event()
+        self.closed = threading.Event()
+        self.thread = None
+
+    def __call__(self):
+        return self.generate(), "合成成功"
+
+    def generate(self):
+        self.thread = threading.current_thread().name
+        self.started.set()
+        try:
+            for i in range(self.chunks or 10**9):
+                yield b"chunk %d" % i
+                if i == 0:
+                    self.release.wait(10)
+        finally:
+            self.closed.set()
+
+
+async def wait_for(event: threading.Event):
+    assert await asyncio.to_thread(event.wait, 10)
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 30))
+
+
+def test_streams_hold_workers_and_queue():
+    async def main():
+        executor = TaskExecutor("test-stream", workers=2, max_queue=1)
+        first, second, third = Synthesis(chunks=3), Synthesis(chunks=3), Synthesis(chunks=3)
+        streams = [await executor.submit(first), await executor.submit(second)]
+        assert [msg for _, msg in streams] == ["合成成功", "合成成功"]
+        await wait_for(first.started)
+        await wait_for(second.started)
+        assert first.thread != second.thread and first.thread.startswith("test-stream")
+
+        # both workers are busy until their streams end: one more request queues, the next is rejected
+        queued = asyncio.ensure_future(executor.submit(third))
+        await asyncio.sleep(0.2)
+        assert not queued.done() and not third.started.is_set()
+        with pytest.raises(QueueFullError):
+            await executor.submit(Synthesis())
+        stats = executor.stats()
+        assert (stats["active"], stats["queued"], stats["rejected"]) == (2, 1, 1)
+
+        first.release.set()
+        assert [chunk async for chunk in streams[0][0]] == [b"chunk 0", b"chunk 1", b"chunk 2"]
+        stream, _ = await queued
+        await wait_for(first.closed)
+        third.release.set()
+        assert [chunk async for chunk in stream] == [b"chunk 0", b"chunk 1", b"chunk 2"]
+        assert third.thread == first.thread
+        second.release.set()
+        assert len([chunk async for chunk in streams[1][0]]) == 3
+        await asyncio.sleep(0.1)
+        stats = executor.stats()
+        assert (stats["active"], stats["completed"], stats["failed"]) == (0, 3, 0)
+        assert stats["wait_p95"] >= 0.2
+
+    run(main())
+
+
+def test_disconnect_releases_the_worker():
+    async def main():
+        executor = TaskExecutor("test-disconnect", workers=1, max_queue=1)
+        endless = Synthesis(released=True)
+        stream, _ = await executor.submit(endless)
+        chunks = stream.__aiter__()
+        assert await chunks.__anext__() == b"chunk 0"
+        await chunks.aclose()  # the client went away mid stream
+        await wait_for(endless.closed)
+
+        # a stream dropped before the response started is closed as well
+        unread = Synthesis(released=True)
+        stream, _ = await executor.submit(unread)
+        await wait_for(unread.started)
+        del stream
+        gc.collect()
+        await wait_for(unread.closed)
+
+        stream, _ = await executor.submit(Synthesis(chunks=1, released=True))
+        assert [chunk async for chunk in stream] == [b"chunk 0"]
+
+    run(main())
+
+
+def test_stream_errors_reach_the_reader():
+    def failing():
+        yield b"chunk 0"
+        raise RuntimeError("synthesis failed")
+
+    async def main():
+        executor = TaskExecutor("test-error", workers=1)
+        stream, _ = await executor.submit(lambda: (failing(), "合成成功"))
+        received = []
+        with pytest.raises(RuntimeError, match="synthesis failed"):
+            async for chunk in stream:
+                received.append(chunk)
+        assert received == [b"chunk 0"]
+        await asyncio.sleep(0.1)
+        assert executor.stats()["failed"] == 1
+        assert await executor.submit(lambda: 42) == 42
+
+    run(main())
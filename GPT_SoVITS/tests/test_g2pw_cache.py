@@ -0,0 +1,127 @@
+import os
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+onnx_api = pytest.importorskip("text.g2pw.onnx_api")
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+G2PW_MODEL_DIR = os.path.join(REPO_DIR, "GPT_SoVITS", "text", "G2PWModel")
+BERT_DIR = os.path.join(REPO_DIR, "GPT_SoVITS", "pretrained_models", "chinese-roberta-wwm-ext-large")
+
+SENTENCES = ["银行行长重新出发", "长大了就行", "重重的行李", "你好", "行行重行行，与君生别离", "长"]
+
+
+class CharTokenizer:
+    def tokenize(self, word):
+        return [word]
+
+    def convert_tokens_to_ids(self, tokens):
+        return [sum(map(ord, token)) % 997 for token in tokens]
+
+
+class FakeSession:
+    """Scores depend on the query and on the unmasked tokens of its row only, like the real model."""
+
+    def __init__(self, num_labels):
+        self.num_labels = num_labels
+        self.calls = []
+
+    def run(self, outputs, feeds):
+        self.calls.append(feeds["input_ids"].shape)
+        tokens = (feeds["input_ids"] * feeds["attention_mask"]).sum(axis=1)
+        label = (feeds["char_ids"] * 31 + feeds["position_ids"] * 7 + tokens) % self.num_labels
+        return [np.eye(self.num_labels, dtype=np.float32)[label]]
+
+
+def make_converter(cache_size=4096, max_batch_tokens=16384):
+    """A G2PWOnnxConverter on a fake session and tokenizer, the g2pW model is not needed."""
+    converter = object.__new__(onnx_api.G2PWOnnxConverter)
+    converter.labels = [f"p{i}" for i in range(11)]
+    converter.chars = sorted("行长重")
+    converter.char2phonemes = {char: list(range(11)) for char in converter.chars}
+    converter.polyphonic_chars_new = set(converter.chars)
+    converter.monophonic_chars_dict = {}
+    converter.char_bopomofo_dict = {}
+    converter.config = SimpleNamespace(use_mask=True, use_char_phoneme=False)
+    converter.enable_opencc = False
+    converter.style_convert_func = lambda x: x
+    converter.tokenizer = CharTokenizer()
+    converter.session_g2pW = FakeSession(len(converter.labels))
+    converter.cache_size = cache_size
+    converter.max_batch_tokens = max_batch_tokens
+    converter._cache = OrderedDict()
+    return converter
+
+
+def count_predictions(converter):
+    predicted = []
+    predict = converter._predict
+
+    def _predict(sentences):
+        predicted.append(list(sentences))
+        return predict(sentences)
+
+    converter._predict = _predict
+    return predicted
+
+
+def test_batched_matches_per_sentence():
+    converter = make_converter(cache_size=0)
+    expected = [converter._predict([sent])[0] for sent in SENTENCES]
+    assert all(len(result) == len(sent) for result, sent in zip(expected, SENTENCES))
+    assert converter._predict(SENTENCES) == expected
+    # small token budgets split the queries into several padded batches
+    for max_batch_tokens in (1, 12, 40):
+        converter = make_converter(cache_size=0, max_batch_tokens=max_batch_tokens)
+        assert converter(SENTENCES) == expected
+        assert len(converter.session_g2pW.calls) > 1
+        assert all(rows * tokens <= max(max_batch_tokens, tokens) for rows, tokens in converter.session_g2pW.calls)
+
+
+def test_cache_is_lru():
+    converter = make_converter(cache_size=2)
+    predicted = count_predictions(converter)
+    first = converter(["银行", "长大", "银行"])
+    assert predicted == [["银行", "长大"]]  # one batch, duplicates predicted once
+    assert converter(["银行"]) == first[:1] and len(predicted) == 1
+    converter(["重新"])  # evicts 长大, 银行 was used more recently
+    assert list(converter._cache) == ["银行", "重新"]
+    converter(["长大"])
+    assert predicted[-1] == ["长大"]
+    # results are copies, changing them leaves the cache alone
+    converter(["银行"])[0][0] = "changed"
+    assert converter(["银行"]) == first[:1]
+
+
+def test_prefetch_fills_the_cache():
+    converter = make_converter()
+    predicted = count_predictions(converter)
+    converter.prefetch(SENTENCES[:3])
+    converter.prefetch(SENTENCES[1:4])
+    assert predicted == [SENTENCES[:3], [SENTENCES[3]]]
+    assert converter(SENTENCES[:4]) == make_converter(cache_size=0)._predict(SENTENCES[:4])
+    assert len(predicted) == 2
+
+
+def test_cache_disabled_or_too_small():
+    expected = make_converter(cache_size=0)._predict(SENTENCES)
+    converter = make_converter(cache_size=0)
+    assert converter(SENTENCES) == expected and len(converter._cache) == 0
+    # more distinct sentences than the cache holds are still answered
+    converter = make_converter(cache_size=2)
+    assert converter(SENTENCES) == expected
+    assert len(converter._cache) == 2
+
+
+@pytest.mark.skipif(
+    not (os.path.exists(G2PW_MODEL_DIR) and os.path.exists(BERT_DIR)), reason="needs the g2pW model and its tokenizer"
+)
+def test_model_batched_matches_per_sentence():
+    converter = onnx_api.G2PWOnnxConverter(G2PW_MODEL_DIR, style="pinyin", model_source=BERT_DIR, cache_size=0)
+    expected = [converter([sent])[0] for sent in SENTENCES]
+    assert converter(SENTENCES) == expected
+    converter.max_batch_tokens = 16
+    assert converter(SENTENCES) == expected
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+pytest.importorskip("split_lang")
+pytest.importorskip("fast_langdetect")
+
+from text.LangSegmenter.langsegmenter import LangSegmenter, fast_path
+
+LANGDETECT_MODEL = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pretrained_models", "fast_langdetect", "lid.176.bin"
+)
+
+
+def test_fast_path_with_default_language():
+    assert fast_path(" 今天天气很好。2024年 ", "zh") == [{"lang": "zh", "text": "今天天气很好。2024年"}]
+    assert fast_path("東京都に行きます", "ja") == [{"lang": "ja", "text": "東京都に行きます"}]
+    # Latin letters may be another language, they go through the splitter
+    assert fast_path("我们用ThinkPad", "zh") is None
+
+
+def test_fast_path_pure_english():
+    assert fast_path("It's not a bug, it's a feature -- isn't it?") == [
+        {"lang": "en", "text": "It's not a bug, it's a feature -- isn't it?"}
+    ]
+    assert fast_path("Hello 2024") is None
+    assert fast_path("   ") is None
+
+
+def test_fast_path_leaves_han_only_text_to_detection():
+    # kanji-only text may be Japanese, auto mode keeps detecting its language
+    for text in ["東京都", "今天天气很好。", "春眠不觉晓，处处闻啼鸟。"]:
+        assert fast_path(text) is None
+
+
+@pytest.mark.skipif(not os.path.exists(LANGDETECT_MODEL), reason="needs the fast_langdetect model")
+@pytest.mark.parametrize(
+    "text, default_lang",
+    [
+        (" 今天天气很好。2024年 ", "zh"),
+        (" \n 你好 \n\n 世界 ", "zh"),
+        ("你好\u3000世界", "zh"),
+        ("第1章：2024-10-18，12:30", "zh"),
+        ("一，二。\n\n三！", "zh"),
+        ("100%", "zh"),
+        ("東京都に行きます。", "ja"),
+        ("こんにちは\n\n世界", "ja"),
+        ("안녕하세요 123", "ko"),
+        ("12 34", "ko"),
+        ("  Hello,  world!  ", ""),
+        ("It's not a bug, it's a feature -- isn't it?", ""),
+        ('"Hello," she said.', ""),
+        ("Hello\t\tworld  .", ""),
+        ("Hello, world. \n", ""),
+        ("(a) b [c] {d}", ""),
+        ("...Hello!!!", ""),
+        ("x  ", ""),
+    ],
+)
+def test_fast_path_matches_splitter(monkeypatch, text, default_lang):
+    fast = fast_path(text, default_lang)
+    assert fast is not None
+    monkeypatch.setattr(LangSegmenter, "use_fast_path", False)
+    assert LangSegmenter.getTexts(text, default_lang) == fast
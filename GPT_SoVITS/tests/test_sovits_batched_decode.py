@@ -0,0 +1,48 @@
+import json
+import math
+import os
+
+import pytest
+import torch
+from module.models import SynthesizerTrn
+
+S2_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "s2.json")
+
+
+@pytest.fixture(scope="module")
+def vits_model():
+    """A randomly initialized v2 SynthesizerTrn of the s2.json architecture."""
+    with open(S2_CONFIG, "r", encoding="utf-8") as f:
+        hps = json.load(f)
+    hps["model"]["version"] = "v2"
+    hps["model"]["semantic_frame_rate"] = "25hz"
+    torch.manual_seed(0)
+    return SynthesizerTrn(
+        hps["data"]["filter_length"] // 2 + 1,
+        hps["train"]["segment_size"] // hps["data"]["hop_length"],
+        n_speakers=hps["data"]["n_speakers"],
+        **hps["model"],
+    ).eval()
+
+
+def test_batched_decode_matches_decode(vits_model):
+    generator = torch.Generator().manual_seed(1)
+    codes = [torch.randint(0, 1024, (n,), generator=generator) for n in (9, 16, 5)]
+    n_symbols = vits_model.enc_p.text_embedding.num_embeddings
+    phones = [torch.randint(0, n_symbols, (n,), generator=generator) for n in (6, 9, 3)]
+    refer = [torch.randn(1, vits_model.spec_channels, 100, generator=generator)]
+
+    with torch.no_grad():
+        batched = vits_model.batched_decode(
+            torch.nn.utils.rnn.pad_sequence(codes, batch_first=True).unsqueeze(0),
+            torch.LongTensor([item.shape[0] for item in codes]),
+            torch.nn.utils.rnn.pad_sequence(phones, batch_first=True),
+            torch.LongTensor([item.shape[0] for item in phones]),
+            refer,
+            noise_scale=0,
+        )
+        for item, item_phones, audio in zip(codes, phones, batched):
+            expected = vits_model.decode(item[None, None], item_phones[None], refer, noise_scale=0)[0, 0]
+            assert audio.shape == expected.shape == (item.shape[0] * 2 * math.prod(vits_model.upsample_rates),)
+            # the padded rows too, up to their last sample
+            torch.testing.assert_close(audio, expected, rtol=0, atol=1e-5 * float(expected.abs().max()))
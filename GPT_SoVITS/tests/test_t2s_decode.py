@@ -0,0 +1,149 @@
+import math
+
+import pytest
+import torch
+from AR.models.utils import detect_loops
+from conftest import build_t2s_model, make_t2s_inputs
+
+LENS = [7, 12, 5, 9]
+
+
+def decode(model, method, lens=LENS, **kwargs):
+    x, x_lens, prompts, bert = make_t2s_inputs(lens)
+    kwargs.setdefault("top_k", 1)
+    kwargs.setdefault("early_stop_num", 200)
+    with torch.no_grad():
+        return getattr(model, method)(x, x_lens, prompts, bert, **kwargs)
+
+
+@pytest.mark.parametrize("method", ["infer_panel_batch_infer", "infer_panel_batch_infer_static"])
+def test_deferred_eos_sync_matches_per_step_sync(t2s_model, method):
+    y_list, idx_list = decode(t2s_model, method, eos_sync_every=1)
+    # rows reach EOS between two syncs and run on until the next one
+    assert any((idx + 1) % 8 != 0 for idx in idx_list)
+    deferred_y, deferred_idx = decode(t2s_model, method, eos_sync_every=8)
+    assert deferred_idx == idx_list
+    for y, other in zip(deferred_y, y_list):
+        assert torch.equal(y, other)
+
+
+def test_deferred_eos_sync_in_stream(t2s_model):
+    y_list, idx_list = decode(t2s_model, "infer_panel_batch_infer", lens=LENS[:1])
+    assert (idx_list[0] + 1) % 8 != 0
+    x, x_lens, prompts, bert = make_t2s_inputs(LENS[:1])
+    with torch.no_grad():
+        chunks = list(
+            t2s_model.infer_panel_stream(
+                x, x_lens, prompts, bert, top_k=1, early_stop_num=200, eos_sync_every=8, chunk_tokens=1000
+            )
+        )
+    assert len(chunks) == 1
+    tokens, last = chunks[0]
+    assert last
+    assert torch.equal(tokens, y_list[0][prompts.shape[1] :])
+
+
+def test_token_budget():
+    from AR.models.utils import token_budget
+
+    # reference: 40 semantic tokens for 20 phones, i.e. 2 tokens per phone
+    assert token_budget([10, 3], 20, 40, 2.5) == [10 * 2 * 2.5 + 25, 3 * 2 * 2.5 + 25]
+    assert token_budget([7], 3, 10, 1.0) == [math.ceil(7 * 10 / 3) + 25]
+    assert token_budget([10], 20, 40, 0) is None
+    assert token_budget([10], 0, 40, 2.5) is None
+
+
+@pytest.mark.parametrize("sync_every", [1, 8])
+def test_max_new_tokens_caps_rows(t2s_model, sync_every):
+    y_list, idx_list = decode(t2s_model, "infer_panel_batch_infer")
+    caps = [5, 1000, 30, 9]
+    capped_y, capped_idx = decode(t2s_model, "infer_panel_batch_infer", max_new_tokens=caps, eos_sync_every=sync_every)
+    for y, idx, cap, capped, capped_at in zip(y_list, idx_list, caps, capped_y, capped_idx):
+        # a row stops at its budget with the same tokens, rows within their budget are unchanged
+        assert capped_at == min(idx, cap)
+        assert torch.equal(capped, y[: 10 + capped_at])
+    assert t2s_model.row_caps(2, 200, [300, 0]) == [200, 1]
+
+
+def test_detect_loops():
+    tail = torch.tensor(
+        [
+            [1, 2, 3, 4, 5, 6, 1, 2, 3, 1, 2, 3, 1, 2, 3, 1, 2, 3],
+            [9, 8, 7, 6, 5, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 4],
+            [1, 2, 3, 4, 5, 6, 1, 2, 3, 1, 2, 3, 1, 2, 3, 1, 2, 4],
+            [5, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1, 2, 1],
+        ]
+    )
+    assert detect_loops(tail, 9, 3).tolist() == [3, 1, 0, 2]
+    # a period longer than max_period is not a loop
+    assert detect_loops(tail, 9, 2).tolist() == [0, 1, 0, 2]
+
+
+def test_mark_loops(t2s_model):
+    y = torch.tensor([[1, 2] * 8, list(range(16)), [3] * 16])
+    finish_idx = torch.tensor([-1, -1, 4])
+    # rows already finished keep their step, looping rows drop the repeating window
+    assert t2s_model.mark_loops(finish_idx, y, 20, 8).tolist() == [13, -1, 4]
+    assert t2s_model.mark_loops(finish_idx, y, 8, 8).tolist() == [-1, -1, 4]
+    assert t2s_model.mark_loops(finish_idx, y, 20, 0).tolist() == [-1, -1, 4]
+
+
+@pytest.fixture(scope="module")
+def looping_model():
+    """The test model always predicting token 7."""
+    model = build_t2s_model()
+    model.ar_predict_layer = torch.nn.Linear(64, 65)
+    torch.nn.init.zeros_(model.ar_predict_layer.weight)
+    torch.nn.init.zeros_(model.ar_predict_layer.bias)
+    model.ar_predict_layer.bias.data[7] = 10.0
+    return model
+
+
+@pytest.mark.parametrize("sync_every", [1, 8])
+def test_loop_detection_fires(looping_model, sync_every):
+    from TTS_infer_pack.t2s_scheduler import T2SScheduler
+
+    x, x_lens, prompts, bert = make_t2s_inputs([7, 12])
+    kwargs = {"top_k": 1, "early_stop_num": 200, "repetition_penalty": 1.0, "eos_sync_every": sync_every}
+    with torch.no_grad():
+        y_list, idx_list = looping_model.infer_panel_batch_infer(x, x_lens, prompts, bert, **kwargs)
+        assert idx_list == [200, 200]
+        y_list, idx_list = looping_model.infer_panel_batch_infer(x, x_lens, prompts, bert, loop_window=20, **kwargs)
+    # detected after window + max_period = 25 tokens (or the next sync), cut back to before the window
+    detected_at = 24 if sync_every == 1 else 31
+    assert idx_list == [detected_at - 20 + 1] * 2
+    for y, prompt in zip(y_list, prompts):
+        assert torch.equal(y, torch.cat([prompt, torch.full((idx_list[0],), 7)]))
+
+    scheduler = T2SScheduler(sync_every=sync_every, loop_window=20)
+    scheduled = scheduler.infer_panel(
+        looping_model, x, x_lens, prompts, bert, top_k=1, early_stop_num=200, repetition_penalty=1.0
+    )
+    assert scheduled[1] == idx_list
+    assert all(torch.equal(y, other) for y, other in zip(scheduled[0], y_list))
+
+
+def test_loop_detection_does_not_fire(t2s_model):
+    # the test model repeats short phrases (e.g. 41, 41, 41 or 5, 50, 4 three times) but is never stuck
+    y_list, idx_list = decode(t2s_model, "infer_panel_batch_infer", repetition_penalty=1.0)
+    looped_y, looped_idx = decode(t2s_model, "infer_panel_batch_infer", repetition_penalty=1.0, loop_window=20)
+    assert looped_idx == idx_list
+    assert all(torch.equal(y, other) for y, other in zip(looped_y, y_list))
+
+
+@pytest.mark.parametrize("lens", [[7], [7, 12, 5, 9]])
+def test_decode_graph_spans_match_static_decode(t2s_model, lens):
+    from AR.models.t2s_decode_graph import T2SDecodeGraph
+
+    y_list, idx_list = decode(t2s_model, "infer_panel_batch_infer_static", lens=lens)
+    graph = T2SDecodeGraph(t2s_model, [1, 4], capacity=512)
+    graph.MIN_SPAN = 32  # cross a few spans within the test decode
+    t2s_model.decode_graph = graph
+    try:
+        graph_y, graph_idx = decode(t2s_model, "infer_panel_batch_infer_static", lens=lens)
+    finally:
+        t2s_model.decode_graph = None
+    assert graph_idx == idx_list
+    assert all(torch.equal(y, other) for y, other in zip(graph_y, y_list))
+    assert {32, 64, 128} <= {span for _, span in graph.steps}
+    assert graph._span(1) == 32 and graph._span(300) == 512
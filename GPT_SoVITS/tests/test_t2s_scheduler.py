@@ -0,0 +1,167 @@
+import pytest
+import torch
+from AR.models.utils import T2SSampler
+from conftest import make_t2s_inputs
+from TTS_infer_pack.t2s_scheduler import T2SScheduler, _DecodeWorker, _T2SRequest
+
+GREEDY = (1, 1.0, 1.0, 1.35)
+
+
+def make_request(model, lens, seed, sampling=GREEDY, early_stop_num=200, max_new_tokens=None):
+    x, x_lens, prompts, bert = make_t2s_inputs(lens, seed=seed)
+    row_caps = model.row_caps(len(x), early_stop_num, max_new_tokens)
+    return _T2SRequest(x, x_lens, prompts, bert, x_lens.max(), sampling, row_caps)
+
+
+def batch_infer(model, request, **kwargs):
+    top_k, top_p, temperature, repetition_penalty = request.sampling
+    with torch.no_grad():
+        return model.infer_panel_batch_infer(
+            request.x,
+            request.x_lens,
+            request.prompts,
+            request.bert_feature,
+            top_k=top_k,
+            top_p=top_p,
+            early_stop_num=request.row_caps[0],
+            temperature=temperature,
+            repetition_penalty=repetition_penalty,
+            **kwargs,
+        )
+
+
+def run_worker(worker, schedule):
+    """Step the worker by hand, admitting schedule[step] (a list of requests) before that step."""
+    requests = [request for admitted in schedule.values() for request in admitted]
+    step = 0
+    with torch.no_grad():
+        while step <= max(schedule) or not all(request.done.is_set() for request in requests):
+            worker.step(schedule.get(step, []))
+            step += 1
+    return step
+
+
+def assert_same(result, expected):
+    y_list, idx_list = result
+    expected_y, expected_idx = expected
+    assert idx_list == expected_idx
+    for y, other in zip(y_list, expected_y):
+        assert torch.equal(y, other)
+
+
+@pytest.mark.parametrize("sync_every", [1, 8])
+def test_admission_mid_decode_matches_batch_infer(t2s_model, sync_every):
+    scheduler = T2SScheduler(max_batch_size=8, sync_every=sync_every)
+    worker = _DecodeWorker(scheduler, t2s_model)
+    first = make_request(t2s_model, [7, 12], seed=1)
+    second = make_request(t2s_model, [5, 9, 11], seed=2)
+    third = make_request(t2s_model, [15], seed=3)
+    run_worker(worker, {0: [first], 5: [second], 13: [third]})
+
+    for request in (first, second, third):
+        assert request.done.is_set() and request.error is None
+        assert_same((request.y_list, request.idx_list), batch_infer(t2s_model, request))
+
+
+def test_rows_retire_and_worker_resets(t2s_model):
+    scheduler = T2SScheduler(max_batch_size=8)
+    worker = _DecodeWorker(scheduler, t2s_model)
+    request = make_request(t2s_model, [7, 12, 5], seed=1, max_new_tokens=[3, 200, 6])
+    with torch.no_grad():
+        worker.step([request])
+        assert len(worker.rows) == 3 and worker.y.shape == (3, 11)
+        for _ in range(3):
+            worker.step([])
+        # the first row reached its cap of 3 tokens, the others keep decoding
+        assert [row[1] for row in worker.rows] == [1, 2]
+        assert request.idx_list[0] == 3 and request.y_list[0].shape[0] == 10 + 3
+        assert worker.y.shape[0] == worker.k_cache[0].shape[0] == worker.sampler.counts.shape[0] == 2
+        while not request.done.is_set():
+            worker.step([])
+    assert worker.rows == [] and worker.k_cache is None and worker.sampler is None
+    assert request.idx_list[2] == 6
+
+
+def test_admit_respects_max_batch_size(t2s_model):
+    scheduler = T2SScheduler(max_batch_size=4)
+    worker = _DecodeWorker(scheduler, t2s_model)
+    big = make_request(t2s_model, [7, 12, 5, 9, 11], seed=1)
+    small = make_request(t2s_model, [7, 12], seed=2)
+    last = make_request(t2s_model, [7], seed=3)
+    worker.pending = [big, small, last]
+    # a request larger than the whole batch runs alone
+    assert scheduler._admit(worker) == [big]
+    with torch.no_grad():
+        worker.step([big])
+    assert scheduler._admit(worker) == []
+    worker.reset()
+    assert scheduler._admit(worker) == [small, last]
+    assert worker.pending == []
+
+
+@pytest.mark.parametrize("sync_every", [1, 8])
+def test_concurrent_infer_panel_matches_batch_infer(t2s_model, sync_every):
+    import threading
+
+    scheduler = T2SScheduler(max_batch_size=8, sync_every=sync_every)
+    requests = [make_request(t2s_model, lens, seed) for seed, lens in enumerate([[7, 12], [5], [9, 11, 6]])]
+    results = [None] * len(requests)
+
+    def call(i):
+        request = requests[i]
+        results[i] = scheduler.infer_panel(
+            t2s_model,
+            request.x,
+            request.x_lens,
+            request.prompts,
+            request.bert_feature,
+            top_k=1,
+            early_stop_num=200,
+        )
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    for request, result in zip(requests, results):
+        assert_same(result, batch_infer(t2s_model, request))
+    assert scheduler.stats()["rows"] == 0
+
+
+def test_per_row_sampling_parameters(t2s_model):
+    scheduler = T2SScheduler(max_batch_size=8)
+    worker = _DecodeWorker(scheduler, t2s_model)
+    greedy = make_request(t2s_model, [7, 12], seed=1)
+    sampled = make_request(t2s_model, [5, 9], seed=2, sampling=(50, 0.9, 1.5, 1.0))
+    torch.manual_seed(0)
+    run_worker(worker, {0: [sampled], 2: [greedy]})
+    # sharing the batch (and the sampler call) with a sampled request leaves greedy rows greedy
+    assert_same((greedy.y_list, greedy.idx_list), batch_infer(t2s_model, greedy))
+
+
+def test_sampler_rows_match_single_row_samplers():
+    torch.manual_seed(0)
+    prompts = torch.randint(0, 64, (3, 10))
+    logits = torch.randn(3, 65)
+    params = [(1, 1.0, 1.0, 1.35), (3, 1.0, 1.0, 2.0), (-1, 0.5, 0.7, 1.0)]
+    sampler = T2SSampler(prompts, 65, *[[p[i] for p in params] for i in range(4)])
+    samples, tokens = sampler(logits)
+    counts = sampler.counts.clone()
+    for row, (top_k, top_p, temperature, repetition_penalty) in enumerate(params):
+        single = T2SSampler(prompts[row : row + 1], 65, top_k, top_p, temperature, repetition_penalty)
+        _, single_tokens = single(logits[row : row + 1])
+        # the penalized argmax does not depend on the random draw
+        assert tokens[row] == single_tokens[0]
+        penalized = torch.where(logits[row] < 0, logits[row] * repetition_penalty, logits[row] / repetition_penalty)
+        penalized = torch.where(torch.isin(torch.arange(65), prompts[row]), penalized, logits[row])
+        if top_k > 0:
+            assert samples[row, 0] in torch.topk(penalized, top_k).indices
+    assert samples[0, 0] == tokens[0]
+
+    # compact and extend move every per-row parameter and the token counts together
+    sampler.compact(torch.tensor([2, 0]))
+    assert sampler.top_k.tolist() == [-1, 1] and torch.equal(sampler.counts[1], counts[0])
+    sampler.extend(T2SSampler(prompts[1:2], 65, 3, 1.0, 1.0, 2.0))
+    assert sampler.top_k.tolist() == [-1, 1, 3] and sampler.counts.shape == (3, 65)
+    assert sampler.max_k == 65
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+
+import pytest
+import torch
+from TTS_infer_pack.text_cache import BERT_DIM, TextFeatureCache
+
+
+def make_entry(i: int, phones: int = 5):
+    generator = torch.Generator().manual_seed(i)
+    bert = torch.randn(BERT_DIM, phones, generator=generator).half().float()
+    return [i * 100 + j for j in range(phones)], bert, f"text {i}"
+
+
+def assert_entry(result, i: int, phones: int = 5):
+    assert result is not None
+    expected = make_entry(i, phones)
+    assert result[0] == expected[0] and result[2] == expected[2]
+    assert torch.equal(result[1], expected[1])
+
+
+def test_disk_tier_round_trip(tmp_path):
+    cache = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    for i in range(3):
+        cache.put(f"key {i}", *make_entry(i, 3 + i))
+    reopened = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    for i in range(3):
+        assert_entry(reopened.get(f"key {i}"), i, 3 + i)
+    assert reopened.get("missing") is None
+
+
+def test_two_writers_share_the_directory(tmp_path):
+    # two workers started on the same cache directory, each appending after the other
+    first = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    second = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    first.put("key 0", *make_entry(0))
+    second.put("key 1", *make_entry(1, 7))
+    first.put("key 2", *make_entry(2, 3))
+    second.put("key 0", *make_entry(0))  # already written by the other process, not appended again
+
+    for cache in (first, second, TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))):
+        assert_entry(cache.get("key 0"), 0)
+        assert_entry(cache.get("key 1"), 1, 7)
+        assert_entry(cache.get("key 2"), 2, 3)
+    assert os.path.getsize(tmp_path / "phones.bin") == (5 + 7 + 3) * 4
+    with open(tmp_path / "index.jsonl", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+
+def test_restart_keeps_entries_of_live_writers(tmp_path):
+    live = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    live.put("key 0", *make_entry(0))
+    # a crash left data without its index line
+    with open(tmp_path / "phones.bin", "ab") as f:
+        f.write(b"\0" * 8)
+    restarted = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    assert os.path.getsize(tmp_path / "phones.bin") == 5 * 4
+    live.put("key 1", *make_entry(1))
+    restarted.put("key 2", *make_entry(2))
+    for cache in (live, restarted):
+        for i in range(3):
+            assert_entry(cache.get(f"key {i}"), i)
+
+
+def _write_entries(cache_dir: str, first: int, count: int) -> None:
+    cache = TextFeatureCache(max_entries=0, cache_dir=cache_dir)
+    for i in range(first, first + count):
+        cache.put(f"key {i}", *make_entry(i, 1 + i % 7))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_concurrent_writer_processes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_write_entries, args=(str(tmp_path), i * 20, 20)) for i in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+    cache = TextFeatureCache(max_entries=0, cache_dir=str(tmp_path))
+    for i in range(60):
+        assert_entry(cache.get(f"key {i}"), i, 1 + i % 7)
@@ -0,0 +1,71 @@
+import io
+import threading
+
+import pytest
+from loguru import logger
+
+import gsvi_warmup_en_oov as warmup
+from tools.i18n.i18n import load_language_list
+
+# the format of tools/logger.py
+LOG_FORMAT = "<level>[{time:HH:mm:ss}] [{thread.name} | {level:<8}] [{module}] [{file.name}:{line}]: {message}</level>"
+
+
+def write_log() -> str:
+    """Log lines like a server run: request texts among model loading, timing and a diagnosed traceback."""
+    stream = io.StringIO()
+    sink = logger.add(stream, format=LOG_FORMAT, level="TRACE", backtrace=True, diagnose=True, colorize=False)
+    en_US = load_language_list("en_US")
+
+    def request():
+        logger.info("Loading BERT weights from GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large")
+        logger.info(f"{en_US['实际输入的参考文本:']} Welcome to Kotlinconf.")
+        logger.info(f"{en_US['前端处理后的文本(每句):']} Deploy ThinkPad fleets with Kubernetes.")
+        logger.info("前端处理后的文本(每句): 用GPTSoVITS合成，很快。")
+        logger.debug("T2S Decoding EOS [245 -> 611]")
+        try:
+            speakerName = {"unknownSpeaker": 1}
+            speakerName["missingKey"]
+        except KeyError:
+            logger.exception("Synthesis failed")
+
+    thread = threading.Thread(target=request, name="AnyIO worker thread")
+    thread.start()
+    thread.join()
+    logger.remove(sink)
+    return stream.getvalue()
+
+
+def test_read_lines_keeps_request_texts_of_runtime_logs():
+    content = write_log()
+    assert "Traceback" in content and "speakerName" in content
+    assert warmup.read_lines("runtime_20261018_120000.log", content) == [
+        "Welcome to Kotlinconf.",
+        "Deploy ThinkPad fleets with Kubernetes.",
+        "用GPTSoVITS合成，很快。",
+    ]
+    # other files are still read line by line
+    assert warmup.read_lines("texts.txt", "Hello Kubernetes\nSecond line") == ["Hello Kubernetes", "Second line"]
+    assert warmup.read_lines("train.list", "a.wav|spk|en|Hello Kubernetes") == ["Hello Kubernetes"]
+
+
+def test_warmup_oov_caches_only_request_words(tmp_path, monkeypatch):
+    try:
+        # english.py builds its g2p at import time and needs g2p_en, wordsegment and the nltk data
+        from text import english
+    except (ImportError, LookupError) as e:
+        pytest.skip(f"text.english is unavailable: {e}")
+
+    class RecordingG2p:
+        oov_cache = english.OOVCache(str(tmp_path / "oov.pickle"))
+
+        def qryword(self, word):
+            self.oov_cache.put(word.lower(), ["AH0"])
+
+    monkeypatch.setattr(english, "_g2p", RecordingG2p())
+    texts = warmup.read_lines("runtime.log", write_log())
+    assert english.warmup_oov(texts) == 9
+    assert sorted(english._g2p.oov_cache._entries) == sorted(
+        ["welcome", "to", "kotlinconf", "deploy", "thinkpad", "fleets", "with", "kubernetes", "gptsovits"]
+    )
+    assert (tmp_path / "oov.pickle").exists()
@@ -1,5 +1,6 @@
 import logging
 import re
+import string
 
 # jieba静音
 import jieba
@@ -14,46 +15,49 @@ fast_langdetect.infer._default_detector = fast_langdetect.infer.LangDetector(fas
 from split_lang import LangSplitter
 
 
+FULL_EN_PATTERN = re.compile(r'^(?=.*[A-Za-z])[A-Za-z0-9\s\u0020-\u007E\u2000-\u206F\u3000-\u303F\uFF00-\uFFEF]+$')
+
+# 来自wiki
+CJK_CHARS_PATTERN = re.compile(
+    r'[\u4E00-\u9FFF'           # CJK Unified Ideographs
+    r'\u3400-\u4DB5'            # CJK Extension A
+    r'\U00020000-\U0002A6DD'    # CJK Extension B
+    r'\U0002A700-\U0002B73F'    # CJK Extension C
+    r'\U0002B740-\U0002B81F'    # CJK Extension D
+    r'\U0002B820-\U0002CEAF'    # CJK Extension E
+    r'\U0002CEB0-\U0002EBEF'    # CJK Extension F
+    r'\U00030000-\U0003134A'    # CJK Extension G
+    r'\U00031350-\U000323AF'    # CJK Extension H
+    r'\U0002EBF0-\U0002EE5D'    # CJK Extension H
+    r'0-9、-〜。！？.!?… /]+'
+)
+
+JAKO_PATTERNS = {
+    "ja": re.compile(r"([\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]+(?:[0-9、-〜。！？.!?… ]+[\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]*)*)"),
+    "ko": re.compile(r"([\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]+(?:[0-9、-〜。！？.!?… ]+[\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]*)*)"),
+}
+
+# 快速路径
+# 含英文字母
+LATIN_PATTERN = re.compile(r"[A-Za-z]")
+# 纯英文: 字母、空格(不含换行)与split_lang视为标点的ASCII符号, 不含数字与'/'
+PURE_EN_PATTERN = re.compile(
+    r"[A-Za-z \t%s]*[A-Za-z][A-Za-z \t%s]*" % ((re.escape(string.punctuation.replace("/", "")),) * 2)
+)
+
+
 def full_en(text):
-    pattern = r'^(?=.*[A-Za-z])[A-Za-z0-9\s\u0020-\u007E\u2000-\u206F\u3000-\u303F\uFF00-\uFFEF]+$'
-    return bool(re.match(pattern, text))
+    return bool(FULL_EN_PATTERN.match(text))
 
 
 def full_cjk(text):
-    # 来自wiki
-    cjk_ranges = [
-        (0x4E00, 0x9FFF),        # CJK Unified Ideographs
-        (0x3400, 0x4DB5),        # CJK Extension A
-        (0x20000, 0x2A6DD),      # CJK Extension B
-        (0x2A700, 0x2B73F),      # CJK Extension C
-        (0x2B740, 0x2B81F),      # CJK Extension D
-        (0x2B820, 0x2CEAF),      # CJK Extension E
-        (0x2CEB0, 0x2EBEF),      # CJK Extension F
-        (0x30000, 0x3134A),      # CJK Extension G
-        (0x31350, 0x323AF),      # CJK Extension H
-        (0x2EBF0, 0x2EE5D),      # CJK Extension H
-    ]
-
-    pattern = r'[0-9、-〜。！？.!?… /]+$'
-
-    cjk_text = ""
-    for char in text:
-        code_point = ord(char)
-        in_cjk = any(start <= code_point <= end for start, end in cjk_ranges)
-        if in_cjk or re.match(pattern, char):
-            cjk_text += char
-    return cjk_text
+    return "".join(CJK_CHARS_PATTERN.findall(text))
 
 
 def split_jako(tag_lang,item):
-    if tag_lang == "ja":
-        pattern = r"([\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]+(?:[0-9、-〜。！？.!?… ]+[\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]*)*)"
-    else:
-        pattern = r"([\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]+(?:[0-9、-〜。！？.!?… ]+[\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]*)*)"
-
     lang_list: list[dict] = []
     tag = 0
-    for match in re.finditer(pattern, item['text']):
+    for match in JAKO_PATTERNS[tag_lang].finditer(item['text']):
         if match.start() > tag:
             lang_list.append({'lang':item['lang'],'text':item['text'][tag:match.start()]})
 
@@ -74,6 +78,23 @@ def merge_lang(lang_list, item):
     return lang_list
 
 
+def fast_path(text, default_lang=""):
+    """
+    无需分词与语言检测即可确定结果的文本, 返回getTexts的结果, 否则返回None
+    - 指定了默认语言且不含英文字母: 整段为默认语言
+    - 纯英文(不含数字与换行): 整段为英文
+    自动识别时的纯汉字文本仍走语言检测: 只含汉字的日文(如"東京都")不能直接判定为中文
+    """
+    text = text.strip()
+    if not text:
+        return None
+    if default_lang != "" and not LATIN_PATTERN.search(text):
+        return [{'lang':default_lang,'text':text}]
+    if PURE_EN_PATTERN.fullmatch(text):
+        return [{'lang':'en','text':text}]
+    return None
+
+
 class LangSegmenter():
     # 默认过滤器, 基于gsv目前四种语言
     DEFAULT_LANG_MAP = {
@@ -87,10 +108,26 @@ class LangSegmenter():
         "en": "en",
     }
 
+    # 是否启用快速路径, 供基准测试对比
+    use_fast_path = True
+
+    # 复用的分词器(无状态, 可多线程共用)
+    _lang_splitter = None
+
+    def getSplitter():
+        if LangSegmenter._lang_splitter is None:
+            LangSegmenter._lang_splitter = LangSplitter(
+                lang_map=LangSegmenter.DEFAULT_LANG_MAP, merge_across_digit=False, debug=False
+            )
+        return LangSegmenter._lang_splitter
+
     def getTexts(text,default_lang = ""):
-        lang_splitter = LangSplitter(lang_map=LangSegmenter.DEFAULT_LANG_MAP)
-        lang_splitter.merge_across_digit = False
-        substr = lang_splitter.split_by_lang(text=text)
+        if LangSegmenter.use_fast_path:
+            lang_list = fast_path(text, default_lang)
+            if lang_list is not None:
+                return lang_list
+
+        substr = LangSegmenter.getSplitter().split_by_lang(text=text)
 
         lang_list: list[dict] = []
 
@@ -36,6 +36,7 @@ if is_g2pw:
         model_source=os.environ.get("bert_path", "GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large"),
         v_to_u=False,
         neutral_tone_with_five=True,
+        num_threads=int(os.environ["g2pw_num_threads"]) if "g2pw_num_threads" in os.environ else None,
     )
 
 rep_map = {
@@ -70,13 +71,28 @@ def replace_punctuation(text):
     return replaced_text
 
 
-def g2p(text):
+def _split_sentences(text):
     pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
-    sentences = [i for i in re.split(pattern, text) if i.strip() != ""]
+    return [i for i in re.split(pattern, text) if i.strip() != ""]
+
+
+def g2p(text):
+    sentences = _split_sentences(text)
     phones, word2ph = _g2p(sentences)
     return phones, word2ph
 
 
+def prefetch(norm_texts):
+    """
+    Predict the polyphones of several normalized texts (text_normalize output) with one g2pW batch,
+    so their later g2p calls are served from the g2pW cache.
+    """
+    if not is_g2pw:
+        return
+    segments = [re.sub("[a-zA-Z]+", "", seg) for text in norm_texts for seg in _split_sentences(text)]
+    g2pw.prefetch(segments)
+
+
 def _get_initials_finals(word):
     initials = []
     finals = []
@@ -180,10 +196,13 @@ def _merge_erhua(initials: list[str], finals: list[str], word: str, pos: str) ->
 def _g2p(segments):
     phones_list = []
     word2ph = []
+    # Replace all English words in the sentence
+    segments = [re.sub("[a-zA-Z]+", "", seg) for seg in segments]
+    if is_g2pw:
+        # g2pw一次推理全部分句
+        g2pw.prefetch(segments)
     for seg in segments:
         pinyins = []
-        # Replace all English words in the sentence
-        seg = re.sub("[a-zA-Z]+", "", seg)
         seg_cut = psg.lcut(seg)
         seg_cut = tone_modifier.pre_merge_for_modify(seg_cut)
         initials = []
@@ -18,7 +18,8 @@ special = [
 ]
 
 
-def clean_text(text, language, version=None):
+def clean_text(text, language, version=None, norm_text=None):
+    # norm_text: text_normalize(text) of the language, when the caller already has it
     if version is None:
         version = os.environ.get("version", "v2")
     if version == "v1":
@@ -35,10 +36,11 @@ def clean_text(text, language, version=None):
         if special_s in text and language == special_l:
             return clean_special(text, language, special_s, target_symbol, version)
     language_module = __import__("text." + language_module_map[language], fromlist=[language_module_map[language]])
-    if hasattr(language_module, "text_normalize"):
-        norm_text = language_module.text_normalize(text)
-    else:
-        norm_text = text
+    if norm_text is None:
+        if hasattr(language_module, "text_normalize"):
+            norm_text = language_module.text_normalize(text)
+        else:
+            norm_text = text
     if language == "zh" or language == "yue":  ##########
         phones, word2ph = language_module.g2p(norm_text)
         assert len(phones) == sum(word2ph)
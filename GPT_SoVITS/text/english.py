@@ -1,7 +1,11 @@
+import atexit
 import pickle
 import os
 import re
+import threading
+import time
 import wordsegment
+from collections import OrderedDict
 from g2p_en import G2p
 
 from text.symbols import punctuation
@@ -21,6 +25,7 @@ CMU_DICT_FAST_PATH = os.path.join(current_file_path, "cmudict-fast.rep")
 CMU_DICT_HOT_PATH = os.path.join(current_file_path, "engdict-hot.rep")
 CACHE_PATH = os.path.join(current_file_path, "engdict_cache.pickle")
 NAMECACHE_PATH = os.path.join(current_file_path, "namedict_cache.pickle")
+OOV_CACHE_PATH = os.path.join(current_file_path, "engdict_oov_cache.pickle")
 
 
 # 适配中文及 g2p_en 标点
@@ -230,6 +235,91 @@ def get_namedict():
     return name_dict
 
 
+class OOVCache:
+    """
+    未登录词(词典中没有, 需要分词或 g2p_en 网络预测)的读音缓存, 按最近使用保留 max_entries 条, 0 为关闭.
+    新增 flush_every 条或距上次写盘超过 flush_interval 秒时写回 path, 进程退出时也会写回.
+    复合词的读音取决于词典与本文件的分词/预测逻辑, 两者任一变化后缓存作废.
+    """
+
+    def __init__(self, path, max_entries=20000, flush_every=64, flush_interval=60):
+        self.path = path
+        self.max_entries = max(int(max_entries), 0)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.stamp = self._dict_stamp()
+        self._entries = OrderedDict()
+        self._dirty = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        if self.max_entries > 0:
+            self._load()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _dict_stamp():
+        stamps = []
+        for path in [CMU_DICT_PATH, CMU_DICT_FAST_PATH, CMU_DICT_HOT_PATH, __file__]:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stamps.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns))
+        return stamps
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as pickle_file:
+                data = pickle.load(pickle_file)
+        except Exception as e:
+            print(f"忽略损坏的英文未登录词缓存 {self.path}: {e}")
+            return
+        if not isinstance(data, dict) or data.get("stamp") != self.stamp:
+            return
+        for word, phones in data["entries"][-self.max_entries :]:
+            self._entries[word] = phones
+
+    def get(self, word):
+        with self._lock:
+            phones = self._entries.get(word)
+            if phones is not None:
+                self._entries.move_to_end(word)
+                return list(phones)
+        return None
+
+    def put(self, word, phones):
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[word] = list(phones)
+            self._entries.move_to_end(word)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty += 1
+            if self._dirty < self.flush_every and time.monotonic() - self._last_flush < self.flush_interval:
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty == 0:
+                return
+            data = {"stamp": self.stamp, "entries": list(self._entries.items())}
+            self._dirty = 0
+            self._last_flush = time.monotonic()
+        # 先写临时文件再替换, 写到一半退出也不会损坏已有缓存
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as pickle_file:
+                pickle.dump(data, pickle_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"写入英文未登录词缓存失败 {self.path}: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+
 def text_normalize(text):
     # todo: eng text normalize
 
@@ -255,6 +345,9 @@ class en_G2p(G2p):
         self.cmu = get_dict()
         self.namedict = get_namedict()
 
+        # 未登录词读音缓存, 跨请求与重启复用分词和网络预测的结果
+        self.oov_cache = OOVCache(OOV_CACHE_PATH, max_entries=int(os.environ.get("en_oov_cache_size", 20000)))
+
         # 剔除读音错误的几个缩写
         for word in ["AE", "AI", "AR", "IOS", "HUD", "OS"]:
             del self.cmu[word.lower()]
@@ -346,6 +439,14 @@ class en_G2p(G2p):
                 phones.extend(["Z"])
             return phones
 
+        # 未登录词先查缓存
+        phones = self.oov_cache.get(word)
+        if phones is None:
+            phones = self.qryoov(word)
+            self.oov_cache.put(word, phones)
+        return phones
+
+    def qryoov(self, word):
         # 尝试进行分词，应对复合词
         comps = wordsegment.segment(word.lower())
 
@@ -360,6 +461,16 @@ class en_G2p(G2p):
 _g2p = en_G2p()
 
 
+def warmup_oov(texts):
+    """从历史文本中找出未登录词, 预测读音写入缓存并写盘, 返回缓存条数的增量"""
+    before = len(_g2p.oov_cache)
+    for text in texts:
+        for word in re.findall(r"[A-Za-z][A-Za-z']*[A-Za-z]", text):
+            _g2p.qryword(word)
+    _g2p.oov_cache.flush()
+    return len(_g2p.oov_cache) - before
+
+
 def g2p(text):
     # g2p_en 整段推理，剔除不存在的arpa返回
     phone_list = _g2p(text)
@@ -48,16 +48,21 @@ def prepare_onnx_input(
     phoneme_masks = []
     char_ids = []
     position_ids = []
+    # every polyphonic char of a sentence is one query, tokenize each sentence once
+    tokenized = {}
+    char_index = {char: i for i, char in enumerate(chars)}
 
     for idx in range(len(texts)):
         text = (truncated_texts if window_size else texts)[idx].lower()
         query_id = (truncated_query_ids if window_size else query_ids)[idx]
 
-        try:
-            tokens, text2token, token2text = tokenize_and_map(tokenizer=tokenizer, text=text)
-        except Exception:
-            print(f'warning: text "{text}" is invalid')
-            return {}
+        if text not in tokenized:
+            try:
+                tokenized[text] = tokenize_and_map(tokenizer=tokenizer, text=text)
+            except Exception:
+                print(f'warning: text "{text}" is invalid')
+                return {}
+        tokens, text2token, token2text = tokenized[text]
 
         text, query_id, tokens, text2token, token2text = _truncate(
             max_len=max_len, text=text, query_id=query_id, tokens=tokens, text2token=text2token, token2text=token2text
@@ -73,7 +78,7 @@ def prepare_onnx_input(
         phoneme_mask = (
             [1 if i in char2phonemes[query_char] else 0 for i in range(len(labels))] if use_mask else [1] * len(labels)
         )
-        char_id = chars.index(query_char)
+        char_id = char_index[query_char]
         position_id = text2token[query_id] + 1  # [CLS] token locate at first place
 
         input_ids.append(input_id)
@@ -83,6 +88,12 @@ def prepare_onnx_input(
         char_ids.append(char_id)
         position_ids.append(position_id)
 
+    # queries of different sentences are padded to the longest one and masked
+    max_tokens = max(len(input_id) for input_id in input_ids)
+    for rows in (input_ids, token_type_ids, attention_masks):
+        for row in rows:
+            row.extend([0] * (max_tokens - len(row)))
+
     outputs = {
         "input_ids": np.array(input_ids).astype(np.int64),
         "token_type_ids": np.array(token_type_ids).astype(np.int64),
@@ -25,6 +25,8 @@ class G2PWPinyin(Pinyin):
         v_to_u=False,
         neutral_tone_with_five=False,
         tone_sandhi=False,
+        num_threads=None,
+        cache_size=4096,
         **kwargs,
     ):
         self._g2pw = G2PWOnnxConverter(
@@ -32,6 +34,8 @@ class G2PWPinyin(Pinyin):
             style="pinyin",
             model_source=model_source,
             enable_non_tradional_chinese=enable_non_tradional_chinese,
+            num_threads=num_threads,
+            cache_size=cache_size,
         )
         self._converter = Converter(
             self._g2pw,
@@ -43,6 +47,10 @@ class G2PWPinyin(Pinyin):
     def get_seg(self, **kwargs):
         return simple_seg
 
+    def prefetch(self, texts):
+        """Run g2pW once on the Chinese runs of all texts, lazy_pinyin then finds them in the cache."""
+        self._g2pw.prefetch([word for text in texts for word in self.seg(text) if RE_HANS.match(word)])
+
 
 class Converter(UltimateConverter):
     def __init__(self, g2pw_instance, v_to_u=False, neutral_tone_with_five=False, tone_sandhi=False, **kwargs):
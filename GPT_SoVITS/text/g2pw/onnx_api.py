@@ -5,7 +5,8 @@ import json
 import os
 import warnings
 import zipfile
-from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 import onnxruntime
@@ -86,13 +87,24 @@ class G2PWOnnxConverter:
         style: str = "bopomofo",
         model_source: str = None,
         enable_non_tradional_chinese: bool = False,
+        num_threads: Optional[int] = None,
+        cache_size: int = 4096,
+        max_batch_tokens: int = 16384,
     ):
+        """
+        num_threads: threads of the ONNX Runtime session, 0 lets it use every core, None keeps the old
+            default (2 with CUDA, every core without).
+        cache_size: number of sentences whose predictions are kept, 0 disables the cache.
+        max_batch_tokens: padded tokens (queries x longest sentence) of one ONNX call.
+        """
         uncompress_path = download_and_decompress(model_dir)
 
+        if num_threads is None or num_threads < 0:
+            num_threads = 2 if torch.cuda.is_available() else 0
         sess_options = onnxruntime.SessionOptions()
         sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
         sess_options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
-        sess_options.intra_op_num_threads = 2 if torch.cuda.is_available() else 0
+        sess_options.intra_op_num_threads = num_threads
         if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
             self.session_g2pW = onnxruntime.InferenceSession(
                 os.path.join(uncompress_path, "g2pW.onnx"),
@@ -175,6 +187,10 @@ class G2PWOnnxConverter:
         if self.enable_opencc:
             self.cc = OpenCC("s2tw")
 
+        self.cache_size = max(int(cache_size), 0)
+        self.max_batch_tokens = max(int(max_batch_tokens), 1)
+        self._cache: "OrderedDict[str, List[str]]" = OrderedDict()
+
     def _convert_bopomofo_to_pinyin(self, bopomofo: str) -> str:
         tone = bopomofo[-1]
         assert tone in "12345"
@@ -186,9 +202,37 @@ class G2PWOnnxConverter:
             return None
 
     def __call__(self, sentences: List[str]) -> List[List[str]]:
+        """
+        Pinyin of every char of every sentence (None where g2pW has no answer). The polyphonic chars of all
+        sentences not in the cache are predicted together, see prefetch().
+        """
         if isinstance(sentences, str):
             sentences = [sentences]
+        if self.cache_size == 0:
+            return self._predict(sentences)
+
+        self.prefetch(sentences)
+        results = []
+        for sent in sentences:
+            result = self._cache.get(sent)
+            if result is None:  # more distinct sentences than the cache holds
+                result = self._predict([sent])[0]
+            else:
+                self._cache.move_to_end(sent)
+            results.append(list(result))
+        return results
 
+    def prefetch(self, sentences: List[str]) -> None:
+        """Predict the sentences missing from the cache in one batch and cache them."""
+        missing = [sent for sent in dict.fromkeys(sentences) if sent not in self._cache]
+        if self.cache_size == 0 or len(missing) == 0:
+            return
+        for sent, result in zip(missing, self._predict(missing)):
+            self._cache[sent] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _predict(self, sentences: List[str]) -> List[List[str]]:
         if self.enable_opencc:
             translated_sentences = []
             for sent in sentences:
@@ -202,18 +246,27 @@ class G2PWOnnxConverter:
             # sentences no polyphonic words
             return partial_results
 
-        onnx_input = prepare_onnx_input(
-            tokenizer=self.tokenizer,
-            labels=self.labels,
-            char2phonemes=self.char2phonemes,
-            chars=self.chars,
-            texts=texts,
-            query_ids=query_ids,
-            use_mask=self.config.use_mask,
-            window_size=None,
-        )
-
-        preds, confidences = predict(session=self.session_g2pW, onnx_input=onnx_input, labels=self.labels)
+        # queries sorted by sentence length, in padded batches of at most max_batch_tokens tokens
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        preds = [None] * len(texts)
+        start = 0
+        while start < len(order):
+            end = start + max(self.max_batch_tokens // (len(texts[order[start]]) + 2), 1)
+            batch = order[start:end]
+            onnx_input = prepare_onnx_input(
+                tokenizer=self.tokenizer,
+                labels=self.labels,
+                char2phonemes=self.char2phonemes,
+                chars=self.chars,
+                texts=[texts[i] for i in batch],
+                query_ids=[query_ids[i] for i in batch],
+                use_mask=self.config.use_mask,
+                window_size=None,
+            )
+            batch_preds, _ = predict(session=self.session_g2pW, onnx_input=onnx_input, labels=self.labels)
+            for i, pred in zip(batch, batch_preds):
+                preds[i] = pred
+            start = end
         if self.config.use_char_phoneme:
             preds = [pred.split(" ")[1] for pred in preds]
 
@@ -199,6 +199,98 @@ force_gpu_infer = True
 
 # 强制半精度推理（False 为自动检测，4G显存如果要推理 V3~V4 可开。对于V2P，如果显卡计算能力低于 SM_53，无法半精部分会强制单精。只有开启了“强制GPU推理”才有效）
 force_half_infer = False
+
+# 常驻模型池：最多同时常驻的说话人（GPT+SoVITS 模型对）数量，切换回常驻的说话人时不再重新加载权重。0 为关闭（每次请求都重新加载）
+model_pool_size = 3
+
+# 常驻模型池的显存/内存预算（MB），超出后按最近最少使用淘汰。0 为不限制，仅受 model_pool_size 约束
+model_pool_max_mem = 0
+
+# 参考音频特征缓存（HuBERT 语义、频谱、SV 向量、参考文本 BERT）：内存中保留的条目数
+prompt_cache_size = 32
+
+# 参考音频特征的磁盘缓存目录，重启后仍然有效。留空则只使用内存缓存
+prompt_cache_dir = "cache/prompt_features"
+
+# 文本前端缓存（音素与 BERT 特征，按文本、语言、版本与前端代码/BERT 模型区分）：内存中保留的句子数，重复的问候语、提示语等跳过文本前端。0 为关闭
+text_cache_size = 1024
+
+# 文本前端缓存的磁盘目录（内存映射读取，BERT 特征以半精度保存），重启后仍然有效。留空则只使用内存缓存
+text_cache_dir = "cache/text_features"
+
+# 文本前端磁盘缓存的大小上限（MB），写满后不再增加，删除目录即可重建
+text_cache_max_mb = 1024
+
+# g2pW（中文多音字模型，ONNX Runtime）的线程数：-1 保持原默认（有 CUDA 时 2，否则使用全部核心），0 为 ONNX Runtime 默认，其余为指定线程数
+g2pw_num_threads = -1
+
+# 英文未登录词（词典中没有、需神经网络预测的产品名、用户名等）读音缓存的条数上限，保存在 GPT_SoVITS/text/engdict_oov_cache.pickle，重启后仍然有效。0 为关闭。可用 gsvi_warmup_en_oov.py 从历史日志预热
+en_oov_cache_size = 20000
+
+# 安装模型后预计算参考音频特征，写入参考音频旁的 .features.npz，首次推理无需再跑 HuBERT/SV/BERT
+precompute_on_install = True
+
+# T2S 连续批处理：并发请求的句子在解码的每一步合并进同一批次，共享前向计算（仅并行推理模式有效）
+t2s_continuous_batching = True
+
+# 连续批处理同时解码的最大句子数，显存较小时可调低
+t2s_max_batch_size = 32
+
+# T2S 预分配 KV 缓存：解码时原地写入，避免每个 token 都拼接缓存（仅并行推理且未开启连续批处理时生效）
+t2s_static_kv_cache = True
+
+# 参考音频前缀缓存：每个 GPT 模型保留的参考音频数量，同一参考音频的各句、各请求复用参考文本与参考语义 token 的嵌入。0 为关闭
+t2s_prefix_cache_size = 8
+
+# T2S 解码每隔多少步才把 EOS 判断同步回 CPU（每次同步都会等待显卡），已结束的句子最多多算这么多步。1 为每步检查
+t2s_eos_sync_every = 8
+
+# T2S 解码图：把单步解码捕获为 CUDA Graph 后重放，减少每个 token 的调度开销，每步只计算覆盖当前长度的一段缓存（256 起按 2 倍分档）。仅在 CUDA 上生效：CPU 上没有调度开销可省，编译后的单步解码比静态 KV 缓存的普通解码还慢。会常驻一份固定大小的 KV 缓存（半精度约 最大批大小档位 × 缓存长度 × 层数 × 2KB，默认设置下约 800MB），仅并行推理且未开启连续批处理时生效
+t2s_decode_graph = False
+
+# 解码图的批大小档位，批次按最小的可容纳档位解码，超过最大档位的批次退回普通解码
+t2s_graph_batch_sizes = [1, 4, 8]
+
+# 解码图的缓存长度（参考音频语义 token + 文本音素 + 生成的 token），超出的句子退回普通解码
+t2s_graph_capacity = 2048
+
+# 每句语义 token 上限 = 句子音素数 × 参考音频的每音素 token 数（语速）× 此倍数 + 1 秒，防止个别句子胡言乱语拖住整批。0 为只受 max_sec 限制
+t2s_budget_factor = 2.5
+
+# 复读检测：最近这么多个语义 token（约 25 个/秒）以不超过其 1/4 的周期重复时，判定为卡死并截掉重复部分结束该句。0 为关闭
+# 默认关闭：开启后对每个请求生效，故意重复的文本（如"哈哈哈哈"）也可能被截断，需要时可设为 50（约 2 秒）
+t2s_loop_window = 0
+
+# 并行推理时 SoVITS（v1/v2/v2Pro）按补齐的批次逐句合成，而不是把整批拼成一条长序列再切开，每句的结果与单独合成一致，句子之间互不干扰
+# 默认关闭：CPU 上实测比拼接慢（4 句、每句 75~150 个语义 token 约 0.75 倍），GPU 上可用 tools/benchmark/sovits_batched_decode.py 测试后开启
+sovits_padded_decode = False
+
+# v3/v4 的 CFM 求解器：euler / midpoint / heun（后两者每步算两次，但更少的步数就能达到同样的质量）
+cfm_solver = "euler"
+
+# CFM 时间步分布，-1~0 之间越小越把步数集中在起始（噪声）端，0 为均匀。可用 tools/benchmark/cfm_solver.py 选择步数与分布
+cfm_sway = 0.0
+
+# CFM 提前结束：相邻两步的速度相对变化小于此值时直接走完剩余的路径，同一参考音频之后的分块沿用首次的步数。0 为关闭
+cfm_adaptive_tol = 0.0
+
+# v3/v4 声码器按这么多 mel 帧分窗合成（两侧带上声码器感受野的上下文，结果与整段合成一致），显存不再随句长增长。0 为整段一次合成
+vocoder_window_frames = 256
+
+# 在 CPU 上推理时各模型的精度：fp32 / bf16（自动混合精度，仅在支持 bf16 的 CPU 上生效，否则退回 fp32）/ int8（线性层动态量化）。SoVITS 始终为 fp32。可用 tools/benchmark/cpu_precision.py 对比语义 token 一致率与速度
+cpu_precision = {"t2s": "fp32", "bert": "fp32", "hubert": "fp32"}
+
+# 流式合成时句内按语义 token 分块：每解码出这么多 token 就合成并发送一段音频（约 25 token/秒，v1/v2/v2Pro）。v3/v4 大于 0 时改为按 CFM 分块发送，并与声码器流水并行。0 为按句返回
+stream_chunk_tokens = 24
+
+# GSVI 推理工作线程数：同时进行的合成请求数（同一模型的请求共享连续批处理），其余请求排队
+infer_workers = 4
+
+# 推理排队上限，超出后直接返回 503 繁忙。0 为不限制
+infer_queue_size = 32
+
+# 模型安装/删除排队上限（单独的工作线程，不影响推理）。0 为不限制
+install_queue_size = 8
 #==============================================================================
 
 
@@ -0,0 +1,33 @@
+""" 为已安装的说话人预计算参考音频特征 """
+
+import argparse
+from glob import glob
+from pathlib import Path
+
+from tools.logger import logger
+from tools.my_infer import pre_infer, precompute_model, get_version
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="预计算参考音频特征")
+    parser.add_argument("-c","--config", type=str, default="./GPT_SoVITS/configs/tts_infer.yaml", help="配置文件路径")
+    parser.add_argument("-v","--version", type=str, default="", help="模型版本，留空为全部版本")
+    parser.add_argument("-m","--model", type=str, default="", help="说话人名称，留空为该版本下全部说话人")
+    args = parser.parse_args()
+
+    pre_infer(args.config, "./custom_refs")
+    versions = [args.version] if args.version != "" else get_version()
+    for version in versions:
+        if args.model != "":
+            speakers = [args.model]
+        else:
+            speakers = [Path(speaker).name for speaker in glob(f"models/{version}/*") if Path(speaker).is_dir()]
+        for speaker in speakers:
+            if not Path(f"models/{version}/{speaker}").exists():
+                logger.warning(f"说话人 models/{version}/{speaker} 不存在，跳过")
+                continue
+            precompute_model(speaker, version)
+
+
+if __name__ == "__main__":
+    main()
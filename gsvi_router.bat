@@ -0,0 +1,6 @@
+set "SCRIPT_DIR=%~dp0"
+set "SCRIPT_DIR=%SCRIPT_DIR:~0,-1%"
+cd /d "%SCRIPT_DIR%"
+set "PATH=%SCRIPT_DIR%\runtime;%PATH%"
+runtime\python.exe gsvi_router.py -p 8000 -n 2
+pause
@@ -0,0 +1,6 @@
+""" 多进程路由启动入口 """
+
+from gsvi_server.router import main
+
+if __name__ == "__main__":
+    main()
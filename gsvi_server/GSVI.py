@@ -16,9 +16,11 @@ start_import = datetime.now()
 from .openai_like_model import (
     inferWithClassic, inferWithEmotions, inferWithMulti, installModel, checkModelInstalled, openaiLikeInfer, requestVersion, ShutdownRequest
 )
-from tools.my_infer import get_multi_ref_template, create_speaker_list, single_infer, multi_infer, pre_infer, get_classic_model_list, classic_infer, get_version, check_installed, install_model, delete_model, openai_like_infer
+from tools.my_infer import get_multi_ref_template, create_speaker_list, single_infer, multi_infer, pre_infer, get_classic_model_list, classic_infer, get_version, check_installed, install_model, delete_model, openai_like_infer, MEDIA_TYPES, get_pipeline_stats
+from .executor import TaskExecutor, QueueFullError
+from config import infer_workers, infer_queue_size, install_queue_size
 from fastapi import FastAPI, File, UploadFile, Request, Response
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import argparse
@@ -45,6 +47,19 @@ ref_audio_path: str = ""
 
 ### CONSTANTS ###
 
+### EXECUTORS ###
+
+# 推理在独立的工作线程中执行（并发请求的 T2S 解码由连续批处理调度器合并），队列满时直接返回繁忙
+# 流式请求的音频流也在工作线程中合成，直到发送完毕或客户端断开才释放
+infer_executor = TaskExecutor("infer", workers=infer_workers, max_queue=infer_queue_size)
+# 模型安装/删除（下载、解压）单独排队，不占用推理线程
+install_executor = TaskExecutor("install", workers=1, max_queue=install_queue_size)
+
+def busy_response() -> JSONResponse:
+    return JSONResponse(content={"msg": "服务器繁忙，请稍后再试", "stats": infer_executor.stats()}, status_code=503)
+
+### EXECUTORS ###
+
 APP = FastAPI()
 APP.add_middleware(
     CORSMiddleware,
@@ -109,7 +124,10 @@ async def infer_emotion(model: inferWithEmotions):
             msg = "app_key错误"
             audio_url = ""
         else:
-            audio_path, msg = single_infer(model.model_name, model.prompt_text_lang, model.emotion, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr, model.version)
+            audio_path, msg = await infer_executor.submit(single_infer, model.model_name, model.prompt_text_lang, model.emotion, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr, model.version, model.stream)
+            if model.stream and audio_path != "":
+                # 流式返回：每合成完一句就发送一段音频
+                return StreamingResponse(audio_path, media_type=MEDIA_TYPES.get(model.media_type, "audio/wav"))
             if audio_path == "":
                 audio_url = ""
             else:
@@ -117,6 +135,8 @@ async def infer_emotion(model: inferWithEmotions):
                     audio_url = f"/{audio_path}"
                 else:
                     audio_url = f"{model.dl_url}/{audio_path}"
+    except QueueFullError:
+        return busy_response()
     except Exception as e:
         print(e)
         msg = "参数错误"
@@ -131,11 +151,13 @@ async def infer_multi(model: inferWithMulti):
             msg = "app_key错误"
             archive_url = ""
         else:
-            archive_path, msg = multi_infer(model.content, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr)  
+            archive_path, msg = await infer_executor.submit(multi_infer, model.content, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.fragment_interval, model.media_type, model.parallel_infer, model.repetition_penalty, model.seed, model.sample_steps, model.if_sr)  
             if model.dl_url == "":
                 archive_url = f"/{archive_path}"
             else:
                 archive_url = f"{model.dl_url}/{archive_path}"
+    except QueueFullError:
+        return busy_response()
     except Exception as e:
         print(e)
         msg = "参数错误"
@@ -162,7 +184,9 @@ async def infer_classic(model: inferWithClassic):
             msg = "app_key错误"
             audio_url = ""
         else:
-            audio_path, msg = classic_infer(model.gpt_model_name, model.sovits_model_name, model.ref_audio_path, model.prompt_text, model.prompt_text_lang, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.seed, model.media_type, model.parallel_infer, model.repetition_penalty, model.sample_steps, model.if_sr, model.version)
+            audio_path, msg = await infer_executor.submit(classic_infer, model.gpt_model_name, model.sovits_model_name, model.ref_audio_path, model.prompt_text, model.prompt_text_lang, model.text, model.text_lang, model.top_k, model.top_p, model.temperature, model.text_split_method, model.batch_size, model.batch_threshold, model.split_bucket, model.speed_facter, model.fragment_interval, model.seed, model.media_type, model.parallel_infer, model.repetition_penalty, model.sample_steps, model.if_sr, model.version, model.stream)
+            if model.stream and audio_path != "":
+                return StreamingResponse(audio_path, media_type=MEDIA_TYPES.get(model.media_type, "audio/wav"))
             if audio_path == "":
                 audio_url = ""
             else:
@@ -170,6 +194,8 @@ async def infer_classic(model: inferWithClassic):
                     audio_url = f"/{audio_path}"
                 else:
                     audio_url = f"{model.dl_url}/{audio_path}"
+    except QueueFullError:
+        return busy_response()
     except Exception as e:
         print(e)
         msg = "参数错误"
@@ -190,7 +216,7 @@ async def openai_like_infer_func(model: openaiLikeInfer):
                 }
             }
         else:
-            audio_byte, msg = openai_like_infer(model.model, model.input, model.voice, model.response_format, model.speed, model.other_params)
+            audio_byte, msg = await infer_executor.submit(openai_like_infer, model.model, model.input, model.voice, model.response_format, model.speed, model.other_params)
             if audio_byte is None:
                 return {
                     "error": {
@@ -200,9 +226,20 @@ async def openai_like_infer_func(model: openaiLikeInfer):
                         "code": "processing_failed"
                     }
                 }
+            elif model.other_params.stream:
+                return StreamingResponse(audio_byte, media_type=MEDIA_TYPES.get(model.response_format, "audio/wav"))
             else:
-                return Response(content=audio_byte, media_type="audio/wav")
+                return Response(content=audio_byte, media_type=MEDIA_TYPES.get(model.response_format, "audio/wav"))
 
+    except QueueFullError:
+        return JSONResponse(content={
+            "error": {
+                "message": "服务器繁忙，请稍后再试",
+                "type": "server_busy",
+                "param": "unknown",
+                "code": "queue_full"
+            }
+        }, status_code=503)
     except Exception as e:
         print(e)
         return {
@@ -228,7 +265,9 @@ async def check_model(model: checkModelInstalled):
 @APP.post("/install_model")
 async def install_model_func(model: installModel):
     try:
-        msg = install_model(model.version, model.category, model.language, model.model_name, model.dl_url)
+        msg = await install_executor.submit(install_model, model.version, model.category, model.language, model.model_name, model.dl_url)
+    except QueueFullError:
+        msg = "安装队列已满，请稍后再试"
     except Exception as e:
         print(e)
         msg = "安装失败"
@@ -238,12 +277,19 @@ async def install_model_func(model: installModel):
 @APP.post("/delete_model")
 async def delete_model_func(model: checkModelInstalled):
     try:
-        msg = delete_model(model.version, model.category, model.language, model.model_name)
+        msg = await install_executor.submit(delete_model, model.version, model.category, model.language, model.model_name)
+    except QueueFullError:
+        msg = "安装队列已满，请稍后再试"
     except Exception as e:
         print(e)
         msg = "删除失败"
     return {"msg": msg}
 
+# 服务状态：推理/安装队列深度、排队时间，以及调度器、缓存、模型池的统计
+@APP.get("/stats")
+async def stats():
+    return {"infer": infer_executor.stats(), "install": install_executor.stats(), **get_pipeline_stats()}
+
 # 关闭服务
 @APP.post("/shutdown")
 async def shutdown(model: ShutdownRequest):
@@ -293,6 +339,7 @@ def main() -> None:
     parser.add_argument("-k","--key", type=str, default="", help="推理密钥")
     parser.add_argument("-c","--config", type=str, default="./GPT_SoVITS/configs/tts_infer.yaml", help="配置文件路径")
     parser.add_argument("-r","--ref_audio", type=str, default="./custom_refs", help="参考音频路径")
+    parser.add_argument("--worker", action="store_true", help="作为多进程路由的工作进程启动（不打开浏览器）")
     args = parser.parse_args()
     
     infer_key = args.key
@@ -302,5 +349,6 @@ def main() -> None:
         
     pre_infer(args.config, ref_audio_path)
     logger.info(f"服务即将启动，将运行在: http://127.0.0.1:{port}")
-    webbrowser.open(f"http://127.0.0.1:{port}")
+    if not args.worker:
+        webbrowser.open(f"http://127.0.0.1:{port}")
     uvicorn.run(app=APP, host=host, port=port, log_level="critical")    
\ No newline at end of file
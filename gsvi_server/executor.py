@@ -0,0 +1,184 @@
+"""GSVI 任务执行层：在事件循环之外执行推理、安装等阻塞任务"""
+
+import asyncio
+import inspect
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import perf_counter
+
+from tools.logger import logger
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class _StreamChannel:
+    """流式任务在工作线程与事件循环之间的通道，最多缓存 buffer 段，读取端关闭后工作线程停止执行生成器"""
+
+    def __init__(self, generator, loop: asyncio.AbstractEventLoop, buffer: int = 2):
+        self.generator = generator
+        self.loop = loop
+        self.slots = threading.Semaphore(max(int(buffer), 1))
+        self.closed = threading.Event()
+        self._items = None
+
+    def items(self) -> asyncio.Queue:
+        # 只在事件循环线程中调用（Python 3.9 的 asyncio.Queue 创建时绑定当前线程的事件循环）
+        if self._items is None:
+            self._items = asyncio.Queue()
+        return self._items
+
+    def _send(self, item) -> None:
+        try:
+            self.loop.call_soon_threadsafe(lambda: self.items().put_nowait(item))
+        except RuntimeError:  # 事件循环已关闭
+            self.closed.set()
+
+    def run(self) -> bool:
+        """在工作线程中执行生成器直到结束或读取端关闭，返回是否没有出错"""
+        error = None
+        try:
+            for chunk in self.generator:
+                while not self.slots.acquire(timeout=0.5):
+                    if self.closed.is_set():
+                        break
+                if self.closed.is_set():
+                    break
+                self._send((False, chunk))
+        except BaseException as e:
+            error = e
+        finally:
+            self.generator.close()
+            self._send((True, error))
+        return error is None
+
+
+class TaskStream:
+    """
+    流式任务的输出，在事件循环中用 async for 读取。
+    生成器由执行任务的工作线程运行，读取结束、断开或响应未开始就被丢弃时，生成器在工作线程中关闭
+    """
+
+    def __init__(self, channel: _StreamChannel):
+        self._channel = channel
+
+    async def __aiter__(self):
+        channel = self._channel
+        try:
+            while True:
+                done, value = await channel.items().get()
+                if done:
+                    if value is not None:
+                        raise value
+                    return
+                channel.slots.release()
+                yield value
+        finally:
+            channel.closed.set()
+
+    def __del__(self):
+        self._channel.closed.set()
+
+
+def as_stream(result, loop: asyncio.AbstractEventLoop) -> tuple:
+    """
+    任务结果中的生成器（结果本身或元组的第一个元素）换成 TaskStream，
+    返回 (新结果, 需要在工作线程中运行的 _StreamChannel 或 None)
+    """
+    if inspect.isgenerator(result):
+        channel = _StreamChannel(result, loop)
+        return TaskStream(channel), channel
+    if isinstance(result, tuple) and result and inspect.isgenerator(result[0]):
+        channel = _StreamChannel(result[0], loop)
+        return (TaskStream(channel), *result[1:]), channel
+    return result, None
+
+
+class TaskExecutor:
+    """
+    有界队列 + 固定数量的工作线程。
+    接口处理函数 await submit() 等待结果，事件循环不会被推理或下载阻塞；
+    队列满时直接拒绝（QueueFullError），并记录每个任务的排队时间。
+    任务返回生成器（或第一个元素为生成器的元组，如流式推理的 (音频流, msg)）时，生成器换成 TaskStream，
+    由同一个工作线程执行到结束或读取端断开，流式任务与其他任务一样占用工作线程并排队
+
+    Args:
+        name: 执行器名称，用于线程名和日志
+        workers: 工作线程数量
+        max_queue: 排队任务上限，0 为不限制
+    """
+
+    def __init__(self, name: str, workers: int = 1, max_queue: int = 0):
+        self.name = name
+        self.workers = max(int(workers), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._waits = deque(maxlen=100)  # 最近任务的排队时间（秒）
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True).start()
+
+    async def submit(self, fn, *args, **kwargs):
+        """提交任务并等待结果，队列满时抛出 QueueFullError"""
+        future = Future()
+        loop = asyncio.get_running_loop()
+        try:
+            self._queue.put_nowait((future, loop, fn, args, kwargs, perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError(f"{self.name} 队列已满（{self.max_queue}）")
+        return await asyncio.wrap_future(future)
+
+    def _run(self) -> None:
+        while True:
+            future, loop, fn, args, kwargs, enqueued = self._queue.get()
+            # 客户端已断开的任务不再执行
+            if not future.set_running_or_notify_cancel():
+                continue
+            wait = perf_counter() - enqueued
+            with self._lock:
+                self._active += 1
+                self._waits.append(wait)
+            logger.debug(f"{self.name} 任务排队 {wait:.3f}s，剩余排队 {self._queue.qsize()}")
+            try:
+                result = fn(*args, **kwargs)
+                result, channel = as_stream(result, loop)
+            except BaseException as e:
+                future.set_exception(e)
+                with self._lock:
+                    self._failed += 1
+            else:
+                future.set_result(result)
+                # 流式任务直到生成器结束才释放工作线程，不保留 TaskStream 的引用，读取端丢弃它时生成器才能停下
+                future = result = None
+                if channel is not None and not channel.run():
+                    with self._lock:
+                        self._failed += 1
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "workers": self.workers,
+                "active": self._active,
+                "queued": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_last": round(self._waits[-1], 3) if waits else 0.0,
+                "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "wait_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+            }
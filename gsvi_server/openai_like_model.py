@@ -21,6 +21,7 @@ class otherParams(BaseModel):
     sample_steps: int = 16
     if_sr: bool = False
     seed: int = -1
+    stream: bool = False
 
 #OpenAI风格的推理接口
 class openaiLikeInfer(BaseModel):
@@ -62,6 +63,7 @@ class inferWithEmotions(BaseModel):
     seed: int = -1
     sample_steps: int = 16
     if_sr : bool = False
+    stream: bool = False
     
 class inferWithMulti(BaseModel):
     app_key: str = ""
@@ -109,6 +111,7 @@ class inferWithClassic(BaseModel):
     seed: int = -1
     sample_steps: int = 16
     if_sr : bool = False
+    stream: bool = False
     
 class checkModelInstalled(BaseModel):
     version: str = "v4"
@@ -0,0 +1,272 @@
+"""GSVI 多进程路由：前置路由进程 + N 个 GSVI 工作进程，按说话人亲和性分发请求"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import webbrowser
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from tools.logger import logger
+
+# 不转发的逐跳头
+HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "te",
+    "trailer",
+    "upgrade",
+    "host",
+    "proxy-authorization",
+    "proxy-authenticate",
+}
+
+
+class Worker:
+    """一个 GSVI 工作进程：独占一个 TTS 实例，常驻一部分说话人"""
+
+    def __init__(self, index: int, port: int, args: List[str]):
+        self.index = index
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.args = args
+        self.process: Optional[subprocess.Popen] = None
+        self.healthy = False
+        self.inflight = 0
+        self.served = 0
+        self.stats: dict = {}
+        self.keys: List[Tuple] = []  # 路由到该进程的说话人，最近使用的在后
+
+    def start(self) -> None:
+        self.healthy = False
+        self.process = subprocess.Popen(
+            [sys.executable, "gsvi.py", "-s", "127.0.0.1", "-p", str(self.port), "--worker", *self.args]
+        )
+        logger.info(f"工作进程 {self.index} 已启动，端口 {self.port}，PID {self.process.pid}")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def touch(self, key: Optional[Tuple]) -> None:
+        if key is None:
+            return
+        if key in self.keys:
+            self.keys.remove(key)
+        self.keys.append(key)
+
+    def info(self) -> dict:
+        return {
+            "index": self.index,
+            "url": self.url,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.alive(),
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "served": self.served,
+            "speakers": ["/".join(str(part) for part in key) for key in self.keys],
+            "stats": self.stats,
+        }
+
+
+class Router:
+    """
+    按 (版本, 说话人) 亲和性选择工作进程：同一说话人的请求固定发往同一进程，避免各进程反复切换权重；
+    该进程繁忙（处理中的请求达到 spill_inflight）时溢出到最空闲的进程，但不改变亲和关系
+
+    Args:
+        workers: 工作进程
+        spill_inflight: 亲和进程处理中的请求达到该数量时溢出
+        max_speakers: 每个进程记录的常驻说话人数量，应与模型池大小一致
+    """
+
+    def __init__(self, workers: List[Worker], spill_inflight: int = 2, max_speakers: int = 3):
+        self.workers = workers
+        self.spill_inflight = max(int(spill_inflight), 1)
+        self.max_speakers = max(int(max_speakers), 1)
+        self.affinity: Dict[Tuple, Worker] = {}
+        self.spilled = 0
+
+    def pick(self, key: Optional[Tuple]) -> Optional[Worker]:
+        healthy = [worker for worker in self.workers if worker.healthy]
+        if not healthy:
+            return None
+        least = min(healthy, key=lambda worker: (worker.inflight, len(worker.keys)))
+        if key is None:
+            return least
+        worker = self.affinity.get(key)
+        if worker is None or not worker.healthy:
+            # 新说话人分给常驻说话人最少、最空闲的进程
+            worker = min(healthy, key=lambda worker: (len(worker.keys), worker.inflight))
+            self.affinity[key] = worker
+        elif worker.inflight >= self.spill_inflight and least.inflight < worker.inflight:
+            # 溢出：优先选已常驻该说话人的进程
+            residents = [w for w in healthy if key in w.keys and w.inflight < self.spill_inflight]
+            worker = residents[0] if residents else least
+            self.spilled += 1
+        worker.touch(key)
+        if len(worker.keys) > self.max_speakers:
+            evicted = worker.keys.pop(0)
+            if self.affinity.get(evicted) is worker:
+                del self.affinity[evicted]
+        return worker
+
+    def stats(self) -> dict:
+        return {
+            "workers": [worker.info() for worker in self.workers],
+            "spill_inflight": self.spill_inflight,
+            "spilled": self.spilled,
+        }
+
+
+def affinity_key(path: str, body: bytes) -> Optional[Tuple]:
+    """从请求体中取出决定模型权重的字段"""
+    if path not in ["/infer_single", "/infer_classic", "/infer_multi", "/v1/audio/speech"]:
+        return None
+    try:
+        data = json.loads(body or b"{}")
+        if path == "/infer_single":
+            return (data.get("version", "v4"), data.get("model_name", ""))
+        if path == "/v1/audio/speech":
+            return (data.get("model", "").split("-")[-1], data.get("voice", ""))
+        if path == "/infer_classic":
+            return (data.get("version", "v4"), data.get("gpt_model_name", ""), data.get("sovits_model_name", ""))
+        # 多人对话按第一段的说话人路由
+        first = [item for item in data.get("content", "").split("‖") if item.strip()][0].split("|")
+        return (first[0].strip(), first[1])
+    except Exception:
+        return None
+
+
+router: Router = None
+client: httpx.AsyncClient = None
+
+
+async def health_loop(interval: float) -> None:
+    """定期拉取各工作进程的 /stats，进程退出时自动重启"""
+    while True:
+        for worker in router.workers:
+            if not worker.alive():
+                logger.warning(f"工作进程 {worker.index} 已退出，正在重启")
+                worker.start()
+                continue
+            try:
+                response = await client.get(f"{worker.url}/stats", timeout=5)
+                worker.stats = response.json()
+                if not worker.healthy:
+                    logger.success(f"工作进程 {worker.index} 已就绪")
+                worker.healthy = True
+            except Exception:
+                worker.healthy = False
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    client = httpx.AsyncClient(timeout=None)
+    task = asyncio.create_task(health_loop(2.0))
+    yield
+    task.cancel()
+    await client.aclose()
+    for worker in router.workers:
+        if worker.alive():
+            worker.process.terminate()
+
+
+APP = FastAPI(lifespan=lifespan)
+
+
+@APP.get("/router/stats")
+async def router_stats():
+    return router.stats()
+
+
+@APP.post("/shutdown")
+async def shutdown(request: Request):
+    body = await request.body()
+    results = []
+    for worker in router.workers:
+        try:
+            response = await client.post(
+                f"{worker.url}/shutdown", content=body, headers={"content-type": "application/json"}, timeout=10
+            )
+            results.append(response.json())
+        except Exception:
+            results.append(None)
+    # 密码正确时工作进程不返回内容
+    if any(result is None for result in results):
+        asyncio.get_running_loop().call_later(1, os.kill, os.getpid(), signal.SIGINT)
+        print("服务已关闭")
+        return None
+    return {"msg": "密码错误"}
+
+
+@APP.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH"])
+async def proxy(request: Request, path: str):
+    body = await request.body()
+    key = affinity_key(request.url.path, body) if request.method == "POST" else None
+    worker = router.pick(key)
+    if worker is None:
+        return JSONResponse(content={"msg": "没有可用的工作进程，请稍后再试"}, status_code=503)
+    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS]
+    upstream = client.build_request(
+        request.method, f"{worker.url}{request.url.path}", params=request.query_params, headers=headers, content=body
+    )
+    worker.inflight += 1
+    try:
+        response = await client.send(upstream, stream=True)
+    except Exception as e:
+        worker.inflight -= 1
+        worker.healthy = False
+        logger.error(f"转发到工作进程 {worker.index} 失败: {e}")
+        return JSONResponse(content={"msg": "工作进程不可用，请重试"}, status_code=502)
+
+    async def finish():
+        await response.aclose()
+        worker.inflight -= 1
+        worker.served += 1
+
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers={k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS},
+        background=BackgroundTask(finish),
+    )
+
+
+def main() -> None:
+    global router
+    parser = argparse.ArgumentParser(description="GSVI 多进程路由")
+    parser.add_argument("-s", "--host", type=str, default="0.0.0.0", help="主机地址")
+    parser.add_argument("-p", "--port", type=int, default=8000, help="端口")
+    parser.add_argument("-n", "--workers", type=int, default=2, help="工作进程数量，每个进程各自加载一套模型")
+    parser.add_argument("-b", "--base_port", type=int, default=0, help="工作进程的起始端口，默认为路由端口+1")
+    parser.add_argument("--spill", type=int, default=2, help="亲和进程处理中的请求达到该数量时溢出到其他进程")
+    parser.add_argument("-k", "--key", type=str, default="", help="推理密钥")
+    parser.add_argument("-c", "--config", type=str, default="./GPT_SoVITS/configs/tts_infer.yaml", help="配置文件路径")
+    parser.add_argument("-r", "--ref_audio", type=str, default="./custom_refs", help="参考音频路径")
+    args = parser.parse_args()
+
+    from config import model_pool_size
+
+    base_port = args.base_port if args.base_port > 0 else args.port + 1
+    worker_args = ["-k", args.key, "-c", args.config, "-r", args.ref_audio]
+    workers = [Worker(i, base_port + i, worker_args) for i in range(max(args.workers, 1))]
+    router = Router(workers, spill_inflight=args.spill, max_speakers=max(model_pool_size, 1))
+    for worker in workers:
+        worker.start()
+
+    logger.info(f"路由即将启动，将运行在: http://127.0.0.1:{args.port}，工作进程加载完成后开始接收请求")
+    webbrowser.open(f"http://127.0.0.1:{args.port}")
+    uvicorn.run(app=APP, host=args.host, port=args.port, log_level="critical")
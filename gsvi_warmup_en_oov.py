@@ -0,0 +1,128 @@
+"""从历史请求日志预热英文未登录词读音缓存"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import zipfile
+from pathlib import Path
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+from config import en_oov_cache_size
+from tools.i18n.i18n import load_language_list, scan_language_list
+
+# 支持的日志文件，.zip 为 loguru 轮转压缩后的日志
+SUFFIXES = {".log", ".txt", ".list", ".json", ".jsonl", ".zip"}
+
+# tools/logger.py 的行首：[时间] [线程 | 级别] [模块] [文件:行号]: 消息
+LOG_LINE = re.compile(r"^\[\d{2}:\d{2}:\d{2}\] \[[^\]]*\] \[[^\]]*\] \[[^\]]*\]: (.*)$")
+
+# TTS.run 记录请求文本的日志，.log 只读取这些消息中的文本
+TEXT_LOG_KEYS = ["前端处理后的文本(每句):", "实际输入的参考文本:"]
+TEXT_LOG_MARKERS = sorted(
+    set(TEXT_LOG_KEYS)
+    | {load_language_list(language).get(key, key) for language in scan_language_list() for key in TEXT_LOG_KEYS},
+    key=len,
+    reverse=True,
+)
+
+
+def json_strings(value) -> list:
+    """JSON 中的全部字符串"""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return [text for item in value for text in json_strings(item)]
+    return []
+
+
+def log_text(line: str):
+    """运行日志一行中的请求文本，线程名、模块名、异常堆栈等其他行返回 None"""
+    match = LOG_LINE.match(line)
+    if match is None:
+        return None
+    message = match.group(1)
+    for marker in TEXT_LOG_MARKERS:
+        if message.startswith(marker):
+            return message[len(marker) :].strip()
+    return None
+
+
+def read_lines(name: str, content: str) -> list:
+    """
+    日志中的文本：.log 取运行日志中记录的请求文本，.list 取最后一列（wav|说话人|语言|文本），
+    .json/.jsonl 取全部字符串值，其余取整行
+    """
+    suffix = Path(name).suffix
+    if suffix == ".json":
+        try:
+            return json_strings(json.loads(content))
+        except ValueError:
+            pass
+    texts = []
+    for line in content.splitlines():
+        if suffix == ".log":
+            text = log_text(line)
+            if text:
+                texts.append(text)
+        elif suffix == ".list":
+            texts.append(line.split("|")[-1])
+        elif suffix == ".jsonl":
+            try:
+                texts.extend(json_strings(json.loads(line)))
+            except ValueError:
+                texts.append(line)
+        else:
+            texts.append(line)
+    return texts
+
+
+def iter_texts(paths: list):
+    """逐个日志文件返回 (文件名, 文本列表)，目录按后缀递归查找"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(file for file in path.rglob("*") if file.suffix in SUFFIXES))
+        elif path.exists():
+            files.append(path)
+        else:
+            print(f"{path} 不存在，跳过")
+    for file in files:
+        if file.suffix == ".zip":
+            with zipfile.ZipFile(file) as archive:
+                for name in archive.namelist():
+                    content = archive.read(name).decode("utf-8", errors="ignore")
+                    yield f"{file}/{name}", read_lines(name, content)
+        else:
+            yield str(file), read_lines(file.name, file.read_text(encoding="utf-8", errors="ignore"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="从历史请求日志预热英文未登录词读音缓存")
+    parser.add_argument(
+        "paths", type=str, nargs="*", default=["runtime_logs"], help="日志文件或目录，默认为 runtime_logs"
+    )
+    args = parser.parse_args()
+
+    if en_oov_cache_size <= 0:
+        print("en_oov_cache_size 为 0，英文未登录词缓存未开启")
+        return
+    os.environ["en_oov_cache_size"] = str(en_oov_cache_size)
+    from text import english
+
+    total = 0
+    for name, texts in iter_texts(args.paths):
+        added = english.warmup_oov(texts)
+        total += added
+        print(f"{name}: 新增 {added} 条")
+    print(f"完成，共新增 {total} 条，缓存 {len(english._g2p.oov_cache)} 条，保存在 {english.OOV_CACHE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
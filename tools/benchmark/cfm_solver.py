@@ -0,0 +1,106 @@
+"""v3/v4 CFM 求解器基准：不同求解器、步数、时间步分布与提前结束阈值的耗时，以及与 32 步 euler 结果的 mel 距离"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+from f5_tts.model import DiT
+from module.models import CFM
+from process_ckpt import load_sovits_new
+
+
+def load_cfm(sovits_path: str, device: str, is_half: bool) -> CFM:
+    """有 v3/v4 SoVITS 权重时加载其中的 CFM，否则随机初始化（只测速度，距离没有参考价值）"""
+    model = CFM(100, DiT(**dict(dim=1024, depth=22, heads=16, ff_mult=2, text_dim=512, conv_layers=4)))
+    if sovits_path:
+        weight = load_sovits_new(sovits_path)["weight"]
+        model.load_state_dict({k[len("cfm.") :]: v for k, v in weight.items() if k.startswith("cfm.")})
+    model = model.to(device).eval()
+    return model.half() if is_half else model
+
+
+def make_inputs(t_ref: int, t_chunk: int, device: str, dtype: torch.dtype):
+    """固定的参考 mel 与特征：fea 为参考 + 分块共 t_chunk 帧"""
+    generator = torch.Generator().manual_seed(0)
+    fea = torch.randn(1, t_chunk, 512, generator=generator).to(device=device, dtype=dtype)
+    mel2 = torch.randn(1, 100, t_ref, generator=generator).clamp(-1, 1).to(device=device, dtype=dtype)
+    return fea, mel2
+
+
+def run_once(model: CFM, inputs, steps: int, solver: str, sway: float, tol: float, args) -> tuple:
+    fea, mel2 = inputs
+    torch.manual_seed(args.seed)
+    start = time.perf_counter()
+    mel, taken = model.inference(
+        fea,
+        torch.LongTensor([fea.size(1)]).to(fea.device),
+        mel2,
+        steps,
+        inference_cfg_rate=0,
+        solver=solver,
+        sway=sway,
+        adaptive_tol=tol,
+        return_steps=True,
+    )
+    if "cuda" in args.device:
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, taken, mel[:, :, mel2.shape[2] :].float()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CFM 求解器耗时与质量基准")
+    parser.add_argument("--sovits", type=str, default="", help="v3/v4 SoVITS 权重路径，留空则随机初始化")
+    parser.add_argument("--version", type=str, default="v4", choices=["v3", "v4"], help="决定参考与分块长度")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--half", action="store_true", help="半精度")
+    parser.add_argument("--threads", type=int, default=0, help="CPU 线程数，0 为默认")
+    parser.add_argument("--ref_steps", type=int, default=32, help="参考结果（euler、均匀分布）的步数")
+    parser.add_argument("--solvers", type=str, nargs="+", default=["euler", "midpoint", "heun"])
+    parser.add_argument("--steps", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--sways", type=float, nargs="+", default=[0.0, -1.0])
+    parser.add_argument("--tols", type=float, nargs="+", default=[0.0, 0.02], help="提前结束阈值，0 为关闭")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = load_cfm(args.sovits, args.device, args.half)
+    dtype = torch.float16 if args.half else torch.float32
+    t_ref, t_chunk = (468, 934) if args.version == "v3" else (500, 1000)
+    inputs = make_inputs(t_ref, t_chunk, args.device, dtype)
+    evals = [0]
+    model.estimator.register_forward_hook(lambda *_: evals.__setitem__(0, evals[0] + 1))
+
+    run_once(model, inputs, 2, "euler", 0.0, 0.0, args)  # warmup
+    ref_seconds, _, ref_mel = run_once(model, inputs, args.ref_steps, "euler", 0.0, 0.0, args)
+
+    print(f"device={args.device} half={args.half} threads={torch.get_num_threads()} reference: euler x{args.ref_steps}")
+    print(
+        f"{'solver':>8} {'steps':>5} {'sway':>5} {'tol':>5} {'taken':>5} {'evals':>5}"
+        f" {'seconds':>8} {'speedup':>7} {'mel L1':>7}"
+    )
+    for solver, steps, sway, tol in itertools.product(args.solvers, args.steps, args.sways, args.tols):
+        best = None
+        for _ in range(args.repeat):
+            evals[0] = 0
+            seconds, taken, mel = run_once(model, inputs, steps, solver, sway, tol, args)
+            if best is None or seconds < best[0]:
+                best = (seconds, taken, evals[0], mel)
+        seconds, taken, n_evals, mel = best
+        distance = (mel - ref_mel).abs().mean().item()
+        print(
+            f"{solver:>8} {steps:>5} {sway:>5.1f} {tol:>5.2f} {taken:>5} {n_evals:>5} {seconds:>8.3f}"
+            f" {ref_seconds / seconds:>6.2f}x {distance:>7.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""CPU 精度基准：各模型（T2S / BERT / HuBERT）使用 bf16、int8 时，与 fp32 相比的语义 token 一致率与合成实时率（RTF）"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config
+from GPT_SoVITS.TTS_infer_pack.cpu_precision import bf16_supported, parse_cpu_precision
+
+# 默认语料：长短、中英混合各有，保证每次对比的输入一致
+DEFAULT_CORPUS = [
+    "今天天气很好。",
+    "我们一起去公园散步，看看湖边的柳树和刚刚开放的花朵，顺便在长椅上晒晒太阳。",
+    "这个版本的推理速度提升了大约百分之三十，内存占用也下降了不少。",
+    "请在下午三点之前把报告发给我，谢谢！",
+    "他说 this is not a bug, it's a feature，然后大家都笑了。",
+    "春眠不觉晓，处处闻啼鸟。夜来风雨声，花落知多少。",
+]
+
+# 默认对比的模式，名称: 各模型的精度
+DEFAULT_MODES = {
+    "fp32": "fp32",
+    "t2s-bf16": {"t2s": "bf16"},
+    "t2s-int8": {"t2s": "int8"},
+    "bert-int8": {"bert": "int8"},
+    "hubert-int8": {"hubert": "int8"},
+    "all-bf16": "bf16",
+    "all-int8": "int8",
+}
+
+
+def load_tts(args, precision: dict, configs_path: str) -> TTS:
+    """按给定精度在 CPU 上加载全部模型，不使用磁盘特征缓存，配置写到临时文件，不改动原配置文件"""
+    tts_config = TTS_Config(args.config)
+    tts_config.configs_path = configs_path
+    tts_config.device = torch.device("cpu")
+    tts_config.is_half = False
+    tts_config.prompt_cache_dir = ""
+    tts_config.t2s_continuous_batching = False
+    tts_config.cpu_precision = precision
+    return TTS(tts_config)
+
+
+def synthesize(tts: TTS, text: str, args) -> tuple:
+    """返回 (语义 token 列表, 耗时, 音频时长)"""
+    tokens = []
+    infer_panel = tts.t2s_model.model.infer_panel_naive_batched
+
+    def record(*a, **kw):
+        pred_semantic_list, idx_list = infer_panel(*a, **kw)
+        tokens.extend(item.tolist() for item in pred_semantic_list)
+        return pred_semantic_list, idx_list
+
+    tts.t2s_model.model.infer_panel_naive_batched = record
+    inputs = {
+        "text": text,
+        "text_lang": args.text_lang,
+        "ref_audio_path": args.ref,
+        "prompt_text": args.prompt_text,
+        "prompt_lang": args.prompt_lang,
+        "text_split_method": "cut0",
+        "top_k": 1,  # 贪心解码，差异只来自精度
+        "seed": args.seed,
+        "parallel_infer": False,
+    }
+    start = time.perf_counter()
+    samples, sr = 0, 1
+    try:
+        for sr, audio in tts.run(inputs):
+            samples += audio.shape[0]
+    finally:
+        del tts.t2s_model.model.infer_panel_naive_batched
+    return tokens, time.perf_counter() - start, samples / sr
+
+
+def agreement(tokens: list, ref_tokens: list) -> float:
+    """逐位置相同的 token 数 / 两者中较长的长度，按全部句子累计"""
+    same, total = 0, 0
+    for a, b in zip(tokens, ref_tokens):
+        same += sum(x == y for x, y in zip(a, b))
+        total += max(len(a), len(b))
+    return same / max(total, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU 精度（bf16 / int8）与 fp32 的一致率与速度对比")
+    parser.add_argument("-c", "--config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="配置文件路径")
+    parser.add_argument("--ref", type=str, required=True, help="参考音频路径")
+    parser.add_argument("--prompt_text", type=str, required=True, help="参考文本")
+    parser.add_argument("--prompt_lang", type=str, default="zh")
+    parser.add_argument("--text_lang", type=str, default="zh")
+    parser.add_argument("--corpus", type=str, default="", help="语料文件，每行一句，留空使用内置语料")
+    parser.add_argument("--modes", type=str, nargs="+", default=list(DEFAULT_MODES), help="要对比的模式")
+    parser.add_argument("--threads", type=int, default=0, help="CPU 线程数，0 为默认")
+    parser.add_argument("--repeat", type=int, default=2, help="每句重复次数，耗时取最小值")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    modes = ["fp32"] + [mode for mode in args.modes if mode != "fp32"]
+    configs_path = os.path.join(tempfile.mkdtemp(), "tts_infer.yaml")
+
+    print(f"threads={torch.get_num_threads()} bf16_supported={bf16_supported()} sentences={len(corpus)}")
+    print(f"{'mode':>12} {'t2s':>5} {'bert':>5} {'hubert':>6} {'agree':>7} {'tokens':>7} {'seconds':>8} {'RTF':>6}")
+    ref_tokens = None
+    for mode in modes:
+        precision = parse_cpu_precision(DEFAULT_MODES.get(mode, mode))
+        tts = load_tts(args, precision, configs_path)
+        synthesize(tts, corpus[0], args)  # 预热，参考音频特征进入缓存
+        tokens, seconds, duration = [], 0.0, 0.0
+        for text in corpus:
+            results = [synthesize(tts, text, args) for _ in range(args.repeat)]
+            tokens.extend(results[0][0])
+            seconds += min(r[1] for r in results)
+            duration += results[0][2]
+        if ref_tokens is None:
+            ref_tokens = tokens
+        n_tokens = sum(len(item) for item in tokens)
+        rtf = seconds / max(duration, 1e-6)
+        print(
+            f"{mode:>12} {precision['t2s']:>5} {precision['bert']:>5} {precision['hubert']:>6}"
+            f" {agreement(tokens, ref_tokens):>7.2%} {n_tokens:>7} {seconds:>8.2f} {rtf:>6.3f}"
+        )
+        del tts
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
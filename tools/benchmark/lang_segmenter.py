@@ -0,0 +1,74 @@
+"""语言分段基准：LangSegmenter.getTexts 在中英日混合文本上的单句耗时，对比每次新建分词器、复用分词器与快速路径"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+from text.LangSegmenter import LangSegmenter
+
+# 默认语料：纯中文、纯英文、中英混合、日文、含数字各有，覆盖快速路径与完整路径
+DEFAULT_CORPUS = [
+    "今天天气很好。",
+    "我们一起去公园散步，看看湖边的柳树和刚刚开放的花朵，顺便在长椅上晒晒太阳。",
+    "春眠不觉晓，处处闻啼鸟。2024年3月5日，气温15度。",
+    "Hello, world! This is a short English sentence.",
+    "It's not a bug, it's a feature -- isn't it?",
+    "当时ThinkPad T60刚刚发布，一同推出的还有一款名为Advanced Dock的扩展坞配件。",
+    "他说 this is not a bug, it's a feature，然后大家都笑了。",
+    "MyGO?,你也喜欢まいご吗？",
+    "ねえ、知ってる？最近、僕は天文学を勉強してるんだ。",
+    "안녕하세요, 오늘 날씨가 좋네요.",
+]
+
+# 名称: (是否复用分词器, 是否启用快速路径)
+MODES = {
+    "new-splitter": (False, False),
+    "reuse": (True, False),
+    "fast-path": (True, True),
+}
+
+
+def run(corpus: list, default_lang: str, reuse: bool, fast_path: bool, repeat: int) -> float:
+    """返回单句平均耗时（毫秒）"""
+    LangSegmenter.use_fast_path = fast_path
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            if not reuse:
+                LangSegmenter._lang_splitter = None  # 每次调用都新建分词器
+            LangSegmenter.getTexts(text, default_lang)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(corpus))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LangSegmenter 分段耗时对比")
+    parser.add_argument("--corpus", type=str, default="", help="语料文件，每行一句，留空使用内置语料")
+    parser.add_argument("--langs", type=str, nargs="+", default=["auto", "zh", "ja"], help="默认语言，auto 为自动识别")
+    parser.add_argument("--repeat", type=int, default=20, help="语料重复次数")
+    args = parser.parse_args()
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+
+    # 预热：加载语言检测模型与分词词典
+    start = time.perf_counter()
+    LangSegmenter.getTexts(corpus[0])
+    print(f"sentences={len(corpus)} warmup={time.perf_counter() - start:.2f}s")
+
+    print(f"{'lang':>6} " + " ".join(f"{mode + '(ms)':>16}" for mode in MODES) + f" {'speedup':>8}")
+    for lang in args.langs:
+        default_lang = "" if lang == "auto" else lang
+        times = [run(corpus, default_lang, reuse, fast_path, args.repeat) for reuse, fast_path in MODES.values()]
+        print(f"{lang:>6} " + " ".join(f"{t:>16.3f}" for t in times) + f" {times[0] / max(times[-1], 1e-9):>7.1f}x")
+    LangSegmenter.use_fast_path = True
+
+
+if __name__ == "__main__":
+    main()
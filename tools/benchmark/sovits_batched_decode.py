@@ -0,0 +1,124 @@
+"""SoVITS 并行合成基准：对比整批拼成一条序列再切开（method 2）与补齐批次逐句掩码（method 1）的合成耗时"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+from module.models import SynthesizerTrn
+from process_ckpt import load_sovits_new
+
+
+def load_vits(sovits_path: str, config_path: str, device: str, is_half: bool) -> SynthesizerTrn:
+    """有 SoVITS 权重时加载权重（v1/v2），否则按配置随机初始化（只测速度）"""
+    if sovits_path:
+        dict_s2 = load_sovits_new(sovits_path)
+        hps = dict_s2["config"]
+        weight = dict_s2["weight"]
+        hps["model"]["version"] = "v1" if weight["enc_p.text_embedding.weight"].shape[0] == 322 else "v2"
+    else:
+        with open(config_path, "r", encoding="utf-8") as f:
+            hps = json.load(f)
+        hps["model"]["version"] = "v2"
+        weight = None
+    hps["model"]["semantic_frame_rate"] = "25hz"
+    model = SynthesizerTrn(
+        hps["data"]["filter_length"] // 2 + 1,
+        hps["train"]["segment_size"] // hps["data"]["hop_length"],
+        n_speakers=hps["data"]["n_speakers"],
+        **hps["model"],
+    )
+    if weight is not None:
+        model.load_state_dict(weight, strict=False)
+    model = model.to(device).eval()
+    return model.half() if is_half else model
+
+
+def make_inputs(model: SynthesizerTrn, bsz: int, tokens: int, device: str, dtype: torch.dtype):
+    """每句 tokens/2 ~ tokens 个语义 token，音素数约为 token 数的一半，参考音频 3 秒"""
+    generator = torch.Generator().manual_seed(0)
+    codes_lengths = torch.randint(max(tokens // 2, 1), tokens + 1, (bsz,), generator=generator)
+    codes = [torch.randint(0, 1024, (int(n),), generator=generator).to(device) for n in codes_lengths]
+    n_symbols = model.enc_p.text_embedding.num_embeddings
+    phones = [
+        torch.randint(0, n_symbols, (max(int(n) // 2, 1),), generator=generator).to(device) for n in codes_lengths
+    ]
+    refer = torch.randn(1, model.spec_channels, 150, generator=generator).to(device=device, dtype=dtype)
+    return codes, phones, [refer]
+
+
+def concat_decode(model: SynthesizerTrn, codes, phones, refer) -> list:
+    upsample_rate = math.prod(model.upsample_rates)
+    ends = [0]
+    for item in codes:
+        ends.append(ends[-1] + item.shape[0] * 2 * upsample_rate)
+    audio = model.decode(torch.cat(codes)[None, None], torch.cat(phones)[None], refer)[0, 0]
+    return [audio[ends[i] : ends[i + 1]] for i in range(len(codes))]
+
+
+def padded_decode(model: SynthesizerTrn, codes, phones, refer) -> list:
+    codes_lengths = torch.LongTensor([item.shape[0] for item in codes]).to(codes[0].device)
+    text_lengths = torch.LongTensor([item.shape[0] for item in phones]).to(phones[0].device)
+    padded_codes = torch.nn.utils.rnn.pad_sequence(codes, batch_first=True).unsqueeze(0)
+    padded_phones = torch.nn.utils.rnn.pad_sequence(phones, batch_first=True)
+    return model.batched_decode(padded_codes, codes_lengths, padded_phones, text_lengths, refer)
+
+
+def run_once(decode, model, inputs, args) -> tuple:
+    torch.manual_seed(args.seed)
+    start = time.perf_counter()
+    with torch.no_grad():
+        audios = decode(model, *inputs)
+    if "cuda" in args.device:
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, audios
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SoVITS 补齐批次合成与拼接合成的耗时对比")
+    parser.add_argument("--sovits", type=str, default="", help="SoVITS 权重路径（v1/v2），留空则随机初始化")
+    parser.add_argument("--config", type=str, default="GPT_SoVITS/configs/s2.json", help="随机初始化使用的模型配置")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--half", action="store_true", help="半精度")
+    parser.add_argument("--threads", type=int, default=0, help="CPU 线程数，0 为默认")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument(
+        "--tokens", type=int, nargs="+", default=[50, 150, 300], help="每句最多语义 token 数（约 25 个/秒）"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = load_vits(args.sovits, args.config, args.device, args.half)
+    dtype = torch.float16 if args.half else torch.float32
+    paths = {"concat": concat_decode, "padded": padded_decode}
+
+    print(f"device={args.device} half={args.half} threads={torch.get_num_threads()}")
+    print(f"{'tokens':>6} {'batch':>5} {'concat':>8} {'padded':>8} {'speedup':>8}")
+    for tokens in args.tokens:
+        for bsz in args.batch_sizes:
+            inputs = make_inputs(model, bsz, tokens, args.device, dtype)
+            seconds = {}
+            for name, decode in paths.items():
+                run_once(decode, model, inputs, args)  # warmup
+                seconds[name], audios = min(
+                    (run_once(decode, model, inputs, args) for _ in range(args.repeat)), key=lambda r: r[0]
+                )
+                assert [audio.shape[0] for audio in audios] == [
+                    item.shape[0] * 2 * math.prod(model.upsample_rates) for item in inputs[0]
+                ]
+            speedup = seconds["concat"] / seconds["padded"]
+            print(f"{tokens:>6} {bsz:>5} {seconds['concat']:>8.3f} {seconds['padded']:>8.3f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""流式合成首包延迟基准：对比按句返回与句内 token 流式返回的首段音频耗时随句长的变化"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config
+
+# 默认合成文本，按需要的长度重复截取
+DEFAULT_TEXT = "今天天气很好，我们一起去公园散步，看看湖边的柳树和刚刚开放的花朵，顺便在长椅上晒晒太阳"
+
+
+def measure(tts: TTS, inputs: dict) -> tuple:
+    """返回 (首段音频耗时, 总耗时, 音频时长)"""
+    start = time.perf_counter()
+    first = None
+    samples = 0
+    sr = 0
+    for sr, chunk in tts.run(inputs):
+        if first is None:
+            first = time.perf_counter() - start
+        samples += chunk.shape[0]
+    return first, time.perf_counter() - start, samples / max(sr, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="流式合成首包延迟基准")
+    parser.add_argument("-c", "--config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="配置文件路径")
+    parser.add_argument("--ref", type=str, required=True, help="参考音频路径")
+    parser.add_argument("--prompt_text", type=str, required=True, help="参考文本")
+    parser.add_argument("--prompt_lang", type=str, default="zh")
+    parser.add_argument("--text", type=str, default=DEFAULT_TEXT, help="合成文本，按长度重复截取")
+    parser.add_argument("--text_lang", type=str, default="zh")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[20, 50, 100, 200], help="句长（字数）")
+    parser.add_argument("--chunk_tokens", type=int, default=24, help="句内流式每块 token 数")
+    parser.add_argument("--overlap_tokens", type=int, default=4)
+    parser.add_argument("--context_tokens", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tts = TTS(TTS_Config(args.config))
+    base = {
+        "ref_audio_path": args.ref,
+        "prompt_text": args.prompt_text,
+        "prompt_lang": args.prompt_lang,
+        "text_lang": args.text_lang,
+        "text_split_method": "cut0",  # 不切分，整段作为一句，突出句内流式的差异
+        "return_fragment": True,
+        "top_k": 5,
+        "seed": 1234,
+        "stream_overlap_tokens": args.overlap_tokens,
+        "stream_context_tokens": args.context_tokens,
+    }
+    modes = {"sentence": 0, f"tokens/{args.chunk_tokens}": args.chunk_tokens}
+
+    # 预热，参考音频特征进入缓存
+    measure(tts, dict(base, text=args.text[:10], stream_chunk_tokens=0))
+
+    print(f"{'chars':>6} {'mode':>10} {'first(s)':>9} {'total(s)':>9} {'audio(s)':>9}")
+    for length in args.lengths:
+        text = (args.text * (length // len(args.text) + 1))[:length]
+        for name, chunk_tokens in modes.items():
+            results = [
+                measure(tts, dict(base, text=text, stream_chunk_tokens=chunk_tokens)) for _ in range(args.repeat)
+            ]
+            first = min(r[0] for r in results)
+            total = min(r[1] for r in results)
+            print(f"{length:>6} {name:>10} {first:>9.3f} {total:>9.3f} {results[0][2]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
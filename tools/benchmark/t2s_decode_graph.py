@@ -0,0 +1,98 @@
+"""T2S 解码图基准：对比预分配缓存的逐步解码与捕获/编译后的单步解码的每 token 延迟（默认 CPU）"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+from AR.models.t2s_decode_graph import T2SDecodeGraph
+from tools.benchmark.t2s_kv_cache import load_decoder, make_inputs
+
+
+def run_once(model, inputs, args) -> tuple:
+    x, x_lens, prompts, bert = inputs
+    torch.manual_seed(args.seed)
+    start = time.perf_counter()
+    with torch.no_grad():
+        y_list, idx_list = model.infer_panel_batch_infer_static(
+            x,
+            x_lens,
+            prompts,
+            bert,
+            top_k=args.top_k,
+            top_p=1,
+            temperature=1,
+            early_stop_num=args.steps,
+            max_len=int(x_lens.max()),
+            repetition_penalty=1.35,
+        )
+    if "cuda" in args.device:
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+    # 每一步解码整个批次，延迟按最长的句子计算
+    steps = max(idx_list) + 1
+    return seconds, steps, y_list
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="T2S 解码图每 token 延迟基准")
+    parser.add_argument("--gpt", type=str, default="", help="GPT 权重路径，留空则随机初始化")
+    parser.add_argument(
+        "--config", type=str, default="GPT_SoVITS/configs/s1longer-v2.yaml", help="随机初始化使用的模型配置"
+    )
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--half", action="store_true", help="半精度")
+    parser.add_argument("--threads", type=int, default=0, help="CPU 线程数，0 为默认")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--capacity", type=int, default=1024, help="解码图的缓存长度")
+    parser.add_argument(
+        "--compile_cpu", action="store_true", help="CPU 上也用 torch.compile 编译单步解码（默认不编译）"
+    )
+    parser.add_argument("--text_len", type=int, default=60, help="每句最大音素数")
+    parser.add_argument("--prompt_len", type=int, default=150, help="参考音频语义 token 数")
+    parser.add_argument("--steps", type=int, default=200, help="每句最多生成的 token 数")
+    parser.add_argument("--top_k", type=int, default=1, help="为 1 时两条路径结果应完全一致")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = load_decoder(args.gpt, args.config, args.device, args.half)
+    dtype = torch.float16 if args.half else torch.float32
+    graph = T2SDecodeGraph(model, args.batch_sizes, args.capacity, args.compile_cpu)
+
+    print(
+        f"device={args.device} half={args.half} threads={torch.get_num_threads()} steps<={args.steps}"
+        f" capacity={args.capacity} compile_cpu={args.compile_cpu}"
+    )
+    print(f"{'batch':>5} {'path':>6} {'steps':>6} {'seconds':>8} {'ms/token':>9}")
+    for bsz in args.batch_sizes:
+        inputs = make_inputs(model, bsz, args.text_len, args.prompt_len, args.device, dtype)
+        results = {}
+        for name, decode_graph in [("eager", None), ("graph", graph)]:
+            model.decode_graph = decode_graph
+            run_once(model, inputs, args)  # warmup，解码图在这里捕获/编译
+            best = None
+            for _ in range(args.repeat):
+                seconds, steps, y_list = run_once(model, inputs, args)
+                if best is None or seconds < best[0]:
+                    best = (seconds, steps, y_list)
+            results[name] = best
+            print(f"{bsz:>5} {name:>6} {best[1]:>6} {best[0]:>8.3f} {best[0] * 1000 / best[1]:>9.2f}")
+        if graph.eager:
+            print(f"{bsz:>5} capture failed, the graph path ran eagerly")
+        if args.top_k == 1:
+            same = all(torch.equal(a, b) for a, b in zip(results["eager"][2], results["graph"][2]))
+            print(f"{bsz:>5} outputs identical: {same}")
+        print(f"{bsz:>5} speedup: {results['eager'][0] / results['graph'][0]:.2f}x")
+    model.decode_graph = None
+
+
+if __name__ == "__main__":
+    main()
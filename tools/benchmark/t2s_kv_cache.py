@@ -0,0 +1,111 @@
+"""T2S 解码 KV 缓存基准：对比逐 token 拼接缓存与预分配缓存的解码速度（tokens/s）"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+import yaml
+from AR.models.t2s_model import Text2SemanticDecoder
+
+
+def load_decoder(gpt_path: str, config_path: str, device: str, is_half: bool) -> Text2SemanticDecoder:
+    """有 GPT 权重时加载权重，否则按配置随机初始化（只测速度）"""
+    if gpt_path:
+        dict_s1 = torch.load(gpt_path, map_location="cpu", weights_only=False)
+        model = Text2SemanticDecoder(dict_s1["config"])
+        model.load_state_dict({k.replace("model.", "", 1): v for k, v in dict_s1["weight"].items()})
+    else:
+        with open(config_path, "r", encoding="utf-8") as f:
+            model = Text2SemanticDecoder(yaml.safe_load(f))
+    model = model.to(device).eval()
+    return model.half() if is_half else model
+
+
+def make_inputs(model: Text2SemanticDecoder, bsz: int, text_len: int, prompt_len: int, device: str, dtype: torch.dtype):
+    generator = torch.Generator().manual_seed(0)
+    x_lens = torch.randint(max(text_len // 2, 1), text_len + 1, (bsz,), generator=generator)
+    x = [torch.randint(0, model.phoneme_vocab_size, (int(n),), generator=generator).to(device) for n in x_lens]
+    bert = [torch.randn(1024, int(n), generator=generator).to(device=device, dtype=dtype) for n in x_lens]
+    prompt = torch.randint(0, model.EOS, (1, prompt_len), generator=generator).to(device)
+    return x, x_lens.to(device), prompt.expand(bsz, -1), bert
+
+
+def run_once(infer_panel, inputs, args) -> tuple:
+    x, x_lens, prompts, bert = inputs
+    torch.manual_seed(args.seed)
+    start = time.perf_counter()
+    with torch.no_grad():
+        y_list, idx_list = infer_panel(
+            x,
+            x_lens,
+            prompts,
+            bert,
+            top_k=args.top_k,
+            top_p=1,
+            temperature=1,
+            early_stop_num=args.steps,
+            max_len=int(x_lens.max()),
+            repetition_penalty=1.35,
+        )
+    if "cuda" in args.device:
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - start
+    tokens = sum(idx + 1 for idx in idx_list)
+    return seconds, tokens, y_list
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="T2S KV 缓存解码基准")
+    parser.add_argument("--gpt", type=str, default="", help="GPT 权重路径，留空则随机初始化")
+    parser.add_argument(
+        "--config", type=str, default="GPT_SoVITS/configs/s1longer-v2.yaml", help="随机初始化使用的模型配置"
+    )
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--half", action="store_true", help="半精度")
+    parser.add_argument("--threads", type=int, default=0, help="CPU 线程数，0 为默认")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--text_len", type=int, default=60, help="每句最大音素数")
+    parser.add_argument("--prompt_len", type=int, default=150, help="参考音频语义 token 数")
+    parser.add_argument("--steps", type=int, default=300, help="每句最多生成的 token 数")
+    parser.add_argument("--top_k", type=int, default=1, help="为 1 时两条路径结果应完全一致")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    model = load_decoder(args.gpt, args.config, args.device, args.half)
+    dtype = torch.float16 if args.half else torch.float32
+    paths = {
+        "concat": model.infer_panel_batch_infer,
+        "static": model.infer_panel_batch_infer_static,
+    }
+
+    print(f"device={args.device} half={args.half} threads={torch.get_num_threads()} steps<={args.steps}")
+    print(f"{'batch':>5} {'path':>7} {'tokens':>7} {'seconds':>8} {'tokens/s':>9}")
+    for bsz in args.batch_sizes:
+        inputs = make_inputs(model, bsz, args.text_len, args.prompt_len, args.device, dtype)
+        results = {}
+        for name, infer_panel in paths.items():
+            run_once(infer_panel, inputs, args)  # warmup
+            best = None
+            for _ in range(args.repeat):
+                seconds, tokens, y_list = run_once(infer_panel, inputs, args)
+                if best is None or seconds < best[0]:
+                    best = (seconds, tokens, y_list)
+            results[name] = best
+            print(f"{bsz:>5} {name:>7} {best[1]:>7} {best[0]:>8.3f} {best[1] / best[0]:>9.1f}")
+        if args.top_k == 1:
+            same = all(torch.equal(a, b) for a, b in zip(results["concat"][2], results["static"][2]))
+            print(f"{bsz:>5} outputs identical: {same}")
+        print(f"{bsz:>5} speedup: {results['concat'][0] / results['static'][0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
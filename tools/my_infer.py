@@ -6,6 +6,8 @@ sys.path.append(now_dir)
 sys.path.append("%s/GPT_SoVITS" % (now_dir))
 
 import subprocess
+import threading
+import wave
 import numpy as np
 import soundfile as sf
 import torch
@@ -13,8 +15,10 @@ import gc
 from gsvi_server.openai_like_model import otherParams
 from tools.logger import logger
 from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config
+from GPT_SoVITS.TTS_infer_pack.cpu_precision import parse_cpu_precision
 from glob import glob
 from pathlib import Path
+from contextlib import contextmanager
 from re import split
 from io import BytesIO
 from random import choice, randint
@@ -23,9 +27,13 @@ from time import time
 from datetime import datetime
 from pydub import AudioSegment
 from shutil import move, rmtree
-from config import is_half, infer_device, force_half_infer, force_gpu_infer
+from config import is_half, infer_device, force_half_infer, force_gpu_infer, model_pool_size, model_pool_max_mem, prompt_cache_size, prompt_cache_dir, text_cache_size, text_cache_dir, text_cache_max_mb, g2pw_num_threads, en_oov_cache_size, precompute_on_install, t2s_continuous_batching, t2s_max_batch_size, t2s_static_kv_cache, t2s_prefix_cache_size, t2s_eos_sync_every, t2s_decode_graph, t2s_graph_batch_sizes, t2s_graph_capacity, t2s_budget_factor, t2s_loop_window, sovits_padded_decode, cfm_solver, cfm_sway, cfm_adaptive_tol, vocoder_window_frames, cpu_precision, stream_chunk_tokens
 from GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method
 
+# chinese2 / english 在首次推理时才导入，从环境变量读取 g2pW 的线程数与英文未登录词缓存大小
+os.environ["g2pw_num_threads"] = str(g2pw_num_threads)
+os.environ["en_oov_cache_size"] = str(en_oov_cache_size)
+
 #===============推理预备================
 def create_weight_dirs():
     gpt_dirs = ["GPT_weights", "GPT_weights_v2", "GPT_weights_v3", "GPT_weights_v4", "GPT_weights_v2Pro", "GPT_weights_v2ProPlus"]
@@ -60,6 +68,30 @@ def pre_infer(config_path: str, ref_audio_path: str) -> None:
         tts_config.device = infer_device
         tts_config.is_half = is_half
 
+    tts_config.model_pool_size = model_pool_size
+    tts_config.model_pool_max_mem = model_pool_max_mem
+    tts_config.prompt_cache_size = prompt_cache_size
+    tts_config.prompt_cache_dir = prompt_cache_dir
+    tts_config.text_cache_size = text_cache_size
+    tts_config.text_cache_dir = text_cache_dir
+    tts_config.text_cache_max_mb = text_cache_max_mb
+    tts_config.t2s_continuous_batching = t2s_continuous_batching
+    tts_config.t2s_max_batch_size = t2s_max_batch_size
+    tts_config.t2s_static_kv_cache = t2s_static_kv_cache
+    tts_config.t2s_prefix_cache_size = t2s_prefix_cache_size
+    tts_config.t2s_eos_sync_every = t2s_eos_sync_every
+    tts_config.t2s_decode_graph = t2s_decode_graph
+    tts_config.t2s_graph_batch_sizes = t2s_graph_batch_sizes
+    tts_config.t2s_graph_capacity = t2s_graph_capacity
+    tts_config.t2s_budget_factor = t2s_budget_factor
+    tts_config.t2s_loop_window = t2s_loop_window
+    tts_config.sovits_padded_decode = sovits_padded_decode
+    tts_config.cfm_solver = cfm_solver
+    tts_config.cfm_sway = cfm_sway
+    tts_config.cfm_adaptive_tol = cfm_adaptive_tol
+    tts_config.vocoder_window_frames = vocoder_window_frames
+    tts_config.cpu_precision = parse_cpu_precision(cpu_precision)
+
     Path(ref_audio_path).mkdir(parents=True, exist_ok=True)
     Path("outputs").mkdir(parents=True, exist_ok=True)
     Path("cache").mkdir(parents=True, exist_ok=True)
@@ -68,11 +100,58 @@ def pre_infer(config_path: str, ref_audio_path: str) -> None:
     
     
 def load_weights(gpt, sovits):
+    # 已常驻在模型池中的权重会直接切换，不会重新读盘
     if gpt != "":
         tts_pipeline.init_t2s_weights(gpt)
     if sovits != "":
         tts_pipeline.init_vits_weights(sovits)
 
+class WeightsGate:
+    """
+    推理权重闸门：使用当前已加载权重的请求可以并发推理（T2S 由连续批处理调度器合并），
+    需要切换权重的请求等待正在进行的请求全部结束后再切换，切换期间不放行新请求
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._weights = None
+        self._active = 0
+        self._loading = False
+        self._waiting = []
+
+    @contextmanager
+    def use(self, gpt, sovits):
+        weights = (gpt, sovits)
+        with self._cond:
+            self._waiting.append(weights)
+            # 有其他权重在排队时，同权重的新请求也要让路，避免切换请求被饿死
+            while self._loading or (self._active > 0 and (weights != self._weights or any(w != self._weights for w in self._waiting))):
+                self._cond.wait()
+            self._waiting.remove(weights)
+            switching = weights != self._weights
+            if switching:
+                self._weights = weights
+                self._loading = True
+            self._active += 1
+        try:
+            if switching:
+                try:
+                    load_weights(gpt, sovits)
+                except Exception:
+                    with self._cond:
+                        self._weights = None
+                    raise
+                finally:
+                    with self._cond:
+                        self._loading = False
+                        self._cond.notify_all()
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+weights_gate = WeightsGate()
+
     
 #===============推理函数================
 def pack_ogg(io_buffer:BytesIO, data:np.ndarray, rate:int):
@@ -139,6 +218,12 @@ def pack_mp3(io_buffer:BytesIO, data:np.ndarray, rate:int):
     io_buffer.write(out)
     return io_buffer
 
+def pack_opus(io_buffer:BytesIO, data:np.ndarray, rate:int):
+    encoder = StreamEncoder("opus")
+    io_buffer.write(encoder.feed(data, rate))
+    io_buffer.write(encoder.close())
+    return io_buffer
+
 def pack_audio(io_buffer:BytesIO, data:np.ndarray, rate:int, media_type:str):
     if media_type == "ogg":
         io_buffer = pack_ogg(io_buffer, data, rate)
@@ -148,14 +233,111 @@ def pack_audio(io_buffer:BytesIO, data:np.ndarray, rate:int, media_type:str):
         io_buffer = pack_wav(io_buffer, data, rate)
     elif media_type == "mp3":
         io_buffer = pack_mp3(io_buffer, data, rate)
+    elif media_type == "opus":
+        io_buffer = pack_opus(io_buffer, data, rate)
     else:
         io_buffer = pack_raw(io_buffer, data, rate)
     io_buffer.seek(0)
     return io_buffer
 
-def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr):
-    t_lang = ["all_zh","en","all_ja","all_yue","all_ko","zh","ja","yue","ko","auto","auto_yue"][["中文","英语","日语","粤语","韩语","中英混合","日英混合","粤英混合","韩英混合","多语种混合","多语种混合(粤语)"].index(text_lang)]
-    p_lang = ["all_zh","en","all_ja","all_yue","all_ko","zh","ja","yue","ko","auto","auto_yue"][["中文","英语","日语","粤语","韩语","中英混合","日英混合","粤英混合","韩英混合","多语种混合","多语种混合(粤语)"].index(prompt_lang)]
+# 媒体类型 -> HTTP Content-Type
+MEDIA_TYPES = {"wav": "audio/wav", "raw": "audio/pcm", "pcm": "audio/pcm", "ogg": "audio/ogg", "opus": "audio/ogg", "mp3": "audio/mpeg", "aac": "audio/aac"}
+
+# 流式编码的 ffmpeg 编码参数
+FFMPEG_STREAM_ARGS = {
+    "ogg": ['-c:a', 'libvorbis', '-b:a', '192k', '-f', 'ogg'],
+    "opus": ['-c:a', 'libopus', '-b:a', '96k', '-f', 'ogg'],
+    "mp3": ['-c:a', 'libmp3lame', '-b:a', '192k', '-f', 'mp3'],
+    "aac": ['-c:a', 'aac', '-b:a', '192k', '-f', 'adts'],
+}
+
+def wave_header_chunk(frame_input=b"", channels=1, sample_width=2, sample_rate=32000):
+    # 流式 wav 只在第一块写入文件头，后续块都是裸 PCM
+    wav_buf = BytesIO()
+    with wave.open(wav_buf, "wb") as vfout:
+        vfout.setnchannels(channels)
+        vfout.setsampwidth(sample_width)
+        vfout.setframerate(sample_rate)
+        vfout.writeframes(frame_input)
+    wav_buf.seek(0)
+    return wav_buf.read()
+
+class StreamEncoder:
+    """
+    单个响应的流式编码器：wav 先返回文件头再返回 PCM，raw/pcm 直接返回 PCM，
+    ogg/opus/mp3/aac 在整个响应期间复用同一个 ffmpeg 进程，每段音频写入后立即取走已编码的数据
+    """
+    def __init__(self, media_type: str):
+        self.media_type = media_type
+        self.rate = None
+        self._process = None
+        self._reader = None
+        self._chunks = []
+        self._lock = threading.Lock()
+
+    def feed(self, data: np.ndarray, rate: int) -> bytes:
+        if self.rate is None:
+            self.rate = rate
+            if self.media_type in FFMPEG_STREAM_ARGS:
+                self._start()
+            elif self.media_type == "wav":
+                return wave_header_chunk(sample_rate=rate) + data.tobytes()
+        if self._process is None:
+            return data.tobytes()
+        self._process.stdin.write(data.tobytes())
+        self._process.stdin.flush()
+        return self._take()
+
+    def close(self) -> bytes:
+        """ 结束编码，返回剩余的数据 """
+        if self._process is None:
+            return b""
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        self._reader.join()
+        self._process.wait()
+        self._process = None
+        return self._take()
+
+    def _start(self) -> None:
+        self._process = subprocess.Popen([
+            'ffmpeg',
+            '-f', 's16le',  # 输入16位有符号小端整数PCM
+            '-ar', str(self.rate),  # 设置采样率
+            '-ac', '1',  # 单声道
+            '-i', 'pipe:0',  # 从管道读取输入
+            *FFMPEG_STREAM_ARGS[self.media_type],
+            '-vn',  # 不包含视频
+            '-flush_packets', '1',  # 每个包编码后立即写出
+            'pipe:1'  # 将输出写入管道
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        # 单独的线程读取输出，避免管道写满后 ffmpeg 与写入方互相阻塞
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self) -> None:
+        stdout = self._process.stdout
+        while True:
+            chunk = stdout.read(65536)
+            if not chunk:
+                break
+            with self._lock:
+                self._chunks.append(chunk)
+
+    def _take(self) -> bytes:
+        with self._lock:
+            data = b"".join(self._chunks)
+            self._chunks = []
+        return data
+
+# 语言名称 -> 推理语言代码
+LANG_CODES = dict(zip(["中文","英语","日语","粤语","韩语","中英混合","日英混合","粤英混合","韩英混合","多语种混合","多语种混合(粤语)"], ["all_zh","en","all_ja","all_yue","all_ko","zh","ja","yue","ko","auto","auto_yue"]))
+
+def make_infer_dict(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, parallel_infer, repetition_penalty, sample_steps, if_sr):
+    t_lang = LANG_CODES[text_lang]
+    p_lang = LANG_CODES[prompt_lang]
     cut_method = ["cut0","cut1","cut2","cut3","cut4","cut5"][["不切","凑四句一切","凑50字一切","按中文句号。切","按英文句号.切","按标点符号切"].index(text_split_method)]
     infer_dict = {
         "text": text,
@@ -178,6 +360,10 @@ def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k,
         "sample_steps": sample_steps,
         "if_sr": if_sr
     }
+    return infer_dict
+
+def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr):
+    infer_dict = make_infer_dict(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, parallel_infer, repetition_penalty, sample_steps, if_sr)
     with torch.no_grad():
         tts_gen = tts_pipeline.run(infer_dict)
         sr, audio = next(tts_gen)
@@ -187,6 +373,36 @@ def tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k,
     
     return audio
 
+def tts_infer_stream(weights, text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr):
+    """
+    流式推理：每合成完一段（按切分方法切出的句子）就编码并返回，首段音频无需等待全文合成完毕
+    weights 为 use_model()/weights_gate.use() 返回的上下文，整个响应期间持有
+    """
+    infer_dict = make_infer_dict(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, parallel_infer, repetition_penalty, sample_steps, if_sr)
+    infer_dict["return_fragment"] = True
+    infer_dict["stream_chunk_tokens"] = stream_chunk_tokens
+    encoder = StreamEncoder(media_type)
+    try:
+        with weights, torch.no_grad():
+            for sr, audio in tts_pipeline.run(infer_dict):
+                chunk = encoder.feed(audio, sr)
+                if chunk:
+                    yield chunk
+        chunk = encoder.close()
+        if chunk:
+            yield chunk
+    finally:
+        encoder.close()
+
+# 推理管线的统计信息
+def get_pipeline_stats() -> dict:
+    return {
+        "t2s_scheduler": tts_pipeline.t2s_scheduler.stats() if tts_pipeline.t2s_scheduler is not None else None,
+        "prompt_cache": tts_pipeline.prompt_feature_cache.stats(),
+        "text_cache": tts_pipeline.text_cache.stats(),
+        "model_pool": tts_pipeline.model_pool.stats(),
+    }
+
 #===============音频处理================
 def audio_md5(audio):
     audio_md5 = md5(audio).hexdigest()
@@ -271,6 +487,36 @@ def load_model(model_name, version):
     load_weights(gpt_model, sovits_model)
     return gpt_model, sovits_model
 
+#在权重闸门内使用模型
+def use_model(model_name, version):
+    gpt_model, sovits_model = get_model_path(model_name, version)
+    return weights_gate.use(gpt_model, sovits_model)
+
+#预计算说话人所有参考音频的特征
+def precompute_model(model_name, version):
+    """ 为说话人的情感/随机参考音频预计算特征，写入参考音频旁的 .features.npz，返回 (成功数, 失败数) """
+    with use_model(model_name, version):
+        done, failed = 0, 0
+        for lang in get_ref_audio_langs(model_name, version):
+            if lang not in LANG_CODES:
+                logger.warning(f"未知的参考音频语言 {lang}，跳过预计算")
+                continue
+            refs = []
+            for audio in glob(f"models/{version}/{model_name}/reference_audios/{lang}/emotions/*.wav"):
+                emotion, emo_text = get_tag_text(Path(audio).name.replace(".wav", ""))
+                refs.append((audio, emo_text))
+            for audio in glob(f"models/{version}/{model_name}/reference_audios/{lang}/randoms/*.wav"):
+                refs.append((audio, Path(audio).name.replace(".wav", "")))
+            for audio, prompt_text in refs:
+                try:
+                    tts_pipeline.precompute_ref_features(audio, prompt_text, LANG_CODES[lang])
+                    done += 1
+                except Exception as e:
+                    logger.warning(f"预计算参考音频特征失败 {audio}: {e}")
+                    failed += 1
+        logger.info(f"说话人 {model_name} 参考音频特征预计算完成：成功 {done} 条，失败 {failed} 条")
+        return done, failed
+
 #移动模型
 def move_model_files(version, categroy, lang, model):
     model_files = glob(f"cache/{categroy}-{lang}-{model}/**/*", recursive=True)
@@ -335,7 +581,7 @@ def create_speaker_list(version: str) -> tuple[dict[str, dict[str, list[str]]],
     return spk_list, msg
     
 # 根据说话人和情感合成语音（单人合成）
-def single_infer(modelname, prompt_lang, emotion, text, text_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, media_type, parallel_infer, repetition_penalty, seed, sample_steps, if_sr, version):
+def single_infer(modelname, prompt_lang, emotion, text, text_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, media_type, parallel_infer, repetition_penalty, seed, sample_steps, if_sr, version, stream=False):
     if not version_support(version):
         msg = "不支持该版本！或没选择版本！"
         audio_path = ""
@@ -357,10 +603,13 @@ def single_infer(modelname, prompt_lang, emotion, text, text_lang, top_k, top_p,
             msg = "请提供合成文本"
             audio_path = ""
         else:
-            load_model(modelname, version)
             if seed == -1:
                 seed = random_seed()
-            audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
+            if stream:
+                # 流式合成：返回音频字节的生成器，由调用方边合成边发送
+                return tts_infer_stream(use_model(modelname, version), text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr), "合成成功"
+            with use_model(modelname, version):
+                audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
             audio_md5 = md5(audio).hexdigest()
             audio_path = f"outputs/{audio_md5}.{media_type}"
             Path(audio_path).write_bytes(audio)
@@ -397,10 +646,10 @@ def multi_infer(content, top_k, top_p, temperature, text_split_method, batch_siz
                 log_list.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] 第 {i+1} 段对话格式错误或参数有误，已跳过！")
                 continue
             log_list.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] 正在合成第 {i+1} 段对话，模型：{model_name}，版本：{model_version}，情感：{emotion}")
-            load_model(model_name, model_version)
             if seed == -1:
                 seed = random_seed()
-            audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
+            with use_model(model_name, model_version):
+                audio = tts_infer(text, text_lang, ref_audio, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
             Path(f"outputs/conv_{content_md5}/{i+1}_{model_name}_{model_version}.{media_type}").write_bytes(audio)
             Path(f"outputs/conv_{content_md5}/{i+1}_{model_name}_{model_version}.txt").write_text(text, encoding="utf-8")
             log_list.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] 第 {i+1} 段对话合成成功！")
@@ -459,7 +708,7 @@ def get_classic_model_list(version):
     return gpt_model_list, sovits_model_list, msg, gpt_model_path_index, sovits_model_path_index
 
 # 推理函数
-def classic_infer(gpt_model_name, sovits_model_name, ref_audio_path, prompt_text, prompt_lang, text, text_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, version):
+def classic_infer(gpt_model_name, sovits_model_name, ref_audio_path, prompt_text, prompt_lang, text, text_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr, version, stream=False):
     audio_path = ""
     if not version_support(version):
         msg = "不支持该版本！或没选择版本！"
@@ -483,9 +732,11 @@ def classic_infer(gpt_model_name, sovits_model_name, ref_audio_path, prompt_text
             msg = "请提供合成文本"
         elif not Path(gpt_model).exists() or not Path(sovits_model).exists():
             msg = "模型不存在"
+        elif stream:
+            return tts_infer_stream(weights_gate.use(gpt_model, sovits_model), text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr), "合成成功"
         else:
-            load_weights(gpt_model, sovits_model)
-            audio = tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
+            with weights_gate.use(gpt_model, sovits_model):
+                audio = tts_infer(text, text_lang, ref_audio_path, prompt_text, prompt_lang, top_k, top_p, temperature, text_split_method, batch_size, batch_threshold, split_bucket, speed_facter, fragment_interval, seed, media_type, parallel_infer, repetition_penalty, sample_steps, if_sr)
             audio_md5 = md5(audio).hexdigest()
             audio_path = f"outputs/{audio_md5}.{media_type}"
             Path(audio_path).write_bytes(audio)
@@ -514,33 +765,58 @@ def openai_like_infer(model, input, voice, response_format, speed, other_options
         else:
             emo, prompt_text = get_ref_audio(voice, other_options.prompt_lang, other_options.emotion, version)
             ref_audio = f"models/{version}/{voice}/reference_audios/{other_options.prompt_lang}/emotions/【{emo}】{prompt_text}.wav"
-        load_model(voice, version)
         if other_options.seed == -1:
             seed = random_seed()
         else:
             seed = other_options.seed
             
-        audio_data = tts_infer(
-            input, 
-            other_options.text_lang, 
-            ref_audio, prompt_text, 
-            other_options.prompt_lang, 
-            other_options.top_k, 
-            other_options.top_p, 
-            other_options.temperature, 
-            other_options.text_split_method, 
-            other_options.batch_size, 
-            other_options.batch_threshold, 
-            other_options.split_bucket, 
-            speed, 
-            other_options.fragment_interval, 
-            seed, 
-            response_format, 
-            other_options.parallel_infer, 
-            other_options.repetition_penalty, 
-            other_options.sample_steps, 
-            other_options.if_sr
-            )
+        if other_options.stream:
+            # 流式合成：audio_data 为音频字节的生成器
+            audio_data = tts_infer_stream(
+                use_model(voice, version),
+                input, 
+                other_options.text_lang, 
+                ref_audio, prompt_text, 
+                other_options.prompt_lang, 
+                other_options.top_k, 
+                other_options.top_p, 
+                other_options.temperature, 
+                other_options.text_split_method, 
+                other_options.batch_size, 
+                other_options.batch_threshold, 
+                other_options.split_bucket, 
+                speed, 
+                other_options.fragment_interval, 
+                seed, 
+                response_format, 
+                other_options.parallel_infer, 
+                other_options.repetition_penalty, 
+                other_options.sample_steps, 
+                other_options.if_sr
+                )
+            return audio_data, "合成成功"
+        with use_model(voice, version):
+            audio_data = tts_infer(
+                input, 
+                other_options.text_lang, 
+                ref_audio, prompt_text, 
+                other_options.prompt_lang, 
+                other_options.top_k, 
+                other_options.top_p, 
+                other_options.temperature, 
+                other_options.text_split_method, 
+                other_options.batch_size, 
+                other_options.batch_threshold, 
+                other_options.split_bucket, 
+                speed, 
+                other_options.fragment_interval, 
+                seed, 
+                response_format, 
+                other_options.parallel_infer, 
+                other_options.repetition_penalty, 
+                other_options.sample_steps, 
+                other_options.if_sr
+                )
         msg = "合成成功"
     return audio_data, msg
             
@@ -603,6 +879,12 @@ def install_model(version, categroy, lang, model_name, model_url):
             rmtree(f"cache/{categroy}-{lang}-{model_name}")
             Path(f"cache/{categroy}-{lang}-{model_name}.zip").unlink()
             if check_model_installed(version, categroy, lang, model_name):
+                if precompute_on_install:
+                    print(f"------------------------模型 {categroy}-{lang}-{model_name} 预计算参考音频特征------------------------")
+                    try:
+                        precompute_model(f"{categroy}-{lang}-{model_name}", version)
+                    except Exception as e:
+                        logger.warning(f"模型 {categroy}-{lang}-{model_name} 参考音频特征预计算失败，将在推理时计算: {e}")
                 print(f"------------------------模型 {categroy}-{lang}-{model_name} 安装完成------------------------")
                 msg = f"模型 {categroy}-{lang}-{model_name} 安装完成！可在 models/{version} 目录下查看！"
             else: